@@ -0,0 +1,106 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare finding the records of one request in a log archive of ArchiveHandler with the indexes, and without them.
+
+The archive holds records of many requests (a request_id added like by ThreadContextLogger), a part of which are
+tagged timing. The query selects the timing records of one request, as in:
+
+    python -m ondewo.logging.archive /var/log/ondewo --tag timing --context request_id=42
+
+Without the indexes every record is decoded and matched, as a scan of JSON lines or grep would read every line. Run
+from the root of the repository with:
+
+    python -m benchmarks.bench_archive [--records 200000] [--requests 1000]
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+)
+
+from ondewo.logging.archive import (
+    ArchiveHandler,
+    Query,
+    Segment,
+    segment_paths,
+)
+
+
+def write_archive(directory: str, records: int, requests: int, seed: int = 0) -> None:
+    generator: random.Random = random.Random(seed)
+    handler: ArchiveHandler = ArchiveHandler(
+        f"{directory}/service.olog", index_keys=["request_id"], max_bytes=16 << 20, max_total_bytes=None,
+    )
+    for i in range(records):
+        timing: bool = generator.random() < 0.2
+        handler.handle(logging.makeLogRecord({
+            "msg": {
+                "message": f"{'Timing' if timing else 'Handled'} step {i} of the request",
+                "tags": ["timing"] if timing else ["console"],
+                "duration": generator.random(),
+                "request_id": f"request-{generator.randrange(requests)}",
+            },
+            "created": 1700000000.0 + i * 0.001,
+            "levelno": logging.INFO,
+            "levelname": "INFO",
+            "name": "ondewo.service",
+        }))
+    handler.close()
+
+
+def run(paths: List[str], criteria: Query, use_index: bool, use_mmap: bool) -> float:
+    start: float = time.perf_counter()
+    found: int = 0
+    for path in paths:
+        segment: Segment = Segment(path, use_mmap)
+        if not use_index:
+            segment.index = None
+        found += sum(1 for _ in segment.records(criteria))
+    assert found
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_archive(directory, args.records, args.requests)
+        paths: List[str] = segment_paths([directory])
+        criteria: Query = Query(tags=["timing"], context={"request_id": "request-42"})
+        candidates: Dict[str, Callable[[], Any]] = {
+            "scan": lambda: run(paths, criteria, False, False),
+            "scan, mmap": lambda: run(paths, criteria, False, True),
+            "index": lambda: run(paths, criteria, True, False),
+            "index, mmap": lambda: run(paths, criteria, True, True),
+        }
+        for name, candidate in candidates.items():
+            elapsed: float = min(candidate() for _ in range(args.repeat))
+            print(f"{name:>12}: {elapsed * 1e3:>9.2f} ms for {args.records:,} records (best of {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
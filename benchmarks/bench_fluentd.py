@@ -0,0 +1,138 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure the default logging config against a local fluentd stand-in.
+
+The ForwardReceiver runs in a child process (so it does not compete with the logging calls for the GIL) and the fluent
+handlers of the default logging.yaml are pointed to it. The benchmark reports the records/s until all records were
+sent, the lost or duplicated records and the latency of the logging calls. Latency, disconnects and back-pressure of fluentd can be
+injected. Run from the root of the repository with:
+
+    python -m benchmarks.bench_fluentd [--records 100000] [--latency 0.001] [--disconnect-every 1000]
+"""
+
+import argparse
+import logging
+import logging.config
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import Connection
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+import yaml
+
+import ondewo.logging.config
+from ondewo.logging.routing import RoutingHandler
+from ondewo.logging.testing import ForwardReceiver
+
+
+def receive(connection: Connection, latency: float, disconnect_every: int, pause: float) -> None:
+    """Run the receiver until the parent asks for the stats."""
+    with ForwardReceiver(keep_records=False, latency=latency, disconnect_every=disconnect_every) as receiver:
+        if pause:
+            receiver.pause()
+        connection.send(receiver.port)
+        if pause:
+            time.sleep(pause)
+            receiver.resume()
+        expected: int = connection.recv()
+        receiver.wait_for(expected, timeout=10.0)
+        connection.send(receiver.stats())
+
+
+def load_config(port: int) -> Dict[str, Any]:
+    """The default logging config with the fluent handlers sending to the local receiver."""
+    path: str = os.path.join(os.path.dirname(ondewo.logging.config.__file__), "logging.yaml")
+    with open(path) as fd:
+        config: Dict[str, Any] = yaml.safe_load(fd)["logging"]
+    for handler in config["handlers"].values():
+        if "Fluent" in handler.get("class", ""):
+            handler["host"] = "127.0.0.1"
+            handler["port"] = port
+            handler.pop("buffer_overflow_handler", None)
+    return config
+
+
+def percentile(values: List[int], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))] / 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the receiver waits before each read")
+    parser.add_argument("--disconnect-every", type=int, default=0, help="drop the connection after n entries")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds the receiver does not read at the start")
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=receive, args=(child, args.latency, args.disconnect_every, args.pause), daemon=True,
+    )
+    process.start()
+    port: int = parent.recv()
+
+    logging.config.dictConfig(load_config(port))
+    root: logging.Logger = logging.getLogger()
+    # the handlers of the root logger, or the ones the router of the root logger selects for the benchmark records
+    sample: logging.LogRecord = root.makeRecord(
+        root.name, logging.INFO, __file__, 0, {"message": "benchmark record", "tags": ["benchmark"]}, None, None,
+    )
+    handlers: List[logging.Handler] = [
+        target
+        for handler in root.handlers
+        for target in (handler.targets(sample) if isinstance(handler, RoutingHandler) else (handler,))
+    ]
+    fluent_handlers: int = sum("Fluent" in type(handler).__name__ for handler in handlers)
+
+    latencies: List[int] = []
+    start: float = time.perf_counter()
+    for i in range(args.records):
+        before: int = time.perf_counter_ns()
+        root.info({"message": "benchmark record", "number": i, "tags": ["benchmark"]})
+        latencies.append(time.perf_counter_ns() - before)
+    logged: float = time.perf_counter() - start
+    # closing the handlers waits for the queued records to be sent
+    for handler in handlers:
+        handler.close()
+    elapsed: float = time.perf_counter() - start
+
+    expected: int = args.records * fluent_handlers
+    parent.send(expected)
+    stats: Dict[str, Any] = parent.recv()
+    process.join()
+
+    latencies.sort()
+    print(f"records:      {args.records} logged, {expected} expected by fluentd ({fluent_handlers} handlers)")
+    print(f"throughput:   {expected / elapsed:,.0f} records/s sent, {args.records / logged:,.0f} calls/s")
+    # a dropped connection can lose records, but the buffer of the sender is resent as a whole, so the records which
+    # already arrived before the connection was dropped are duplicated
+    difference: int = stats["records"] - expected
+    print(f"net loss:     {max(0, -difference)} records ({max(0, -difference) / expected:.2%})")
+    print(f"duplicates:   {max(0, difference)} records (at least)")
+    print(
+        f"call latency: p50 {percentile(latencies, 0.5):.1f} us, p99 {percentile(latencies, 0.99):.1f} us, "
+        f"max {latencies[-1] / 1000:.1f} us"
+    )
+    print(f"receiver:     {stats}")
+
+
+if __name__ == "__main__":
+    main()
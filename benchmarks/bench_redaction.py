@@ -0,0 +1,124 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the throughput of RedactionFilter with one regular expression per pattern applied one after the other.
+
+The records are flattened gRPC messages (see CustomLogger.grpc) with mostly clean values, a few of which contain
+personal data; part of the values repeat between records, like session ids or language codes do in production. Run
+from the root of the repository with:
+
+    python -m benchmarks.bench_redaction [--records 20000] [--fields 30]
+"""
+
+import argparse
+import random
+import re
+import time
+from logging import (
+    LogRecord,
+    makeLogRecord,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+)
+
+from ondewo.logging.filters import RedactionFilter
+
+CLEAN_VALUES: List[str] = [
+    "de-DE", "en-US", "projects/ondewo/agent/sessions/5f0c2a", "DetectIntentRequest", "OK", "true", "0.8731",
+    "Default Welcome Intent", "The weather in Vienna will be sunny tomorrow with 24 degrees.", "2024-01-15T10:30:00Z",
+]
+PII_VALUES: List[str] = [
+    "max.mustermann@ondewo.com", "+43 664 1234567", "Bearer eyJhbGciOi.eyJzdWIiOiIx.SflKxwRJ",
+    "AT611904300234573201", "Please call me at 0664 1234567 or write to anna@example.org",
+]
+
+
+def make_messages(count: int, fields: int, pii_ratio: float, seed: int = 0) -> List[Dict[str, Any]]:
+    generator: random.Random = random.Random(seed)
+    messages: List[Dict[str, Any]] = []
+    for i in range(count):
+        message: Dict[str, Any] = {"message": f"Got request {i}", "tags": ["grpc"]}
+        for field in range(fields):
+            if generator.random() < pii_ratio:
+                message[f"query_input|text|field{field}"] = generator.choice(PII_VALUES)
+            elif generator.random() < 0.5:
+                message[f"query_input|text|field{field}"] = generator.choice(CLEAN_VALUES)
+            else:
+                # unique values, which are never cached
+                message[f"query_input|text|field{field}"] = f"utterance {i} {field} {generator.random()}"
+        messages.append(message)
+    return messages
+
+
+class ChainedRedaction:
+    """The naive approach: each pattern (with the same boundary) is applied to each string of the (copied) message."""
+
+    def __init__(self, patterns: Dict[str, str], boundary: str) -> None:
+        self.patterns: List[Any] = [
+            (re.compile(f"{boundary}(?:{pattern})"), f"<redacted {name}>") for name, pattern in patterns.items()
+        ]
+
+    def filter(self, record: LogRecord) -> bool:
+        record.msg = self._redact(record.msg)
+        return True
+
+    def _redact(self, value: Any) -> Any:
+        if isinstance(value, str):
+            for pattern, replacement in self.patterns:
+                value = pattern.sub(replacement, value)
+            return value
+        if isinstance(value, dict):
+            return {key: self._redact(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._redact(item) for item in value]
+        return value
+
+
+def run(filter_: Callable[[LogRecord], bool], messages: List[Dict[str, Any]]) -> float:
+    records: List[LogRecord] = [makeLogRecord({"msg": message}) for message in messages]
+    start: float = time.perf_counter()
+    for record in records:
+        filter_(record)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--fields", type=int, default=30)
+    parser.add_argument("--pii-ratio", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    messages: List[Dict[str, Any]] = make_messages(args.records, args.fields, args.pii_ratio)
+    candidates: Dict[str, Callable[[], Callable[[LogRecord], bool]]] = {
+        "chained patterns": lambda: ChainedRedaction(RedactionFilter.PATTERNS, RedactionFilter.BOUNDARY).filter,
+        "combined, no cache": lambda: RedactionFilter(max_cached_length=-1).filter,
+        "combined, cached": lambda: RedactionFilter().filter,
+    }
+    for name, make_filter in candidates.items():
+        elapsed: float = min(run(make_filter(), messages) for _ in range(args.repeat))
+        print(
+            f"{name:>20}: {args.records / elapsed:>10,.0f} records/s, "
+            f"{elapsed / (args.records * args.fields) * 1e6:.2f} us/field (best of {args.repeat})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the throughput of the fluent handlers over TCP and over a unix domain socket.
+
+A local server reads and discards the sent data, so the numbers measure the logging side: formatting, packing and the
+transport. With --loop, the records are logged from a coroutine which yields to the event loop every 10 records, like
+a request handler of an asyncio service. Run from the root of the repository with:
+
+    python -m benchmarks.bench_transport [--records 100000] [--handler async|sync|asyncio] [--loop]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import (
+    List,
+    Optional,
+    Tuple,
+)
+
+from ondewo.logging.handlers import (
+    AsyncFluentHandler,
+    AsyncioFluentHandler,
+    FluentHandler,
+    FluentRecordFormatter,
+)
+
+
+class Sink:
+    """Server which reads and counts the received bytes."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.server: socket.socket
+        if path:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(path)
+            self.host: str = f"unix://{path}"
+            self.port: int = 24224
+        else:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.bind(("127.0.0.1", 0))
+            self.host = "127.0.0.1"
+            self.port = self.server.getsockname()[1]
+        self.server.listen()
+        self.received: int = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._drain, args=(connection,), daemon=True).start()
+
+    def _drain(self, connection: socket.socket) -> None:
+        with connection:
+            while True:
+                data: bytes = connection.recv(1 << 20)
+                if not data:
+                    return
+                self.received += len(data)
+
+    def close(self) -> None:
+        self.server.close()
+
+
+HANDLERS = {"async": AsyncFluentHandler, "sync": FluentHandler, "asyncio": AsyncioFluentHandler}
+
+
+def run(sink: Sink, records: int, handler_class: type, loop: bool = False) -> Tuple[float, int]:
+    """Log the records through a fresh handler and return the seconds until all were sent and the sent bytes."""
+    handler: FluentHandler = handler_class(tag="bench", host=sink.host, port=sink.port, queue_maxsize=10000)
+    handler.setFormatter(FluentRecordFormatter())
+    record: logging.LogRecord = logging.makeLogRecord(
+        {"msg": {"message": "benchmark record", "request_id": "0123456789abcdef", "tags": ["benchmark"]}}
+    )
+
+    async def log() -> None:
+        for i in range(records):
+            handler.handle(record)
+            if i % 10 == 9:
+                await asyncio.sleep(0)
+        # closing the handler in the loop writes the records of the loop
+        handler.close()
+
+    start: float = time.perf_counter()
+    if loop:
+        asyncio.run(log())
+    else:
+        for _ in range(records):
+            handler.handle(record)
+        # closing the handler waits for the queued records to be sent
+        handler.close()
+    elapsed: float = time.perf_counter() - start
+    time.sleep(0.2)
+    return elapsed, sink.received
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--handler", choices=sorted(HANDLERS), default="async")
+    parser.add_argument("--loop", action="store_true", help="log from a coroutine of an event loop")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    handler_class: type = HANDLERS[args.handler]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for transport in ["tcp", "unix"]:
+            results: List[float] = []
+            for _ in range(args.repeat):
+                sink: Sink = Sink(path=os.path.join(directory, "fluent.sock") if transport == "unix" else None)
+                elapsed, received = run(sink, args.records, handler_class, loop=args.loop)
+                sink.close()
+                if transport == "unix":
+                    os.unlink(os.path.join(directory, "fluent.sock"))
+                results.append(args.records / elapsed)
+            print(
+                f"{transport:>4} {args.handler:>7}: {max(results):>10,.0f} records/s (best of {args.repeat}), "
+                f"{received / args.records:.0f} bytes/record"
+            )
+
+
+if __name__ == "__main__":
+    main()
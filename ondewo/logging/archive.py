@@ -0,0 +1,525 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Archive of log records in indexed segment files, and a command line tool to query it.
+
+ArchiveHandler writes each record as a length-prefixed msgpack map (the length as 4 bytes little endian, then the
+fields of the message with the time, levelno, level and logger of the record) into segments, which are rotated like
+the files of JsonLinesFileHandler (see ondewo.logging.files) but not compressed. For each segment, the background
+thread writes a sidecar index <segment>.idx with the offsets, times and levels of the records and the numbers of the
+records per tag and per value of the selected context keys, e.g. the keys which ThreadContextLogger adds.
+
+query reads the matching records: the indexes select the segments and the records in them, only these are read and
+decoded, optionally from memory-mapped segments. Files without an index, such as the active file, are scanned.
+
+    python -m ondewo.logging.archive /var/log/ondewo --tag timing --context request_id=42 --start 2024-01-15T10:00
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ondewo.logging.files import SegmentedFileHandler
+from ondewo.logging.reconfigure import to_level
+
+INDEX_SUFFIX: str = ".idx"
+INDEX_VERSION: int = 1
+
+_LENGTH: struct.Struct = struct.Struct("<I")
+
+
+def index_path(segment: str) -> str:
+    """The path of the index of a segment."""
+    return segment + INDEX_SUFFIX
+
+
+def frames(buffer: Any) -> Iterator[Tuple[int, Any]]:
+    """The offsets and packed records of a segment in a bytes-like buffer, a truncated last record is skipped."""
+    offset: int = 0
+    end: int = len(buffer)
+    while offset + _LENGTH.size <= end:
+        size: int = _LENGTH.unpack_from(buffer, offset)[0]
+        if offset + _LENGTH.size + size > end:
+            return
+        yield offset, buffer[offset + _LENGTH.size:offset + _LENGTH.size + size]
+        offset += _LENGTH.size + size
+
+
+class Query:
+    """The criteria of the records to read from an archive, all of which have to match."""
+
+    def __init__(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        level: Any = logging.NOTSET,
+        tags: Iterable[str] = (),
+        context: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+
+        Args:
+            start: first time of the records in seconds since the epoch
+            end: time after the last record
+            level: minimal level of the records
+            tags: tags which the records have
+            context: values of the fields of the records, compared as strings
+        """
+        self.start: Optional[float] = start
+        self.end: Optional[float] = end
+        self.level: int = to_level(level)
+        self.tags: Tuple[str, ...] = tuple(tags)
+        self.context: Dict[str, str] = {key: str(value) for key, value in (context or {}).items()}
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        """Whether a decoded record matches."""
+        created: Any = data.get("time")
+        if self.start is not None and not created >= self.start:
+            return False
+        if self.end is not None and not created < self.end:
+            return False
+        if data.get("levelno", 0) < self.level:
+            return False
+        if self.tags:
+            tags: Any = data.get("tags")
+            if not isinstance(tags, list) or not all(tag in tags for tag in self.tags):
+                return False
+        return all(str(data.get(key)) == value for key, value in self.context.items())
+
+
+class SegmentIndex:
+    """The index of a segment: offsets, times and levels of its records and their numbers per tag and context value."""
+
+    def __init__(self, keys: Iterable[str] = ()) -> None:
+        """
+
+        Args:
+            keys: the context keys which are indexed
+        """
+        self.keys: Tuple[str, ...] = tuple(keys)
+        self.offsets: "array[int]" = array("Q")
+        self.times: "array[float]" = array("d")
+        self.levels: "array[int]" = array("H")
+        self.tags: Dict[str, "array[int]"] = {}
+        self.context: Dict[str, Dict[str, "array[int]"]] = {key: {} for key in self.keys}
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def add(self, offset: int, data: Dict[str, Any]) -> None:
+        """Add a record.
+
+        Args:
+            offset: offset of the record in the segment
+            data: the fields of the record
+        """
+        number: int = len(self.offsets)
+        self.offsets.append(offset)
+        self.times.append(data["time"])
+        self.levels.append(min(max(data["levelno"], 0), 0xFFFF))
+        tags: Any = data.get("tags")
+        if isinstance(tags, (list, tuple)):
+            for tag in tags:
+                numbers: "array[int]" = self.tags.setdefault(str(tag), array("I"))
+                if not numbers or numbers[-1] != number:
+                    numbers.append(number)
+        for key in self.keys:
+            value: Any = data.get(key)
+            if value is not None:
+                self.context[key].setdefault(str(value), array("I")).append(number)
+
+    def select(self, query: Query) -> List[int]:
+        """The numbers of the records which may match a query, the context keys which are not indexed aren't checked."""
+        if not self.offsets:
+            return []
+        if query.start is not None and max(self.times) < query.start:
+            return []
+        if query.end is not None and min(self.times) >= query.end:
+            return []
+        postings: List[Sequence[int]] = [self.tags.get(tag, ()) for tag in query.tags]
+        postings.extend(
+            self.context[key].get(value, ()) for key, value in query.context.items() if key in self.context
+        )
+        numbers: Iterable[int]
+        if postings:
+            postings.sort(key=len)
+            selected: set = set(postings[0])
+            for numbers in postings[1:]:
+                selected.intersection_update(numbers)
+            numbers = sorted(selected)
+        else:
+            numbers = range(len(self.offsets))
+        start: float = -float("inf") if query.start is None else query.start
+        end: float = float("inf") if query.end is None else query.end
+        times: "array[float]" = self.times
+        levels: "array[int]" = self.levels
+        return [number for number in numbers if start <= times[number] < end and levels[number] >= query.level]
+
+    def dumps(self) -> bytes:
+        import msgpack
+
+        return msgpack.packb(  # type: ignore
+            {
+                "version": INDEX_VERSION,
+                "byteorder": sys.byteorder,
+                "keys": list(self.keys),
+                "offsets": self.offsets.tobytes(),
+                "times": self.times.tobytes(),
+                "levels": self.levels.tobytes(),
+                "tags": {tag: numbers.tobytes() for tag, numbers in self.tags.items()},
+                "context": {
+                    key: {value: numbers.tobytes() for value, numbers in values.items()}
+                    for key, values in self.context.items()
+                },
+            },
+            use_bin_type=True,
+        )
+
+    @classmethod
+    def loads(cls, data: bytes) -> "SegmentIndex":
+        import msgpack
+
+        content: Dict[str, Any] = msgpack.unpackb(data, raw=False)
+        if content.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {content.get('version')}.")
+        swap: bool = content["byteorder"] != sys.byteorder
+
+        def load(typecode: str, data: bytes) -> "array[Any]":
+            values: "array[Any]" = array(typecode)
+            values.frombytes(data)
+            if swap:
+                values.byteswap()
+            return values
+
+        index: SegmentIndex = cls(content["keys"])
+        index.offsets = load("Q", content["offsets"])
+        index.times = load("d", content["times"])
+        index.levels = load("H", content["levels"])
+        index.tags = {tag: load("I", numbers) for tag, numbers in content["tags"].items()}
+        index.context = {
+            key: {value: load("I", numbers) for value, numbers in values.items()}
+            for key, values in content["context"].items()
+        }
+        return index
+
+    @classmethod
+    def build(cls, segment: str, keys: Iterable[str] = ()) -> "SegmentIndex":
+        """Index a segment by reading all its records."""
+        import msgpack
+
+        index: SegmentIndex = cls(keys)
+        with open(segment, "rb") as file:
+            for offset, frame in frames(file.read()):
+                index.add(offset, msgpack.unpackb(frame, raw=False))
+        return index
+
+    def write(self, segment: str) -> None:
+        """Write the index next to its segment."""
+        path: str = index_path(segment)
+        with open(path + ".tmp", "wb") as file:
+            file.write(self.dumps())
+        os.replace(path + ".tmp", path)
+
+
+class ArchiveHandler(SegmentedFileHandler):
+    """Writes the records into segments of an archive which are indexed in the background, see the module documentation.
+
+    The segments are not compressed, so that single records can be read. The files of an earlier process are rotated
+    into a segment and indexed when the handler is created, closing the handler rotates the active file, too.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        index_keys: Sequence[str] = (),
+        max_bytes: int = 64 << 20,
+        rotate_interval: Optional[float] = None,
+        max_total_bytes: Optional[int] = 1 << 30,
+        close_timeout: float = 5.0,
+        level: Any = logging.NOTSET,
+    ) -> None:
+        """
+
+        Args:
+            filename: path of the active file, e.g. /var/log/ondewo/service.olog, the segments are created next to it
+            index_keys: fields of the records which are indexed, e.g. the keys of the context of ThreadContextLogger
+            max_bytes: size from which the active file is rotated
+            rotate_interval: seconds after which the active file is rotated, aligned to the epoch
+            max_total_bytes: the oldest segments and their indexes are deleted while the segments are larger
+            close_timeout: seconds to wait for pending indexes when the handler is closed, the rest is indexed after
+                the next start
+            level: level of the handler
+        """
+        import msgpack
+
+        self.index_keys: Tuple[str, ...] = tuple(index_keys)
+        self._packer: Any = msgpack.Packer(default=str, use_bin_type=True)
+        self._index: Optional[SegmentIndex] = None
+        self._indexes: Dict[str, SegmentIndex] = {}
+        super().__init__(filename, max_bytes, rotate_interval, None, max_total_bytes, close_timeout, level)
+        if self._size:
+            self.rotate()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data: Dict[str, Any] = self.fields(record)
+            data["time"] = record.created
+            data["levelno"] = record.levelno
+            data["level"] = record.levelname
+            data["logger"] = record.name
+            packed: bytes = self._packer.pack(data)
+            self.prepare(_LENGTH.size + len(packed), record.created)
+            if self._index is None:
+                self._index = SegmentIndex(self.index_keys)
+            self._index.add(self._size, data)
+            self._write(_LENGTH.pack(len(packed)) + packed)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def segment_closed(self, segment: str) -> None:
+        if self._index is not None:
+            self._indexes[segment] = self._index
+            self._index = None
+        super().segment_closed(segment)
+
+    def needs_processing(self, segment: str) -> bool:
+        return not os.path.exists(index_path(segment))
+
+    def process_segment(self, segment: str) -> None:
+        index: Optional[SegmentIndex] = self._indexes.pop(segment, None)
+        if not os.path.exists(segment):
+            # deleted by the retention while it was queued
+            return
+        if index is None:
+            index = SegmentIndex.build(segment, self.index_keys)
+        index.write(segment)
+
+    def delete_segment(self, segment: str) -> None:
+        os.unlink(segment)
+        try:
+            os.unlink(index_path(segment))
+        except FileNotFoundError:
+            pass
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            if self._fd is not None:
+                self.rotate()
+        finally:
+            self.release()
+        super().close()
+
+
+class Segment:
+    """A segment file of an archive with its index, if it has one."""
+
+    def __init__(self, path: str, use_mmap: bool = False) -> None:
+        """
+
+        Args:
+            path: path of the segment
+            use_mmap: memory-map the segment instead of reading it
+        """
+        self.path: str = path
+        self.use_mmap: bool = use_mmap
+        self.index: Optional[SegmentIndex] = None
+        try:
+            with open(index_path(path), "rb") as file:
+                self.index = SegmentIndex.loads(file.read())
+        except FileNotFoundError:
+            pass
+
+    def records(self, query: Query) -> Iterator[Dict[str, Any]]:
+        """The decoded records of the segment which match a query."""
+        import msgpack
+
+        with open(self.path, "rb") as file:
+            size: int = os.fstat(file.fileno()).st_size
+            if not size:
+                return
+            buffer: Any = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.use_mmap else None
+            try:
+                for frame in self._frames(file, buffer, query):
+                    data: Dict[str, Any] = msgpack.unpackb(frame, raw=False)
+                    if query.matches(data):
+                        yield data
+            finally:
+                if buffer is not None:
+                    buffer.close()
+
+    def _frames(self, file: IO[bytes], buffer: Any, query: Query) -> Iterator[Any]:
+        if self.index is None:
+            for _, frame in frames(file.read() if buffer is None else buffer):
+                yield frame
+            return
+        for number in self.index.select(query):
+            offset: int = self.index.offsets[number]
+            if buffer is None:
+                file.seek(offset)
+                yield file.read(_LENGTH.unpack(file.read(_LENGTH.size))[0])
+            else:
+                size: int = _LENGTH.unpack_from(buffer, offset)[0]
+                yield buffer[offset + _LENGTH.size:offset + _LENGTH.size + size]
+
+
+def segment_paths(paths: Iterable[str], suffix: str = ".olog") -> List[str]:
+    """The segments of files and directories, the files of a directory with the suffix in the order of their names."""
+    segments: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            segments.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(suffix))
+        else:
+            segments.append(path)
+    return segments
+
+
+def query(
+    paths: Iterable[str],
+    criteria: Optional[Query] = None,
+    use_mmap: bool = False,
+    suffix: str = ".olog",
+) -> Iterator[Dict[str, Any]]:
+    """Read the matching records of an archive.
+
+    Args:
+        paths: segments or directories with segments (see segment_paths)
+        criteria: the query, by default all records match
+        use_mmap: memory-map the segments instead of reading them
+        suffix: suffix of the segments in directories
+
+    Returns:
+        the decoded records in the order of the segments and the records in them
+    """
+    criteria = criteria or Query()
+    for path in segment_paths(paths, suffix):
+        yield from Segment(path, use_mmap).records(criteria)
+
+
+def parse_time(text: str) -> float:
+    """Seconds since the epoch of a number or an ISO 8601 time, which is in UTC if it has no timezone."""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    moment: datetime.datetime = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def to_json(data: Dict[str, Any]) -> str:
+    """A record as a line of JSON, in the format of JsonLinesFileHandler."""
+    fields: Dict[str, Any] = {
+        "time": datetime.datetime.fromtimestamp(data["time"], datetime.timezone.utc).isoformat(timespec="microseconds"),
+        "level": data.get("level"),
+        "logger": data.get("logger"),
+    }
+    fields.update((key, value) for key, value in data.items() if key not in ("time", "levelno", "level", "logger"))
+    return json.dumps(fields, ensure_ascii=False, default=str)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="python -m ondewo.logging.archive",
+        description="Filter, time-slice and export the records of log archives written by ArchiveHandler.",
+    )
+    parser.add_argument("paths", nargs="+", help="segments or directories with segments")
+    parser.add_argument(
+        "--start", type=parse_time, help="first time, ISO 8601 (in UTC without timezone) or seconds since the epoch",
+    )
+    parser.add_argument("--end", type=parse_time, help="time after the last record")
+    parser.add_argument("--level", default="NOTSET", help="minimal level, a name or a number (25 for GRPC)")
+    parser.add_argument(
+        "--tag", action="append", default=[], dest="tags", help="tag of the records, can be repeated",
+    )
+    parser.add_argument(
+        "--context", action="append", default=[], metavar="KEY=VALUE",
+        help="value of a field of the records, can be repeated",
+    )
+    parser.add_argument("--limit", type=int, help="maximal number of exported records")
+    parser.add_argument(
+        "--format", choices=["jsonl", "archive"], default="jsonl",
+        help="export as JSON lines or as a segment of length-prefixed msgpack records",
+    )
+    parser.add_argument("--output", "-o", help="file to export to, by default stdout")
+    parser.add_argument("--count", action="store_true", help="print the number of matching records only")
+    parser.add_argument("--mmap", action="store_true", help="memory-map the segments instead of reading them")
+    parser.add_argument("--suffix", default=".olog", help="suffix of the segments in directories")
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    context: Dict[str, str] = {}
+    for item in args.context:
+        key, separator, value = item.partition("=")
+        if not separator:
+            parser.error(f"--context {item} is not of the form KEY=VALUE")
+        context[key] = value
+    try:
+        criteria: Query = Query(
+            args.start, args.end, int(args.level) if args.level.isdigit() else args.level, args.tags, context,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+
+    records: Iterator[Dict[str, Any]] = query(args.paths, criteria, args.mmap, args.suffix)
+    count: int = 0
+    output: IO[bytes] = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        if args.format == "archive":
+            import msgpack
+
+            packer: Any = msgpack.Packer(default=str, use_bin_type=True)
+        for data in records:
+            if args.limit is not None and count >= args.limit:
+                break
+            count += 1
+            if args.count:
+                continue
+            if args.format == "jsonl":
+                output.write(to_json(data).encode("utf-8") + b"\n")
+            else:
+                packed: bytes = packer.pack(data)
+                output.write(_LENGTH.pack(len(packed)) + packed)
+        if args.count:
+            output.write(f"{count}\n".encode())
+    finally:
+        if args.output:
+            output.close()
+        else:
+            output.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
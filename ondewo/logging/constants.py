@@ -15,8 +15,14 @@
 START: str = "Starting {!r} in thread {}."
 FINISH: str = "Elapsed time: {:0.4f} seconds. Finished {!r} in thread {}."
 CONTEXT: str = "ContextManager"
+BENCHMARK: str = "Benchmark of {!r}: median {:0.6f} seconds, p95 {:0.6f} seconds, p99 {:0.6f} seconds over {} runs."
+MEMORY: str = "Memory of {!r}: peak {:0.2f} MiB, growth {:+0.2f} MiB."
 
 EXCEPTION: str = "An exception '{}' occurred, with message '{}'. Traceback is in debug log. Finished {!r}."
+BUFFER_DROPPED: str = "Dropped the {} oldest of the buffered records of this scope."
+GRPC_REQUEST: str = "gRPC call {!r} finished with status {} in {:0.4f} seconds."
+SUPPRESSED: str = "Suppressed {} duplicates of {!r} in the last {:0.1f} seconds."
+LAZY_FAILED: str = "<could not evaluate {}: {!r}>"
 
 
 class TimerError(Exception):
@@ -13,10 +13,18 @@
 # limitations under the License.
 
 import functools
+import gc
+import inspect
+import logging
+import os
+import sys
 import time
-import traceback
-import uuid
-from collections import defaultdict
+import tracemalloc
+from array import array
+from collections import (
+    Counter,
+    defaultdict,
+)
 from contextlib import ContextDecorator
 from dataclasses import (
     dataclass,
@@ -26,35 +34,176 @@ from logging import (
     Filter,
     Logger,
 )
-from threading import get_ident
+from threading import (
+    Lock,
+    get_ident,
+)
 from typing import (
+    TYPE_CHECKING,
     Any,
+    AsyncGenerator,
     Callable,
+    ClassVar,
     Dict,
+    Generator,
+    List,
     Optional,
+    Tuple,
     TypeVar,
     Union,
 )
 
-import wrapt
-
 from ondewo.logging.constants import (
+    BENCHMARK,
     CONTEXT,
     EXCEPTION,
     FINISH,
+    MEMORY,
     START,
 )
-from ondewo.logging.filters import ThreadContextFilter
+from ondewo.logging.filters import (
+    BufferingContextFilter,
+    ThreadContextFilter,
+)
+from ondewo.logging.fingerprints import fingerprinter
 from ondewo.logging.logger import logger_console
+from ondewo.logging.resources import (
+    ResourceUsage,
+    Snapshot,
+)
+from ondewo.logging.sampling import (
+    StackWatch,
+    stack_sampler,
+)
+from ondewo.logging.summarizers import summarizers
+
+if TYPE_CHECKING:
+    import wrapt
 
 TF = TypeVar("TF", bound=Callable[..., Any])
 
 
+def _random_name() -> str:
+    """A random name in the format of a version 4 UUID, without the import cost of the uuid module."""
+    value: bytearray = bytearray(os.urandom(16))
+    value[6] = value[6] & 0x0F | 0x40
+    value[8] = value[8] & 0x3F | 0x80
+    hex_value: str = value.hex()
+    return f"{hex_value[:8]}-{hex_value[8:12]}-{hex_value[12:16]}-{hex_value[16:20]}-{hex_value[20:]}"
+
+
+def _is_function_wrapper(func: Any) -> bool:
+    """Check if the function is wrapped by wrapt (which is only imported once a function is decorated)."""
+    wrapt_module: Any = sys.modules.get("wrapt")
+    return wrapt_module is not None and isinstance(func, wrapt_module.FunctionWrapper)
+
+
+def _percentile(ordered: List[int], percent: float) -> float:
+    """The percentile of sorted samples, interpolated linearly between the closest ranks."""
+    rank: float = (len(ordered) - 1) * percent / 100
+    lower: int = int(rank)
+    upper: int = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def _sample_statistics(samples: "array[int]") -> Dict[str, float]:
+    """Statistics in seconds of durations measured in nanoseconds."""
+    ordered: List[int] = sorted(samples)
+    total: int = sum(ordered)
+    mean: float = total / len(ordered)
+    variance: float = sum((sample - mean) ** 2 for sample in ordered) / len(ordered)
+    return {
+        "duration min": ordered[0] / 1e9,
+        "duration median": _percentile(ordered, 50) / 1e9,
+        "duration p95": _percentile(ordered, 95) / 1e9,
+        "duration p99": _percentile(ordered, 99) / 1e9,
+        "duration max": ordered[-1] / 1e9,
+        "duration mean": mean / 1e9,
+        "duration stddev": variance ** 0.5 / 1e9,
+        "duration total": total / 1e9,
+    }
+
+
+class _IterationTiming:
+    """Timing of the items produced by a generator or an async generator."""
+
+    __slots__ = ("created", "active", "first_item", "items", "usage")
+
+    def __init__(self, usage: Optional[ResourceUsage] = None) -> None:
+        self.created: float = time.perf_counter()
+        self.active: float = 0.0
+        self.first_item: Optional[float] = None
+        self.items: int = 0
+        self.usage: Optional[ResourceUsage] = usage
+
+    def begin(self) -> Tuple[float, Optional[Snapshot]]:
+        """Start a step of the generator."""
+        return time.perf_counter(), self.usage.start() if self.usage is not None else None
+
+    def add(self, begun: Tuple[float, Optional[Snapshot]], produced: bool) -> None:
+        """Add a step of the generator which possibly produced an item."""
+        now: float = time.perf_counter()
+        self.active += now - begun[0]
+        if self.usage is not None:
+            self.usage.stop(begun[1])  # type: ignore
+        if produced:
+            self.items += 1
+            if self.first_item is None:
+                self.first_item = now - self.created
+
+    def fields(self) -> Dict[str, Any]:
+        fields: Dict[str, Any] = {
+            "items": self.items,
+            "time to first item": self.first_item,
+            "wall time": time.perf_counter() - self.created,
+        }
+        if self.usage is not None:
+            fields.update(self.usage.fields())
+        return fields
+
+
+class _TimedIterator:
+    """Time the steps of a generator, delegating next, send, throw and close to it (for yield from)."""
+
+    def __init__(self, generator: Generator[Any, Any, Any], timing: _IterationTiming) -> None:
+        self.generator: Generator[Any, Any, Any] = generator
+        self.timing: _IterationTiming = timing
+
+    def __iter__(self) -> "_TimedIterator":
+        return self
+
+    def __next__(self) -> Any:
+        return self.send(None)
+
+    def send(self, value: Any) -> Any:
+        begun: Tuple[float, Optional[Snapshot]] = self.timing.begin()
+        try:
+            item: Any = self.generator.send(value)
+        except BaseException:
+            self.timing.add(begun, produced=False)
+            raise
+        self.timing.add(begun, produced=True)
+        return item
+
+    def throw(self, *args: Any) -> Any:
+        begun: Tuple[float, Optional[Snapshot]] = self.timing.begin()
+        try:
+            item: Any = self.generator.throw(*args)
+        except BaseException:
+            self.timing.add(begun, produced=False)
+            raise
+        self.timing.add(begun, produced=True)
+        return item
+
+    def close(self) -> None:
+        self.generator.close()
+
+
 @dataclass
 class Timer(ContextDecorator):
     """Time your code using a class, context manager, or decorator"""
 
-    name: str = field(default_factory=lambda: str(uuid.uuid4()))
+    name: str = field(default_factory=_random_name)
     message: str = FINISH
     logger: Callable[..., None] = logger_console.warning
     _start_times: Dict[int, float] = field(default_factory=dict, init=False, repr=False)
@@ -63,33 +212,145 @@ class Timer(ContextDecorator):
     recursive: bool = False
     recurse_depths: Dict[int, float] = field(default_factory=lambda: defaultdict(float))
     argument_max_length: int = 10000
-
-    @wrapt.decorator
-    def __call__(self, wrapped: Any, instance: Optional[Any], args: Any, kwargs: Any) -> Any:
+    cpu_time: bool = False
+    gc_time: bool = False
+    allocations: bool = False
+    _start_usages: Dict[int, Tuple[ResourceUsage, Snapshot]] = field(default_factory=dict, init=False, repr=False)
+    sample_after: Optional[float] = None
+    sampled_stacks: int = 20
+    _stack_watches: Dict[int, StackWatch] = field(default_factory=dict, init=False, repr=False)
+
+    def __call__(self, wrapped: TF) -> TF:  # type: ignore
+        """Decorate a function, method, static method or class method"""
+        import wrapt
+
+        return wrapt.FunctionWrapper(wrapped, self._call_wrapped)  # type: ignore
+
+    def _call_wrapped(self, wrapped: Any, instance: Optional[Any], args: Any, kwargs: Any) -> Any:
+        if inspect.isgeneratorfunction(wrapped):
+            return self._call_generator(wrapped, args, kwargs, _IterationTiming(self._resource_usage()))
+        if inspect.isasyncgenfunction(wrapped):
+            return self._call_async_generator(wrapped, args, kwargs, _IterationTiming(self._resource_usage()))
+
+        function_name: str = getattr(wrapped, '__name__', "UNKNOWN_FUNCTION_NAME")
         self.start(wrapped, instance, args, kwargs)
-
         value: Any
+        # also stop on KeyboardInterrupt, CancelledError etc., which would leave the stack watched forever
         try:
-            value = wrapped(*args, **kwargs)
-        except Exception as exc:
-            trace = traceback.format_exc()
-            function_name = getattr(wrapped, '__name__', "UNKNOWN_FUNCTION_NAME")
-            log_exception(type(exc), next(iter(exc.args), None), trace, function_name, self.logger)
+            self._watch_stack(sys._getframe())
+            try:
+                value = wrapped(*args, **kwargs)
+            except Exception as exc:
+                fingerprint, count, trace = fingerprinter.observe(type(exc), exc, exc.__traceback__)
+                log_exception(
+                    type(exc), next(iter(exc.args), None), trace, function_name, self.logger,
+                    fingerprint=fingerprint, count=count,
+                )
+
+                if not self.suppress_exceptions:
+                    raise
+                value = "An exception occurred!"
+
+            if self.log_arguments:
+                log_args_kwargs_results(wrapped, value, self.argument_max_length, self.logger, *args, **kwargs)
+        finally:
+            self.stop(function_name)
+        return value
 
+    def _call_generator(
+        self, wrapped: Any, args: Any, kwargs: Any, timing: _IterationTiming,
+    ) -> Generator[Any, Any, Any]:
+        """Time a generator from its creation until it is exhausted or closed, and report it in one record."""
+        function_name: str = getattr(wrapped, '__name__', "UNKNOWN_FUNCTION_NAME")
+        self.logger({"message": START.format(function_name, get_ident())})
+        value: Any = None
+        try:
+            value = yield from _TimedIterator(wrapped(*args, **kwargs), timing)
+        except Exception as exc:
+            self._log_iteration_exception(exc, function_name)
             if not self.suppress_exceptions:
-                self.stop(function_name)
                 raise
             value = "An exception occurred!"
+        finally:
+            self._report_iteration(wrapped, function_name, timing, value, args, kwargs)
+        return value
 
-        if self.log_arguments:
-            log_args_kwargs_results(wrapped, value, self.argument_max_length, self.logger, *args, **kwargs)
+    async def _call_async_generator(
+        self, wrapped: Any, args: Any, kwargs: Any, timing: _IterationTiming,
+    ) -> AsyncGenerator[Any, Any]:
+        """Time an async generator from its creation until it is exhausted or closed, and report it in one record."""
+        function_name: str = getattr(wrapped, '__name__', "UNKNOWN_FUNCTION_NAME")
+        self.logger({"message": START.format(function_name, get_ident())})
+        generator: AsyncGenerator[Any, Any] = wrapped(*args, **kwargs)
+        value: Any = None
+        thrown: Optional[BaseException] = None
+        try:
+            while True:
+                begun: Tuple[float, Optional[Snapshot]] = timing.begin()
+                try:
+                    item: Any = await (generator.asend(value) if thrown is None else generator.athrow(thrown))
+                except StopAsyncIteration:
+                    timing.add(begun, produced=False)
+                    break
+                except BaseException:
+                    timing.add(begun, produced=False)
+                    raise
+                timing.add(begun, produced=True)
+                value, thrown = None, None
+                try:
+                    value = yield item
+                except GeneratorExit:
+                    raise
+                except BaseException as exc:
+                    thrown = exc
+        except Exception as exc:
+            self._log_iteration_exception(exc, function_name)
+            if not self.suppress_exceptions:
+                raise
+        finally:
+            await generator.aclose()
+            self._report_iteration(wrapped, function_name, timing, None, args, kwargs)
 
-        self.stop(wrapped.__name__)
-        return value
+    def _watch_stack(self, root: Optional[Any]) -> None:
+        """Sample the stack of the current call if it runs longer than sample_after.
+
+        :param root:    the frame calling the timed code, the sampled stacks start below it
+        """
+        thread_id: int = get_ident()
+        if self.sample_after is not None and thread_id not in self._stack_watches:
+            self._stack_watches[thread_id] = stack_sampler.watch(self.sample_after, root=root)
+
+    def _resource_usage(self) -> Optional[ResourceUsage]:
+        """A new accumulator of the opt-in resource measurements, None if none is enabled."""
+        if self.cpu_time or self.gc_time or self.allocations:
+            return ResourceUsage(cpu_time=self.cpu_time, gc_time=self.gc_time, allocations=self.allocations)
+        return None
+
+    def _log_iteration_exception(self, exc: Exception, function_name: str) -> None:
+        fingerprint, count, trace = fingerprinter.observe(type(exc), exc, exc.__traceback__)
+        log_exception(
+            type(exc), next(iter(exc.args), None), trace, function_name, self.logger,
+            fingerprint=fingerprint, count=count,
+        )
+
+    def _report_iteration(
+        self,
+        wrapped: Any,
+        function_name: str,
+        timing: _IterationTiming,
+        value: Any,
+        args: Any,
+        kwargs: Any,
+    ) -> None:
+        """Log the arguments and the timing of an exhausted or closed generator."""
+        if self.log_arguments:
+            result: str = f"{timing.items} items" if value is None else f"{timing.items} items, returned {value}"
+            log_args_kwargs_results(wrapped, result, self.argument_max_length, self.logger, *args, **kwargs)
+        self.report(elapsed_time=timing.active, func_name=function_name, thread_id=get_ident(), extra=timing.fields())
 
     def start(
         self,
-        func: Optional[wrapt.FunctionWrapper] = None,
+        func: Optional["wrapt.FunctionWrapper"] = None,
         instance: Optional[Any] = None,
         args: Optional[Any] = None,
         kwargs: Optional[Any] = None
@@ -99,7 +360,7 @@ class Timer(ContextDecorator):
         if func:
             function_name: str = "UNKNOWN_FUNCTION_NAME"
 
-            if isinstance(func, wrapt.FunctionWrapper):
+            if _is_function_wrapper(func):
                 original_func = func.original
                 if hasattr(original_func, '__name__'):
                     function_name = original_func.__name__
@@ -123,9 +384,12 @@ class Timer(ContextDecorator):
                 self.logger(f"Recursing, depth = {self.recurse_depths[thread_id]}")
                 return
         else:
+            usage: Optional[ResourceUsage] = self._resource_usage()
+            if usage is not None:
+                self._start_usages[thread_id] = (usage, usage.start())
             self._start_times[thread_id] = time.perf_counter()
 
-    def stop(self, func: Optional[wrapt.FunctionWrapper] = None) -> float:
+    def stop(self, func: Optional["wrapt.FunctionWrapper"] = None) -> float:
         """Stop the timer, and report the elapsed time"""
         thread_id: int = get_ident()
 
@@ -143,11 +407,22 @@ class Timer(ContextDecorator):
         else:
             elapsed_time = 0.0
 
+        extra: Dict[str, Any] = {}
+        if thread_id in self._start_usages:
+            usage, snapshot = self._start_usages.pop(thread_id)
+            usage.stop(snapshot)
+            extra.update(usage.fields())
+        if thread_id in self._stack_watches:
+            stacks: Optional["Counter[str]"] = stack_sampler.unwatch(self._stack_watches.pop(thread_id))
+            if stacks:
+                extra["stack samples"] = sum(stacks.values())
+                extra["collapsed stacks"] = [f"{stack} {count}" for stack, count in stacks.most_common(self.sampled_stacks)]
+
         # Report elapsed time
         if self.logger:  # type: ignore
             func_name = None
             if func:
-                if isinstance(func, wrapt.FunctionWrapper):
+                if _is_function_wrapper(func):
                     original_func = func.original
                     if hasattr(original_func, '__name__'):
                         func_name = original_func.__name__
@@ -159,7 +434,7 @@ class Timer(ContextDecorator):
                     elif hasattr(func, '__str__'):
                         func_name = str(func)
 
-            self.report(elapsed_time=elapsed_time, func_name=func_name, thread_id=thread_id)
+            self.report(elapsed_time=elapsed_time, func_name=func_name, thread_id=thread_id, extra=extra)
 
         return elapsed_time
 
@@ -168,7 +443,16 @@ class Timer(ContextDecorator):
         elapsed_time: float,
         func_name: Optional[str] = None,
         thread_id: Optional[int] = None,
+        extra: Optional[Dict[str, Any]] = None,
     ) -> None:
+        """
+        Log the elapsed time.
+
+        :param elapsed_time:    the measured time in seconds (for generators the time spent producing the items)
+        :param func_name:       name of the timed function
+        :param thread_id:       id of the thread
+        :param extra:           further fields of the record
+        """
         name: str = func_name or CONTEXT
 
         try:
@@ -182,24 +466,282 @@ class Timer(ContextDecorator):
             "duration": elapsed_time,
             "tags": ["timing"],
         }
+        if extra:
+            log.update(extra)
         self.logger(log)  # type: ignore
 
+    def benchmark(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        repeat: int = 100,
+        warmup: int = 5,
+        disable_gc: bool = False,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """
+        Call a function repeatedly and log one timing record with the statistics of the calls.
+
+        The calls are timed with perf_counter_ns, the durations are kept in an array of 64 bit integers. The record
+        is logged with report, its duration is the median and its duration total the sum of the measured calls.
+
+        With disable_gc, the garbage collector is run before and disabled during the measured calls, so that
+        collections triggered by earlier code don't distort the results. The garbage collector is process wide, so
+        this also stops the collections of all other threads (e.g. of a service which is benchmarked in its pod):
+        only use it in a process which is dedicated to the benchmark.
+
+        :param func:            the benchmarked function
+        :param args:            positional arguments of the function
+        :param repeat:          number of measured calls
+        :param warmup:          number of calls before the measured ones (e.g. to fill caches)
+        :param disable_gc:      disable the garbage collector of the process during the measured calls
+        :param kwargs:          keyword arguments of the function
+        :return:                the fields of the record with the statistics
+        """
+        return self._benchmark(func, args, kwargs, repeat=repeat, warmup=warmup, disable_gc=disable_gc)[1]
+
+    def benchmarked(self, repeat: int = 100, warmup: int = 5, disable_gc: bool = False) -> Callable[[TF], TF]:
+        """
+        Decorator variant of benchmark: every call of the decorated function is benchmarked.
+
+        :return:                a decorator, the decorated function returns the result of its last measured call
+        """
+
+        def decorator(func: TF) -> TF:
+            @functools.wraps(func)
+            def wrapper_benchmark(*args: Any, **kwargs: Any) -> Any:
+                return self._benchmark(func, args, kwargs, repeat=repeat, warmup=warmup, disable_gc=disable_gc)[0]
+
+            return wrapper_benchmark  # type: ignore
+
+        return decorator
+
+    def _benchmark(
+        self,
+        func: Callable[..., Any],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        repeat: int,
+        warmup: int,
+        disable_gc: bool,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        if repeat < 1:
+            raise ValueError(f"A benchmark needs at least one measured call, got repeat={repeat}.")
+        for _ in range(warmup):
+            func(*args, **kwargs)
+
+        samples: "array[int]" = array("q", [0]) * repeat
+        result: Any = None
+        gc_was_enabled: bool = gc.isenabled()
+        if disable_gc:
+            gc.collect()
+            gc.disable()
+        try:
+            perf_counter_ns: Callable[[], int] = time.perf_counter_ns
+            for index in range(repeat):
+                begin: int = perf_counter_ns()
+                result = func(*args, **kwargs)
+                samples[index] = perf_counter_ns() - begin
+        finally:
+            if disable_gc and gc_was_enabled:
+                gc.enable()
+
+        fields: Dict[str, Any] = _sample_statistics(samples)
+        name: str = getattr(func, "__qualname__", None) or str(func)
+        fields.update({
+            "message": BENCHMARK.format(
+                name, fields["duration median"], fields["duration p95"], fields["duration p99"], repeat,
+            ),
+            "runs": repeat,
+            "warmup runs": warmup,
+            "gc disabled": disable_gc,
+            "tags": ["timing", "benchmark"],
+        })
+        if self.logger:  # type: ignore
+            self.report(elapsed_time=fields["duration median"], func_name=name, thread_id=get_ident(), extra=fields)
+        return result, fields
+
     def __enter__(self) -> "Timer":
         """Start a new timer as a context manager"""
         self.start()
+        # the stacks start at the frame of the with statement
+        self._watch_stack(sys._getframe(1).f_back)
         return self
 
     def __exit__(self, exc_type: Any, exc_val: str, traceback_obj: Any) -> bool:
         """Stop the context manager timer"""
         self.stop()
         if exc_type:
-            log_exception(exc_type, exc_val, traceback.format_exc(), CONTEXT, self.logger)  # type: ignore
+            fingerprint, count, trace = fingerprinter.observe(exc_type, exc_val, traceback_obj)  # type: ignore
+            log_exception(
+                exc_type, exc_val, trace, CONTEXT, self.logger,  # type: ignore
+                fingerprint=fingerprint, count=count,
+            )
         return self.suppress_exceptions
 
 
 timing = Timer()
 
 
+def _rss() -> int:
+    """The resident set size of the process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # without procfs, only the high-water mark is available
+        return _max_rss()
+
+
+def _max_rss() -> int:
+    """The high-water mark of the resident set size of the process in bytes."""
+    import resource
+
+    maxrss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in KiB on linux, in bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@dataclass
+class MemoryProfiler(ContextDecorator):
+    """Report the peak memory and the net memory growth of a call using a class, context manager, or decorator
+
+    By default the allocations of python objects are traced with tracemalloc (which is started if needed and slows
+    down all allocations while profiling). With use_rss the resident set size of the process is measured instead,
+    which is cheap but coarse: the peak is the growth of the high-water mark of the process. Both are process wide,
+    so calls profiled at the same time see each other's allocations. The traced peak is only reset by the first of the
+    calls which are profiled at the same time, so it stays valid for the enclosing calls. If the peak of the process
+    did not rise during a nested or concurrent call, the peak of that call is unknown, and the reported peak is an
+    upper bound (marked with "memory peak exact": False).
+    """
+
+    name: str = CONTEXT
+    logger: Callable[..., None] = logger_console.warning
+    use_rss: bool = False
+    top_lines_threshold: Optional[int] = None
+    top_lines: int = 10
+    _states: Dict[int, List[Any]] = field(default_factory=dict, init=False, repr=False)
+
+    _tracemalloc_lock: ClassVar[Lock] = Lock()
+    _tracemalloc_users: ClassVar[int] = 0
+    _tracemalloc_started: ClassVar[bool] = False
+
+    def __call__(self, func: TF) -> TF:  # type: ignore
+        """Decorate a function"""
+
+        @functools.wraps(func)
+        def wrapper_memory(*args, **kwargs) -> Any:  # type: ignore
+            self.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stop(getattr(func, '__name__', "UNKNOWN_FUNCTION_NAME"))
+
+        return wrapper_memory  # type: ignore
+
+    def start(self) -> None:
+        """Start measuring the memory of the current thread's call"""
+        state: List[Any]
+        if self.use_rss:
+            state = [_rss(), _max_rss(), None]
+        else:
+            first: bool = self._acquire_tracemalloc()
+            snapshot: Optional[tracemalloc.Snapshot] = None
+            if self.top_lines_threshold is not None:
+                snapshot = tracemalloc.take_snapshot()
+            # not available before python 3.9, the peak is then the peak since tracing started; resetting it while
+            # other calls are profiled would falsify their peaks
+            if first and hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            current, traced_peak = tracemalloc.get_traced_memory()
+            state = [current, None if first else traced_peak, snapshot]
+        self._states.setdefault(get_ident(), []).append(state)
+
+    def stop(self, func_name: Optional[str] = None) -> Dict[str, Any]:
+        """Stop measuring, and report the peak memory and the growth
+
+        :param func_name:   name of the profiled function
+        :return:            the logged record
+        """
+        thread_id: int = get_ident()
+        states: List[List[Any]] = self._states[thread_id]
+        start, start_peak, snapshot = states.pop()
+        if not states:
+            del self._states[thread_id]
+
+        top: Optional[List[str]] = None
+        exact: bool = True
+        if self.use_rss:
+            growth: int = _rss() - start
+            peak: int = max(_max_rss() - start_peak, growth, 0)
+        else:
+            current, traced_peak = tracemalloc.get_traced_memory()
+            growth = current - start
+            peak = max(traced_peak - start, growth, 0)
+            # a peak which rose during the call was reached during the call, otherwise it may be older
+            exact = start_peak is None or traced_peak > start_peak
+            if snapshot is not None and growth >= self.top_lines_threshold:  # type: ignore
+                top = self._top_lines(snapshot)
+            self._release_tracemalloc()
+
+        name: str = func_name or self.name
+        log: Dict[str, Any] = {
+            "message": MEMORY.format(name, peak / 2 ** 20, growth / 2 ** 20),
+            "memory peak": peak,
+            "memory growth": growth,
+            "tags": ["memory"],
+        }
+        if not exact:
+            log["memory peak exact"] = False
+        if top is not None:
+            log["top allocations"] = top
+        self.logger(log)
+        return log
+
+    def _top_lines(self, snapshot: tracemalloc.Snapshot) -> List[str]:
+        """The source lines which allocated most of the memory since the snapshot."""
+        ignored: List[tracemalloc.Filter] = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        statistics: List[tracemalloc.StatisticDiff] = (
+            tracemalloc.take_snapshot().filter_traces(ignored).compare_to(snapshot.filter_traces(ignored), "lineno")
+        )
+        return [str(statistic) for statistic in statistics[:self.top_lines] if statistic.size_diff > 0]
+
+    @classmethod
+    def _acquire_tracemalloc(cls) -> bool:
+        """Start tracemalloc if it is not tracing yet, it is stopped again when the last profiled call finished.
+
+        Returns:
+            whether no other call is profiled at the moment
+        """
+        with cls._tracemalloc_lock:
+            first: bool = cls._tracemalloc_users == 0
+            if first and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                cls._tracemalloc_started = True
+            cls._tracemalloc_users += 1
+            return first
+
+    @classmethod
+    def _release_tracemalloc(cls) -> None:
+        with cls._tracemalloc_lock:
+            cls._tracemalloc_users -= 1
+            if cls._tracemalloc_users == 0 and cls._tracemalloc_started:
+                tracemalloc.stop()
+                cls._tracemalloc_started = False
+
+    def __enter__(self) -> "MemoryProfiler":
+        """Start measuring as a context manager"""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, traceback_obj: Any) -> None:
+        """Stop measuring as a context manager"""
+        self.stop()
+
+
 def exception_silencing(func: Callable) -> Callable:
     """
     Quietly kills exceptions, logging the minimum.
@@ -244,8 +786,11 @@ def exception_handling(func: Callable) -> Callable:
         try:
             return func(*args, **kwargs)
         except Exception as exc:
-            trace = traceback.format_exc()
-            log_exception(type(exc), next(iter(exc.args), None), trace, func.__name__)
+            fingerprint, count, trace = fingerprinter.observe(type(exc), exc, exc.__traceback__)
+            log_exception(
+                type(exc), next(iter(exc.args), None), trace, func.__name__,
+                fingerprint=fingerprint, count=count,
+            )
             log_args_kwargs_results(func, None, -1, None, *args, **kwargs)
         return None
 
@@ -276,9 +821,12 @@ def log_exception(
     traceback_str: Optional[str],
     function_name: str,
     logger: Callable[[Union[str, Dict[str, Any]]], None] = logger_console.error,
+    fingerprint: Optional[str] = None,
+    count: Optional[int] = None,
 ) -> None:
     """
-    Formats and logs an exception.
+    Formats and logs an exception. If a fingerprint is given, it is logged together with the number of its
+    occurrences; the traceback is then only present for the first occurrence within the fingerprinting window.
     """
     message = EXCEPTION.format(exc_type, exc_val, function_name)
     log: Dict[str, Any] = {
@@ -288,6 +836,9 @@ def log_exception(
         "traceback": traceback_str,
         "tags": ["timing", "exception"],
     }
+    if fingerprint:
+        log["exception fingerprint"] = fingerprint
+        log["exception count"] = count
     logger(log)
 
 
@@ -299,25 +850,23 @@ def log_args_kwargs_results(  # type: ignore
     *args,
     **kwargs,
 ) -> None:
-    def truncate_arg(arg_to_truncate: Any) -> str:
-        arg_str: str = str(arg_to_truncate)
-        if argument_max_length == -1:
-            return arg_str
-        if len(arg_str) > argument_max_length:
-            return arg_str[:argument_max_length] + "<TRUNCATED!>"
-        return arg_str
-
     """
     Format and log all the inputs and outputs of a function
+
+    The arguments and the result are rendered with the summarizer registry (see ondewo.logging.summarizers), i.e.
+    arrays, data frames, protobuf messages and long binary values as short summaries, and other values with str().
+    The positional arguments are logged as a list in their order.
     """
-    args_to_log = {truncate_arg(arg) for arg in args}
-    kwargs_to_log = {i: truncate_arg(kwargs[i]) for i in kwargs}
+    args_to_log: List[str] = [summarizers.summarize(arg, argument_max_length) for arg in args]
+    kwargs_to_log: Dict[str, str] = {
+        name: summarizers.summarize(value, argument_max_length) for name, value in kwargs.items()
+    }
     formatted_results: Dict[str, Any] = {
         "function": f"{func.__name__}",
         "args": f"{args_to_log}",
         "kwargs": f"{kwargs_to_log}",
         **kwargs_to_log,
-        "result": f"{truncate_arg(result)}",
+        "result": summarizers.summarize(result, argument_max_length),
     }
     if logger:
         logger(
@@ -329,26 +878,62 @@ def log_args_kwargs_results(  # type: ignore
 
 
 class ThreadContextLogger(ContextDecorator):
-    """Add per-thread context information using a class, context manager or decorator."""
+    """Add per-thread context information using a class, context manager or decorator.
+
+    With a buffer_size, the context is a request scope which holds back the DEBUG and INFO records of the thread which
+    are below the level of the logger in a ring buffer (see BufferingContextFilter). They are created even though the
+    level of the logger is higher (for loggers of the CustomLogger class, such as logger_console). Records which pass
+    the level of the logger are logged as usual. When the scope exits normally, the buffer is discarded; an ERROR
+    record or an exception inside the scope flushes it in full.
+    """
 
     def __init__(
         self,
         context_dict: Optional[Dict[str, Any]] = None,
         logger: Optional[Logger] = None,
+        buffer_size: Optional[int] = None,
+        buffer_level: int = logging.INFO,
+        flush_level: int = logging.ERROR,
     ) -> None:
         """
 
         Args:
             context_dict: optional context information to add to the logs from the current thread
             logger: optional logger to add the information to (be default the global logger_console)
+            buffer_size: optional maximal number of buffered records, enables the buffering of low level records
+            buffer_level: records up to this level are buffered
+            flush_level: records from this level on flush the buffer
         """
         self.logger: Logger = logger or logger_console
-        self.filter: Filter = ThreadContextFilter(context_dict=context_dict)
+        self.filter: Filter
+        if buffer_size:
+            self.filter = BufferingContextFilter(
+                context_dict=context_dict, capacity=buffer_size, buffer_level=buffer_level, flush_level=flush_level,
+            )
+        else:
+            self.filter = ThreadContextFilter(context_dict=context_dict)
+        self._previous_buffer_levels: List[Optional[int]] = []
 
     def __enter__(self) -> None:
         """Add the filter to the logger when entering the context."""
         self.logger.addFilter(self.filter)
+        if isinstance(self.filter, BufferingContextFilter):
+            set_thread_buffer_level: Optional[Callable[[Optional[int]], Optional[int]]] = getattr(
+                self.logger, "set_thread_buffer_level", None,
+            )
+            if set_thread_buffer_level is not None:
+                self._previous_buffer_levels.append(set_thread_buffer_level(self.filter.buffer_level))
 
     def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
-        """Remove the filter from the logger when leaving the context."""
+        """Remove the filter from the logger when leaving the context, flushing or discarding the buffer."""
+        if isinstance(self.filter, BufferingContextFilter):
+            set_thread_buffer_level: Optional[Callable[[Optional[int]], Optional[int]]] = getattr(
+                self.logger, "set_thread_buffer_level", None,
+            )
+            if set_thread_buffer_level is not None and self._previous_buffer_levels:
+                set_thread_buffer_level(self._previous_buffer_levels.pop())
+            if exc_type is not None:
+                self.filter.flush()
+            else:
+                self.filter.discard()
         self.logger.removeFilter(self.filter)
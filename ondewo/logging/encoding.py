@@ -0,0 +1,154 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Encoding of fluentd records into reusable buffers.
+
+A RecordPacker packs records (forward protocol, message mode) with a reused msgpack.Packer and copies them into a
+growable buffer, which is written to the socket as a memoryview and then reused. A batch of records therefore costs
+neither a new Packer per record, nor a list of packed records and the copy of joining them. A packer is not thread-safe, the PooledSender of
+ondewo.logging.senders keeps one per thread.
+"""
+
+import traceback
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+)
+
+from ondewo.logging.events import Event
+
+
+class RecordPacker:
+    """Packs records into one contiguous buffer which is reused after it was written."""
+
+    def __init__(
+        self,
+        msgpack_kwargs: Optional[Dict[str, Any]] = None,
+        nanosecond_precision: bool = False,
+        initial_size: int = 1 << 16,
+        max_retained_size: int = 1 << 20,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        """
+
+        Args:
+            msgpack_kwargs: arguments for msgpack.Packer
+            nanosecond_precision: pack the time of the records with nanosecond precision (EventTime)
+            initial_size: initial size of the buffer in bytes, it grows with the packed records
+            max_retained_size: a buffer which grew larger than this (in bytes) is released after it was written
+            on_error: called with the exception of a record which could not be packed
+        """
+        import msgpack
+
+        self.nanosecond_precision: bool = nanosecond_precision
+        self.initial_size: int = initial_size
+        self.max_retained_size: int = max_retained_size
+        self.on_error: Optional[Callable[[Exception], None]] = on_error
+        # set while the buffer is written, a record logged meanwhile (e.g. by the buffer overflow handler) must not
+        # be packed into the buffer
+        self.busy: bool = False
+        self.count: int = 0
+        # packing into the internal buffer of the packer and copying it from there (getbuffer) is slower than copying
+        # the short-lived bytes of each record, which are not tracked by the garbage collector
+        self._packer: Any = msgpack.Packer(**(msgpack_kwargs or {}))
+        self._buffer: bytearray = bytearray(initial_size)
+        self._size: int = 0
+
+    def add(self, tag: str, created: float, data: Any) -> None:
+        """Pack a record after the records in the buffer.
+
+        If the data can't be packed, a CRITICAL record with the traceback is packed instead.
+
+        Args:
+            tag: tag of the record
+            created: creation time of the record
+            data: the formatted record, a dict or an event of ondewo.logging.events
+        """
+        timestamp: Any = self._timestamp(created)
+        packed: bytes
+        try:
+            packed = self._pack(tag=tag, timestamp=timestamp, data=data)
+        except Exception as exc:
+            if self.on_error is not None:
+                self.on_error(exc)
+            error: Dict[str, Any] = {
+                "level": "CRITICAL",
+                "message": "Can't output to log",
+                "traceback": traceback.format_exc(),
+            }
+            packed = self._pack(tag=tag, timestamp=timestamp, data=error)
+
+        # the slice assignment only grows the buffer if the record doesn't fit
+        end: int = self._size + len(packed)
+        self._buffer[self._size:end] = packed
+        self._size = end
+        self.count += 1
+
+    def pack(self, tag: str, created: float, data: Any) -> bytes:
+        """Pack a single record into a new bytes object, the buffer must be empty."""
+        self.add(tag=tag, created=created, data=data)
+        packet: bytes = bytes(self._buffer[:self._size])
+        self.reset()
+        return packet
+
+    def write(self, write: Callable[[Any], bool]) -> bool:
+        """Write the packed records with a single call and reset the buffer.
+
+        Args:
+            write: writes the buffer, e.g. PooledSender.write. It gets a memoryview, which it must copy if it keeps
+                the data after returning.
+
+        Returns:
+            the result of write, True if there was nothing to write
+        """
+        if not self.count:
+            return True
+        self.busy = True
+        try:
+            with memoryview(self._buffer) as view, view[:self._size] as records:
+                return write(records)
+        finally:
+            self.reset(release=len(self._buffer) > self.max_retained_size)
+            self.busy = False
+
+    def reset(self, release: bool = False) -> None:
+        """Empty the buffer.
+
+        Args:
+            release: release the memory of the buffer instead of keeping it for the next records
+        """
+        self.count = 0
+        self._size = 0
+        if release:
+            self._buffer = bytearray(self.initial_size)
+
+    def __len__(self) -> int:
+        """The number of records in the buffer."""
+        return self.count
+
+    def _timestamp(self, created: float) -> Any:
+        if self.nanosecond_precision:
+            from fluent.sender import EventTime
+
+            return EventTime(created)
+        return int(created)
+
+    def _pack(self, tag: str, timestamp: Any, data: Any) -> bytes:
+        packer: Any = self._packer
+        if isinstance(data, Event):
+            return packer.pack_array_header(3) + packer.pack(tag) + packer.pack(timestamp) + packer.pack_map_pairs(data.pairs())  # type: ignore
+        return packer.pack((tag, timestamp, data))  # type: ignore
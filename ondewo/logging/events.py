@@ -0,0 +1,258 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Typed log events.
+
+An event type declares its fields as slots and has a stable template id, so the records of an event type always have
+the same keys and can be grouped by their template id instead of their (formatted) message. Events are logged like
+dict messages:
+
+    logger_console.warning(TimerFinished(duration=1.5, function="predict", thread="MainThread"))
+
+Building an event only stores its fields, the message is formatted when the record is handled. The formatters of
+ondewo.logging.handlers and the filters of ondewo.logging.filters handle events natively; pack and to_json encode an
+event straight to msgpack or JSON without building a dict first (JsonLinesFileHandler of ondewo.logging.files writes
+events with to_json).
+"""
+
+import json
+import math
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from ondewo.logging.constants import (
+    EXCEPTION,
+    FINISH,
+    GRPC_REQUEST,
+)
+
+# the event types by their template id
+event_types: Dict[str, Type["Event"]] = {}
+
+_json_encoder: json.JSONEncoder = json.JSONEncoder(default=str)
+
+
+def _json_value(value: Any) -> str:
+    """Encode a value as JSON, the common scalars without the overhead of an encoder."""
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)  # type: ignore
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if type(value) is int or (type(value) is float and math.isfinite(value)):
+        return repr(value)
+    return _json_encoder.encode(value)
+
+
+class Event:
+    """Base class of the event types.
+
+    An event type lists its fields in __slots__ and sets a unique template_id, the message template (formatted with
+    the fields in the order of declaration) and the tags. Fields whose key in the record is not a valid identifier are
+    renamed with keys. Fields which are not given are None.
+
+    Example:
+        class CacheMiss(Event):
+            __slots__ = ("cache", "key")
+            template_id = "cache.miss"
+            template = "Cache {} missed {!r}."
+            tags = ("cache",)
+    """
+
+    __slots__ = ("context",)
+
+    template_id: ClassVar[str] = ""
+    template: ClassVar[str] = ""
+    tags: ClassVar[Tuple[str, ...]] = ()
+    keys: ClassVar[Dict[str, str]] = {}
+
+    # the fields and their keys in the record, in the order of declaration
+    fields: ClassVar[Tuple[str, ...]] = ()
+    field_keys: ClassVar[Tuple[str, ...]] = ()
+    _values: ClassVar[Callable[["Event"], Tuple[Any, ...]]]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if not cls.template_id:
+            raise ValueError(f"The event type {cls.__name__} has no template id.")
+        fields: Tuple[str, ...] = ()
+        for klass in reversed(cls.__mro__):
+            slots: Any = klass.__dict__.get("__slots__", ())
+            fields += tuple(name for name in ((slots,) if isinstance(slots, str) else slots) if name != "context")
+        cls.fields = fields
+        cls.field_keys = tuple(cls.keys.get(name, name) for name in fields)
+        if not fields:
+            cls._values = staticmethod(lambda event: ())  # type: ignore
+        elif len(fields) == 1:
+            cls._values = staticmethod(lambda event, name=fields[0]: (getattr(event, name),))  # type: ignore
+        else:
+            cls._values = staticmethod(attrgetter(*fields))  # type: ignore
+
+        registered: Optional[Type[Event]] = event_types.get(cls.template_id)
+        if registered is not None and registered.__qualname__ != cls.__qualname__:
+            raise ValueError(f"The template id {cls.template_id!r} is already used by {registered.__qualname__}.")
+        event_types[cls.template_id] = cls
+
+    def __init__(self, *args: Any, context: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        """
+
+        Args:
+            *args: values of the fields in the order of declaration
+            context: additional keys of the record, e.g. the context of ThreadContextFilter
+            **kwargs: values of the fields by name, the fields which are not given are None
+        """
+        fields: Tuple[str, ...] = self.fields
+        if len(args) > len(fields):
+            raise TypeError(f"{type(self).__name__} takes {len(fields)} fields but {len(args)} were given.")
+        for name, value in zip(fields, args):
+            setattr(self, name, value)
+        for name in fields[len(args):]:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError(f"{type(self).__name__} got unexpected or repeated fields: {', '.join(kwargs)}.")
+        self.context: Optional[Dict[str, Any]] = context
+
+    def values(self) -> Tuple[Any, ...]:
+        """The values of the fields in the order of declaration."""
+        return self._values(self)  # type: ignore
+
+    @property
+    def message(self) -> str:
+        return self._format(self._values(self))  # type: ignore
+
+    def _format(self, values: Tuple[Any, ...]) -> str:
+        """Format the template, falling back to the fields if it doesn't fit them (e.g. a number field is None)."""
+        try:
+            return self.template.format(*values)
+        except (TypeError, ValueError, IndexError):
+            return f"{self.template_id}: {self!r}"
+
+    def pairs(self) -> List[Tuple[str, Any]]:
+        """The keys and values of the record: message, fields, template id, tags and context (overriding the others)."""
+        values: Tuple[Any, ...] = self._values(self)  # type: ignore
+        pairs: List[Tuple[str, Any]] = [
+            ("message", self._format(values)),
+            *zip(self.field_keys, values),
+            ("template_id", self.template_id),
+            ("tags", list(self.tags)),
+        ]
+        if self.context:
+            context: Dict[str, Any] = self.context
+            pairs = [pair for pair in pairs if pair[0] not in context]
+            pairs.extend(context.items())
+        return pairs
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(self.pairs())
+
+    def __len__(self) -> int:
+        return len(self.pairs())
+
+    def with_context(self, context: Dict[str, Any]) -> "Event":
+        """A copy of the event with the context added to its context (the values of the fields are not copied)."""
+        event: Event = object.__new__(type(self))
+        for name, value in zip(self.fields, self._values(self)):  # type: ignore
+            setattr(event, name, value)
+        event.context = {**self.context, **context} if self.context else context
+        return event
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.pairs())
+
+    def pack(self, packer: Any = None) -> bytes:
+        """Encode the event as a msgpack map.
+
+        Args:
+            packer: msgpack.Packer to reuse (with autoreset), by default a new one
+
+        Returns:
+            the packed map
+        """
+        if packer is None:
+            import msgpack
+
+            packer = msgpack.Packer()
+        return packer.pack_map_pairs(self.pairs())  # type: ignore
+
+    def to_json(self) -> str:
+        """Encode the event as a JSON object, values which are not serializable are converted to strings."""
+        return "{" + ", ".join(f"{encode_basestring_ascii(key)}: {_json_value(value)}" for key, value in self.pairs()) + "}"
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return bool(self.values() == other.values() and self.context == other.context)
+
+    def __repr__(self) -> str:
+        fields: str = ", ".join(f"{name}={value!r}" for name, value in zip(self.fields, self.values()))
+        return f"{type(self).__name__}({fields})"
+
+    def __str__(self) -> str:
+        # like a dict message, e.g. for the console
+        return str(self.to_dict())
+
+
+class TimerFinished(Event):
+    """A timed function or block finished, see ondewo.logging.decorators.Timer."""
+
+    __slots__ = ("duration", "function", "thread")
+    template_id = "timer.finished"
+    template = FINISH
+    tags = ("timing",)
+
+
+class ExceptionRaised(Event):
+    """A timed or handled function raised an exception, see ondewo.logging.decorators.log_exception."""
+
+    __slots__ = ("exception_type", "exception_value", "function", "traceback", "fingerprint", "count")
+    template_id = "exception.raised"
+    template = EXCEPTION
+    tags = ("timing", "exception")
+    keys = {
+        "exception_type": "exception type",
+        "exception_value": "exception value",
+        "fingerprint": "exception fingerprint",
+        "count": "exception count",
+    }
+
+
+class GrpcRequest(Event):
+    """A gRPC call finished with a status code, see ondewo.logging.interceptors.
+
+    The sizes are the serialized sizes of the messages in bytes (the totals for streams), the counts are the numbers
+    of messages of streams; side is "server" or "client".
+    """
+
+    __slots__ = (
+        "method", "code", "duration", "request_type", "response_type",
+        "request_size", "response_size", "request_count", "response_count", "side",
+    )
+    template_id = "grpc.request"
+    template = GRPC_REQUEST
+    tags = ("grpc",)
@@ -0,0 +1,371 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Local log files in rotated segments, for deployments without fluentd.
+
+A SegmentedFileHandler appends the encoded records to an active file, opened with O_APPEND so that each record is a
+single write which lands at the end of the file. The active file is rotated when it would exceed max_bytes or when
+the rotate_interval (aligned to the epoch, e.g. every full hour) elapsed: it is renamed to a segment named after the
+time of the rotation, e.g. service.20240115T103000-000.jsonl, and a new active file is opened. Renaming and opening
+are all the logging thread does. A background thread compresses the closed segments (gzip, or zstd if the zstandard
+package or the compression.zstd module of python 3.14 is available) and deletes the oldest segments while the files
+exceed max_total_bytes. Segments which were not compressed before the process stopped are compressed after the next
+start. The files of a handler must only be written by one process.
+
+JsonLinesFileHandler writes a JSON object per line.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from typing import (
+    Any,
+    IO,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from ondewo.logging.events import Event
+
+# file name suffixes of the compressed segments
+COMPRESSION_SUFFIXES: Dict[str, str] = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _open_compressed(path: str, compression: str) -> IO[bytes]:
+    """Open a file for writing compressed data."""
+    if compression == "gzip":
+        return gzip.open(path, "wb")  # type: ignore
+    try:
+        from compression import zstd  # type: ignore
+
+        return zstd.open(path, "wb")  # type: ignore
+    except ImportError:
+        import zstandard  # type: ignore
+
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))  # type: ignore
+
+
+def _zstd_available() -> bool:
+    for module in ("compression.zstd", "zstandard"):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+def compress_file(path: str, compression: str) -> str:
+    """Compress a file next to it and delete it.
+
+    The compressed data is written to a temporary file first, so a compressed segment is always complete.
+
+    Args:
+        path: path of the file
+        compression: "gzip" or "zstd"
+
+    Returns:
+        the path of the compressed file
+    """
+    target: str = path + COMPRESSION_SUFFIXES[compression]
+    temporary: str = target + ".tmp"
+    with open(path, "rb") as source, _open_compressed(temporary, compression) as destination:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            destination.write(chunk)
+    os.replace(temporary, target)
+    os.unlink(path)
+    return target
+
+
+class SegmentedFileHandler(logging.Handler):
+    """Appends encoded records to a file which is rotated into segments, see the module documentation.
+
+    Subclasses implement encode, or emit with prepare and _write. process_segment, delete_segment and needs_processing
+    extend what happens to the closed segments.
+    """
+
+    _STOP: Tuple[()] = ()
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = 64 << 20,
+        rotate_interval: Optional[float] = None,
+        compression: Optional[str] = "gzip",
+        max_total_bytes: Optional[int] = 1 << 30,
+        close_timeout: float = 5.0,
+        level: Any = logging.NOTSET,
+    ) -> None:
+        """
+
+        Args:
+            filename: path of the active file, the segments are created next to it
+            max_bytes: size from which the active file is rotated
+            rotate_interval: seconds after which the active file is rotated, aligned to the epoch (e.g. 3600 rotates
+                at every full hour), if it is not empty
+            compression: "gzip", "zstd" or None to keep the segments uncompressed
+            max_total_bytes: the oldest segments are deleted while all files of the handler are larger
+            close_timeout: seconds to wait for pending compressions when the handler is closed, the rest is
+                compressed after the next start
+            level: level of the handler
+        """
+        super().__init__(level)
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression {compression!r}, use one of {sorted(COMPRESSION_SUFFIXES)}.")
+        if compression == "zstd" and not _zstd_available():
+            raise ValueError("zstd compression requires the zstandard package (or python 3.14).")
+        self.filename: str = os.path.abspath(filename)
+        self.max_bytes: int = max_bytes
+        self.rotate_interval: Optional[float] = rotate_interval
+        self.compression: Optional[str] = compression
+        self.max_total_bytes: Optional[int] = max_total_bytes
+        self.close_timeout: float = close_timeout
+
+        self.directory: str
+        self.directory, name = os.path.split(self.filename)
+        self.stem: str
+        self.suffix: str
+        self.stem, self.suffix = os.path.splitext(name)
+        self._segment_pattern: "re.Pattern[str]" = re.compile(
+            rf"{re.escape(self.stem)}\.\d{{8}}T\d{{6}}-\d+{re.escape(self.suffix)}(\.gz|\.zst)?"
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._fd: Optional[int] = None
+        self._size: int = 0
+        self._rotate_at: float = float("inf")
+        self._last_segment: Tuple[str, int] = ("", 0)
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._open()
+        # compressions and segments left by an earlier process
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp") and self._segment_pattern.fullmatch(name[:-4]):
+                os.unlink(os.path.join(self.directory, name))
+        for segment in self.segments():
+            if self.needs_processing(segment):
+                self._process(segment)
+
+    def encode(self, record: logging.LogRecord) -> bytes:
+        """The bytes of a record in the file."""
+        raise NotImplementedError
+
+    def fields(self, record: logging.LogRecord) -> Dict[str, Any]:
+        """The fields of the message of a record.
+
+        These are the items of a dict message or of an event, otherwise the formatted message. A formatter which
+        returns dicts (e.g. FluentRecordFormatter) replaces the fields of the message, one which returns strings the
+        message. The traceback of an exception is added as "exception".
+        """
+        data: Dict[str, Any]
+        msg: Any = record.msg
+        if self.formatter is not None:
+            formatted: Any = self.format(record)
+            data = dict(formatted) if isinstance(formatted, dict) else {"message": formatted}
+        elif isinstance(msg, dict):
+            data = {key: value for key, value in msg.items() if isinstance(key, str)}
+        elif isinstance(msg, Event):
+            data = dict(msg.items())
+        else:
+            data = {"message": record.getMessage()}
+        if record.exc_info and "exception" not in data:
+            data["exception"] = logging.Formatter().formatException(record.exc_info)
+        return data
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data: bytes = self.encode(record)
+            self.prepare(len(data), record.created)
+            self._write(data)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, size: int, created: float) -> None:
+        """Open the active file or rotate it before a record of size bytes is written."""
+        if self._fd is None:
+            self._open()
+        elif self._size and (self._size + size > self.max_bytes or created >= self._rotate_at):
+            self.rotate()
+
+    def _write(self, data: bytes) -> None:
+        assert self._fd is not None
+        view: memoryview = memoryview(data)
+        while view:
+            written: int = os.write(self._fd, view)
+            view = view[written:]
+        self._size += len(data)
+
+    def _open(self) -> None:
+        """Open the active file for appending."""
+        self._fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        if self.rotate_interval:
+            self._rotate_at = (time.time() // self.rotate_interval + 1) * self.rotate_interval
+
+    def rotate(self) -> Optional[str]:
+        """Rename the active file to a new segment and open a new active file.
+
+        Returns:
+            the path of the segment, None if the active file was empty
+        """
+        self.acquire()
+        try:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            segment: Optional[str] = None
+            if os.path.exists(self.filename) and os.path.getsize(self.filename):
+                segment = self._segment_name()
+                os.rename(self.filename, segment)
+                self.segment_closed(segment)
+            self._open()
+            return segment
+        finally:
+            self.release()
+
+    def segment_closed(self, segment: str) -> None:
+        """Called in the logging thread with a segment which was just rotated, hands it to the background thread."""
+        self._process(segment)
+
+    def _segment_name(self) -> str:
+        timestamp: str = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+        # the names of the segments sort in the order of their records, also when the retention deleted the first
+        # segments of a second
+        sequence: int = self._last_segment[1] + 1 if self._last_segment[0] == timestamp else 0
+        while True:
+            name: str = os.path.join(self.directory, f"{self.stem}.{timestamp}-{sequence:03d}{self.suffix}")
+            if not any(os.path.exists(name + suffix) for suffix in ("", *COMPRESSION_SUFFIXES.values())):
+                self._last_segment = (timestamp, sequence)
+                return name
+            sequence += 1
+
+    def segments(self) -> List[str]:
+        """The paths of the segments from the oldest to the newest, compressed or not."""
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if self._segment_pattern.fullmatch(name)
+        ]
+
+    def needs_processing(self, segment: str) -> bool:
+        """Whether a segment found when the handler is created was not processed by an earlier process."""
+        return self.compression is not None and not segment.endswith(tuple(COMPRESSION_SUFFIXES.values()))
+
+    def process_segment(self, segment: str) -> None:
+        """Called in the background thread with a closed segment, compresses it."""
+        if self.compression is not None and os.path.exists(segment):
+            compress_file(segment, self.compression)
+
+    def delete_segment(self, segment: str) -> None:
+        """Called in the background thread with a segment which is deleted by the retention."""
+        os.unlink(segment)
+
+    def _process(self, segment: str) -> None:
+        """Queue a closed segment for processing and retention in the background thread."""
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._work, name=f"ondewo-logging-segments-{self.stem}", daemon=True,
+            )
+            self._worker.start()
+        self._queue.put(segment)
+
+    def _work(self) -> None:
+        while True:
+            segment: Any = self._queue.get()
+            if segment is self._STOP:
+                return
+            try:
+                self.process_segment(segment)
+                self.apply_retention()
+            except Exception:
+                logging.getLogger(__name__).exception("Could not process the log segment %s.", segment)
+
+    def apply_retention(self) -> List[str]:
+        """Delete the oldest segments while all files of the handler are larger than max_total_bytes.
+
+        Returns:
+            the deleted segments
+        """
+        if self.max_total_bytes is None:
+            return []
+        sizes: List[Tuple[str, int]] = []
+        for segment in self.segments():
+            try:
+                sizes.append((segment, os.path.getsize(segment)))
+            except OSError:
+                pass
+        total: int = self._size + sum(size for _, size in sizes)
+        deleted: List[str] = []
+        for segment, size in sizes:
+            if total <= self.max_total_bytes:
+                break
+            try:
+                self.delete_segment(segment)
+            except OSError:
+                continue
+            deleted.append(segment)
+            total -= size
+        return deleted
+
+    def flush(self) -> None:
+        """The records are written to the file when they are handled."""
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            worker: Optional[threading.Thread] = self._worker
+            self._worker = None
+        finally:
+            self.release()
+        if worker is not None:
+            self._queue.put(self._STOP)
+            worker.join(self.close_timeout)
+        super().close()
+
+
+class JsonLinesFileHandler(SegmentedFileHandler):
+    """Writes each record as a JSON object on a line, see SegmentedFileHandler for the arguments.
+
+    The object has the time (ISO 8601 in UTC), level and logger of the record and the fields of its message. Events
+    are encoded with Event.to_json, without building a dict.
+    """
+
+    def encode(self, record: logging.LogRecord) -> bytes:
+        data: Dict[str, Any] = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="microseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        msg: Any = record.msg
+        if self.formatter is None and isinstance(msg, Event) and not record.exc_info:
+            # the fields of the event follow, and override the keys of the record like in data.update
+            return (json.dumps(data, ensure_ascii=False)[:-1] + ", " + msg.to_json()[1:] + "\n").encode("utf-8")
+        data.update(self.fields(record))
+        return (json.dumps(data, ensure_ascii=False, default=str) + "\n").encode("utf-8")
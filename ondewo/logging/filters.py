@@ -12,16 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+import re
+import time
+from collections import (
+    OrderedDict,
+    deque,
+)
 from copy import deepcopy
 from logging import (
     Filter,
     LogRecord,
 )
-from threading import get_ident
+from threading import (
+    Lock,
+    Timer,
+    get_ident,
+)
 from typing import (
     Any,
+    Callable,
     Dict,
+    Hashable,
+    List,
     Optional,
+    Tuple,
+)
+
+from ondewo.logging.constants import (
+    BUFFER_DROPPED,
+    SUPPRESSED,
+)
+from ondewo.logging.events import Event
+from ondewo.logging.lazy import (
+    Lazy,
+    is_lazy,
+    resolve_message,
 )
 
 
@@ -44,7 +70,8 @@ class ThreadContextFilter(Filter):
     def filter(self, record: LogRecord) -> bool:
         """Add the context information to the log record if it comes from the same thread.
 
-        NOTE: message from the log record is first copied and only then updated with the context info
+        NOTE: message from the log record is first copied and only then updated with the context info (events are
+        copied without their fields). Lazy messages stay lazy, the context info is added when they are evaluated.
 
         Args:
             record: log record with log message and thread ID and name
@@ -52,11 +79,26 @@ class ThreadContextFilter(Filter):
         Returns:
             True if the record should be eventually logged (always)
         """
-        if self._is_thread_id_equal(record=record) and isinstance(record.msg, dict):
-            record.msg = deepcopy(record.msg)
-            record.msg.update(self.context_dict)
+        if self._is_thread_id_equal(record=record):
+            if isinstance(record.msg, dict):
+                record.msg = deepcopy(record.msg)
+                record.msg.update(self.context_dict)
+            elif isinstance(record.msg, Event):
+                record.msg = record.msg.with_context(self.context_dict)
+            elif is_lazy(record.msg):
+                record.msg = Lazy(self._add_context, record.msg, self.context_dict)
         return True
 
+    @staticmethod
+    def _add_context(msg: Any, context_dict: Dict[str, Any]) -> Any:
+        """Evaluate the lazy message and add the context information if it is a dict."""
+        msg = resolve_message(msg)
+        if isinstance(msg, dict):
+            return {**msg, **context_dict}
+        if isinstance(msg, Event):
+            return msg.with_context(context_dict)
+        return msg
+
     def _is_thread_id_equal(self, record: LogRecord) -> bool:
         """Check if the record thread is equal to the thread, where this filter was initialized.
 
@@ -74,3 +116,395 @@ class ThreadContextFilter(Filter):
         return (
             record.thread == self.thread_id or str(self.thread_id) in record.threadName  # type:ignore
         )
+
+
+class BufferingContextFilter(ThreadContextFilter):
+    """Add context information to the records of the current thread, and hold back their low level records.
+
+    Records up to buffer_level (DEBUG and INFO by default) which are below the level of their logger are kept in a
+    bounded ring buffer instead of being logged; records which pass the level of their logger are logged as usual.
+    A record of flush_level or above (ERROR by default) first flushes the buffered records in full, so the debug trail
+    leading up to the error is logged. Discarding the buffer costs nothing; lazy messages of buffered records are only
+    evaluated when they are flushed.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        context_dict: Optional[Dict[str, Any]] = None,
+        capacity: int = 1000,
+        buffer_level: int = logging.INFO,
+        flush_level: int = logging.ERROR,
+        emit: Optional[Callable[[LogRecord], Any]] = None,
+    ) -> None:
+        """
+
+        Args:
+            name: filter name (see the superclass for description)
+            context_dict: optional dictionary with context information
+            capacity: maximal number of buffered records, the oldest ones are dropped
+            buffer_level: records up to this level are buffered
+            flush_level: records from this level on flush the buffer
+            emit: called with each flushed record (by default the handlers of the record's logger are called)
+        """
+        super().__init__(name=name, context_dict=context_dict)
+        self.buffer_level: int = buffer_level
+        self.flush_level: int = flush_level
+        self.buffer: "deque[LogRecord]" = deque(maxlen=capacity)
+        self.dropped: int = 0
+        self.emit: Callable[[LogRecord], Any] = emit or self._call_handlers
+
+    def filter(self, record: LogRecord) -> bool:
+        """Buffer the low level records of the thread, and flush the buffer before an error record.
+
+        Args:
+            record: log record with log message and thread ID and name
+
+        Returns:
+            False if the record was buffered
+        """
+        if not self._is_thread_id_equal(record=record):
+            return True
+        super().filter(record)
+        if record.levelno >= self.flush_level:
+            self.flush()
+        elif record.levelno <= self.buffer_level and record.levelno < self._logger_level(record):
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(record)
+            return False
+        return True
+
+    def flush(self) -> None:
+        """Log the buffered records, preceded by a note if records were dropped."""
+        records: List[LogRecord] = list(self.buffer)
+        self.buffer.clear()
+        if self.dropped and records:
+            note: LogRecord = logging.makeLogRecord(records[0].__dict__)
+            note.msg = {"message": BUFFER_DROPPED.format(self.dropped), "dropped": self.dropped, "tags": ["buffer"]}
+            note.args = None
+            records.insert(0, note)
+        self.dropped = 0
+        for record in records:
+            record.msg = resolve_message(record.msg)
+            self.emit(record)
+
+    def discard(self) -> None:
+        """Drop the buffered records."""
+        self.buffer.clear()
+        self.dropped = 0
+
+    @staticmethod
+    def _logger_level(record: LogRecord) -> int:
+        return logging.getLogger(record.name).getEffectiveLevel()
+
+    @staticmethod
+    def _call_handlers(record: LogRecord) -> None:
+        # the filters of the logger already saw the record
+        logging.getLogger(record.name).callHandlers(record)
+
+
+class DeduplicationFilter(Filter):
+    """This filter rate-limits identical log records, e.g. the exception storm of a failing dependency.
+
+    Records are identified by logger name, level and either the message template or the call site. Within each
+    time window the first ``burst`` records of an identity pass, the rest are suppressed. When the next record of
+    that identity arrives after the window has expired, a single summary record with the suppressed count is
+    emitted before it. If no such record arrives, a timer emits the summary when the window has expired, so the
+    suppressed counts are reported also after the storm stopped.
+
+    The number of tracked identities is capped by ``max_keys`` (least recently seen identities are evicted), so the
+    per-record cost is a constant number of dictionary operations.
+    """
+
+    SUMMARY_ATTRIBUTE: str = "deduplication_summary"
+
+    def __init__(
+        self,
+        name: str = "",
+        window: float = 10.0,
+        burst: int = 10,
+        key: str = "message",
+        max_keys: int = 1024,
+        emit: Optional[Callable[[LogRecord], None]] = None,
+    ) -> None:
+        """
+
+        Args:
+            name: filter name (see the superclass for description)
+            window: length of the time window in seconds
+            burst: number of identical records which pass per window
+            key: "message" to identify records by their message template, "call_site" to identify them by the
+                path and line number they were logged from
+            max_keys: maximal number of tracked record identities
+            emit: optional callable receiving the summary records (by default they are handled by the logger
+                of the suppressed records)
+        """
+        super().__init__(name=name)
+        if key not in ("message", "call_site"):
+            raise ValueError(f"Unknown deduplication key {key!r}, expected 'message' or 'call_site'.")
+        self.window: float = window
+        self.burst: int = burst
+        self.key: str = key
+        self.max_keys: int = max_keys
+        self.emit: Callable[[LogRecord], None] = emit or self._emit_to_logger
+        # identity -> [window start, passed count, suppressed count, last suppressed record]
+        self._windows: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+        self._lock: Lock = Lock()
+        # armed while records are suppressed, fires when the first window with suppressed records expires
+        self._timer: Optional[Timer] = None
+
+    def filter(self, record: LogRecord) -> bool:
+        """Pass the first records of each identity per window and suppress the rest.
+
+        Args:
+            record: log record with log message
+
+        Returns:
+            True if the record should be eventually logged
+        """
+        if getattr(record, self.SUMMARY_ATTRIBUTE, False):
+            return True
+
+        identity: Hashable = self._identity(record=record)
+        summaries: List[Tuple[LogRecord, int, float]] = []
+        with self._lock:
+            state: Optional[List[Any]] = self._windows.get(identity)
+            if state is None:
+                state = [record.created, 0, 0, None]
+                self._windows[identity] = state
+                if len(self._windows) > self.max_keys:
+                    _, evicted = self._windows.popitem(last=False)
+                    if evicted[2]:
+                        summaries.append((evicted[3], evicted[2], record.created - evicted[0]))
+            else:
+                self._windows.move_to_end(identity)
+                if record.created - state[0] >= self.window:
+                    if state[2]:
+                        summaries.append((state[3], state[2], record.created - state[0]))
+                    state[0], state[1], state[2], state[3] = record.created, 0, 0, None
+
+            if state[1] < self.burst:
+                state[1] += 1
+                passed = True
+            else:
+                state[2] += 1
+                state[3] = record
+                passed = False
+                if self._timer is None:
+                    self._schedule(state[0] + self.window - time.time())
+
+        for suppressed_record, count, elapsed in summaries:
+            self.emit(self._make_summary(record=suppressed_record, count=count, elapsed=elapsed))
+        return passed
+
+    def flush(self) -> None:
+        """Emit the summary records of all windows with suppressed records and reset them."""
+        with self._lock:
+            pending: List[List[Any]] = [state for state in self._windows.values() if state[2]]
+            self._windows.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for state in pending:
+            self.emit(self._make_summary(record=state[3], count=state[2], elapsed=state[3].created - state[0]))
+
+    def _schedule(self, delay: float) -> None:
+        """Arm the timer of the expired windows, the lock must be held."""
+        self._timer = Timer(max(delay, 0.0), self._flush_expired)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_expired(self) -> None:
+        """Emit the summary records of the expired windows with suppressed records, called by the timer."""
+        now: float = time.time()
+        summaries: List[Tuple[LogRecord, int, float]] = []
+        with self._lock:
+            self._timer = None
+            next_expiry: Optional[float] = None
+            for state in self._windows.values():
+                if not state[2]:
+                    continue
+                if now - state[0] >= self.window:
+                    summaries.append((state[3], state[2], state[3].created - state[0]))
+                    # records of the expired window which arrive later are counted for a new summary
+                    state[2], state[3] = 0, None
+                elif next_expiry is None or state[0] + self.window < next_expiry:
+                    next_expiry = state[0] + self.window
+            if next_expiry is not None:
+                self._schedule(next_expiry - now)
+        for suppressed_record, count, elapsed in summaries:
+            self.emit(self._make_summary(record=suppressed_record, count=count, elapsed=elapsed))
+
+    def _identity(self, record: LogRecord) -> Hashable:
+        """Build the hashable identity of the record."""
+        if self.key == "call_site":
+            return record.name, record.levelno, record.pathname, record.lineno
+        return record.name, record.levelno, self._template(record=record)
+
+    @staticmethod
+    def _template(record: LogRecord) -> str:
+        """The message template of the record, the template id of events and the call site of lazy messages."""
+        if is_lazy(record.msg):
+            return f"{record.pathname}:{record.lineno}"
+        if isinstance(record.msg, dict):
+            return str(record.msg.get("message"))
+        if isinstance(record.msg, Event):
+            return record.msg.template_id
+        return str(record.msg)
+
+    def _make_summary(self, record: LogRecord, count: int, elapsed: float) -> LogRecord:
+        """Create the summary record from the last suppressed record of a window."""
+        summary: LogRecord = logging.makeLogRecord(record.__dict__)
+        summary.msg = {
+            "message": SUPPRESSED.format(count, self._template(record=record), elapsed),
+            "suppressed_count": count,
+            "tags": ["deduplication"],
+        }
+        summary.args = None
+        summary.exc_info = None
+        summary.exc_text = None
+        setattr(summary, self.SUMMARY_ATTRIBUTE, True)
+        return summary
+
+    @staticmethod
+    def _emit_to_logger(record: LogRecord) -> None:
+        """Hand the record to the logger it was originally logged with."""
+        logging.getLogger(record.name).handle(record)
+
+
+class RedactionFilter(Filter):
+    """This filter masks personal data and secrets (e-mail addresses, phone numbers, tokens, IBANs) in log records.
+
+    All patterns are combined into a single regular expression, so each string is scanned once no matter how many
+    patterns are configured; the named group of a match tells which pattern matched. Dict, list and tuple messages
+    (e.g. the flattened gRPC messages of CustomLogger.grpc), events and the arguments of the record are walked
+    recursively and only copied where something was redacted, lazy messages are redacted when they are evaluated.
+    The results for short strings are cached, so values which were already scanned (e.g. repeated in many records) are
+    not scanned again, and a record which passes several redaction filters is only redacted by the first one.
+    """
+
+    REDACTED_ATTRIBUTE: str = "redacted"
+
+    # name -> regular expression, which must not contain named groups
+    PATTERNS: Dict[str, str] = {
+        "email": r"[\w.%+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}",
+        "token": (
+            r"(?i:bearer)\s+[\w.~+/-]+=*"
+            r"|eyJ[\w-]+\.[\w-]+\.[\w-]*"
+            r"|(?:sk|pk|rk|ghp|gho|ghs|xox[abpr])[-_][\w-]{16,}"
+        ),
+        "iban": r"[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b",
+        # international numbers (+43 664 1234567, 0043-664-1234567) and national numbers with a separator after the
+        # area code (0664 1234567, 01/234 56 78), both with at least 8 digits (without the 00 prefix), so durations
+        # (01 2345) and short numbers are not matched; neither are month/year dates (03/2024), times or plain numbers
+        "phone": (
+            r"(?:\+|00)(?=(?:[ ./()-]*\d){8})\d{1,3}(?:[ ./-]?\(?\d{1,5}\)?){2,5}(?![\w.])"
+            r"|0(?=(?:[ /-]?\d){7})(?![1-9]/(?:19|20)\d\d(?!\d))\d{1,4}[ /]\d{3,}(?:[ -]\d{2,})*(?![\w.:/-])"
+        ),
+    }
+
+    # matches of the default patterns start at the beginning of a word, checking this once before trying the patterns
+    # makes the scan several times faster than trying all patterns at every character
+    BOUNDARY: str = r"(?<![\w.%+-])"
+
+    def __init__(
+        self,
+        name: str = "",
+        patterns: Optional[Dict[str, str]] = None,
+        replacement: str = "<redacted {}>",
+        boundary: Optional[str] = None,
+        cache_size: int = 4096,
+        max_cached_length: int = 1024,
+    ) -> None:
+        """
+
+        Args:
+            name: filter name (see the superclass for description)
+            patterns: optional regular expressions by name (by default PATTERNS)
+            replacement: replaces a match, formatted with the name of the pattern
+            boundary: optional regular expression which must match before any of the patterns (by default BOUNDARY),
+                "" for patterns which may start anywhere
+            cache_size: maximal number of cached strings (the cache is emptied when it is full)
+            max_cached_length: longer strings are not cached
+        """
+        super().__init__(name=name)
+        self.patterns: Dict[str, str] = dict(self.PATTERNS if patterns is None else patterns)
+        self.boundary: str = self.BOUNDARY if boundary is None else boundary
+        alternatives: str = "|".join(f"(?P<{key}>{value})" for key, value in self.patterns.items())
+        self.pattern: "re.Pattern[str]" = re.compile(f"{self.boundary}(?:{alternatives})")
+        self._replacements: Dict[str, str] = {key: replacement.format(key) for key in self.patterns}
+        self.cache_size: int = cache_size
+        self.max_cached_length: int = max_cached_length
+        # string -> redacted string (the same object if nothing was redacted)
+        self._cache: Dict[str, str] = {}
+
+    def filter(self, record: LogRecord) -> bool:
+        """Redact the message and the arguments of the record.
+
+        Args:
+            record: log record
+
+        Returns:
+            True if the record should be eventually logged (always)
+        """
+        if getattr(record, self.REDACTED_ATTRIBUTE, False):
+            return True
+        record.msg = self.redact(record.msg)
+        if record.args:
+            record.args = self.redact(record.args)
+        record.__dict__[self.REDACTED_ATTRIBUTE] = True
+        return True
+
+    def redact(self, value: Any) -> Any:
+        """Redact a string or the strings in a (nested) dict, list, tuple or event.
+
+        Args:
+            value: the value to redact
+
+        Returns:
+            the value itself if nothing was redacted, otherwise a redacted copy
+        """
+        if isinstance(value, str):
+            return self._redact_string(value)
+        if isinstance(value, dict):
+            redacted: Optional[Dict[Any, Any]] = None
+            for key, item in value.items():
+                new_item: Any = self.redact(item)
+                if new_item is not item:
+                    if redacted is None:
+                        redacted = dict(value)
+                    redacted[key] = new_item
+            return value if redacted is None else redacted
+        if isinstance(value, (list, tuple)):
+            items: List[Any] = [self.redact(item) for item in value]
+            if all(new_item is item for new_item, item in zip(items, value)):
+                return value
+            return tuple(items) if isinstance(value, tuple) else items
+        if isinstance(value, Event):
+            values: Tuple[Any, ...] = value.values()
+            new_values: List[Any] = [self.redact(item) for item in values]
+            context: Any = self.redact(value.context)
+            if context is value.context and all(new_item is item for new_item, item in zip(new_values, values)):
+                return value
+            return type(value)(*new_values, context=context)
+        if is_lazy(value):
+            return Lazy(self._redact_lazy, value)
+        return value
+
+    def _redact_lazy(self, value: Any) -> Any:
+        return self.redact(resolve_message(value))
+
+    def _redact_string(self, value: str) -> str:
+        redacted: Optional[str] = self._cache.get(value)
+        if redacted is not None:
+            return redacted
+        redacted = self.pattern.sub(self._replace, value)
+        if len(value) <= self.max_cached_length:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[value] = redacted
+        return redacted
+
+    def _replace(self, match: "re.Match[str]") -> str:
+        return self._replacements[match.lastgroup]  # type: ignore
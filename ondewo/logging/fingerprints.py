@@ -0,0 +1,104 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import time
+import traceback
+from collections import OrderedDict
+from threading import Lock
+from types import TracebackType
+from typing import (
+    Any,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+class ExceptionFingerprinter:
+    """Identify recurring exceptions and render their traceback only once per time window.
+
+    The fingerprint is a hash of the exception type and the code locations (file, function, line) of the traceback
+    frames, so it is stable across processes and does not depend on the exception message. Rendering a traceback is
+    expensive, so it is only done for the first occurrence of a fingerprint within a window; later occurrences are
+    reported by fingerprint and count.
+    """
+
+    def __init__(self, window: float = 60.0, max_keys: int = 1024) -> None:
+        """
+
+        Args:
+            window: length of the time window in seconds (0 renders every traceback)
+            max_keys: maximal number of tracked fingerprints, the least recently seen ones are evicted
+        """
+        self.window: float = window
+        self.max_keys: int = max_keys
+        # fingerprint -> [window start, count]
+        self._windows: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._lock: Lock = Lock()
+
+    @staticmethod
+    def fingerprint(exc_type: Any, exc_tb: Optional[TracebackType]) -> str:
+        """Hash the exception type and the code locations of the traceback frames.
+
+        Args:
+            exc_type: type of the exception
+            exc_tb: traceback of the exception
+
+        Returns:
+            hex digest identifying the exception
+        """
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(f"{getattr(exc_type, '__module__', '')}.{getattr(exc_type, '__qualname__', exc_type)}".encode())
+        for frame, lineno in traceback.walk_tb(exc_tb):
+            code = frame.f_code
+            digest.update(f"|{code.co_filename}:{code.co_name}:{lineno}".encode())
+        return digest.hexdigest()
+
+    def observe(
+        self,
+        exc_type: Any,
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> Tuple[str, int, Optional[str]]:
+        """Count an occurrence of the exception and render its traceback if it is the first one in the window.
+
+        Args:
+            exc_type: type of the exception
+            exc_val: the exception
+            exc_tb: traceback of the exception
+
+        Returns:
+            the fingerprint, the number of occurrences in the current window and the rendered traceback (None if the
+            fingerprint was already seen in the window)
+        """
+        fingerprint: str = self.fingerprint(exc_type, exc_tb)
+        now: float = time.monotonic()
+        with self._lock:
+            state: Optional[List[Any]] = self._windows.get(fingerprint)
+            if state is None or now - state[0] >= self.window:
+                state = [now, 0]
+                self._windows[fingerprint] = state
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end(fingerprint)
+            state[1] += 1
+            count: int = state[1]
+
+        if count > 1:
+            return fingerprint, count, None
+        return fingerprint, count, "".join(traceback.format_exception(exc_type, exc_val, exc_tb))
+
+
+fingerprinter: ExceptionFingerprinter = ExceptionFingerprinter()
@@ -0,0 +1,192 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The fluent handlers and formatter of fluent-logger, extended with the sender pool of ondewo.logging.senders.
+
+This module imports fluent-logger, it is imported by ondewo.logging.handlers when one of its classes is first used
+(e.g. by the default logging config), so importing ondewo.logging.handlers alone stays cheap.
+"""
+
+import logging
+import sys
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from fluent import (
+    asynchandler,
+    handler,
+)
+
+from ondewo.logging.events import Event
+from ondewo.logging.senders import (
+    PooledSender,
+    sender_pool,
+)
+
+
+class FluentRecordFormatter(handler.FluentRecordFormatter):
+    """The FluentRecordFormatter of fluent-logger, which also merges the fields of events into the record.
+
+    String messages are only parsed as json if they look like a json object, the only json which can be merged.
+    """
+
+    def _structuring(self, data: Dict[str, Any], record: logging.LogRecord) -> None:
+        if isinstance(record.msg, Event):
+            data.update(record.msg.items())
+            return
+        super()._structuring(data, record)
+
+    def _format_msg_json(self, record: logging.LogRecord, msg: Any) -> Dict[str, Any]:
+        if not str(msg).lstrip().startswith("{"):
+            return self._format_msg_default(record, msg)  # type: ignore
+        return super()._format_msg_json(record, msg)  # type: ignore
+
+
+class FluentHandler(handler.FluentHandler):
+    """The FluentHandler of fluent-logger, sending through the process-wide sender pool (ondewo.logging.senders).
+
+    All handlers sending to the same host and port with the same settings share one connection, which the handler
+    holds from its creation until it is closed. The host can also be unix:// followed by the path of a unix domain
+    socket of a node-local fluentd or fluent bit. The records are sent from the logging thread.
+    """
+
+    _sender: Optional[PooledSender]
+
+    def __init__(self, tag: str, **kwargs: Any) -> None:
+        super().__init__(tag, **kwargs)
+        # hold the connection of the pool, so it isn't closed while other handlers of the endpoint come and go
+        self.sender
+
+    def getSenderInstance(  # type: ignore
+        self,
+        tag: str,
+        host: str,
+        port: int,
+        timeout: float,
+        verbose: bool,
+        buffer_overflow_handler: Any,
+        msgpack_kwargs: Optional[Dict[str, Any]],
+        nanosecond_precision: bool,
+        **kwargs: Any,
+    ) -> PooledSender:
+        return sender_pool.acquire(
+            host=host,
+            port=port,
+            timeout=timeout,
+            verbose=verbose,
+            buffer_overflow_handler=buffer_overflow_handler,
+            msgpack_kwargs=msgpack_kwargs,
+            nanosecond_precision=nanosecond_precision,
+            **kwargs,
+        )
+
+    @property
+    def sender(self) -> PooledSender:
+        return super().sender  # type: ignore
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.sender.send(tag=self.tag, created=record.created, data=self.format(record))
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            try:
+                if self._sender is not None:
+                    # the connection is closed by the pool once no other handler uses it
+                    sender_pool.release(self._sender)
+                    self._sender = None
+            finally:
+                logging.Handler.close(self)
+        finally:
+            self.release()
+
+
+class AsyncFluentHandler(FluentHandler, asynchandler.FluentHandler):
+    """The asynchronous FluentHandler of fluent-logger, sending through the sender pool from a background thread.
+
+    The records are formatted in the logging thread and queued. The background thread of the pooled sender is started
+    with the first record and sends the records of all handlers of the endpoint in batches. If the queue is full, the
+    logging thread blocks unless queue_circular is set, in which case the oldest record is discarded.
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        host: str = "localhost",
+        port: int = 24224,
+        queue_maxsize: int = 100,
+        queue_circular: bool = False,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            tag, host=host, port=port, queue_maxsize=queue_maxsize, queue_circular=queue_circular, **kwargs,
+        )
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.sender.emit(tag=self.tag, created=record.created, data=self.format(record))
+
+
+class AsyncioFluentHandler(AsyncFluentHandler):
+    """Logging handler for asyncio services, sending the records logged in an event loop through that loop.
+
+    A record logged while an event loop is running in the logging thread is packed right away and written by the
+    LoopSender of the loop (see ondewo.logging.senders) in one batch with the other records of the same iteration of
+    the loop, through a non-blocking transport. It doesn't cross a thread boundary, and handle() skips the lock of the
+    handler for it, since the LoopSender is only used from the thread of its loop. Records logged without a running
+    loop take the threaded path of AsyncFluentHandler under the lock of the handler, like with any other handler.
+    """
+
+    def handle(self, record: logging.LogRecord) -> Any:
+        # like logging.Handler.handle, but without the lock on the loop path, where the records of other threads
+        # would contend on it
+        filtered: Any = self.filter(record)
+        if filtered:
+            if isinstance(filtered, logging.LogRecord):
+                record = filtered
+            loop: Any = self._running_loop()
+            if loop is None:
+                self.acquire()
+                try:
+                    super().emit(record)
+                finally:
+                    self.release()
+            else:
+                self._emit_to_loop(record=record, loop=loop)
+        return filtered
+
+    def emit(self, record: logging.LogRecord) -> None:
+        loop: Any = self._running_loop()
+        if loop is None:
+            super().emit(record)
+        else:
+            self._emit_to_loop(record=record, loop=loop)
+
+    @staticmethod
+    def _running_loop() -> Any:
+        """The event loop running in this thread, if any."""
+        # a loop can only run if asyncio was imported, which the handler therefore doesn't do itself
+        asyncio: Any = sys.modules.get("asyncio")
+        if asyncio is not None:
+            try:
+                return asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        return None
+
+    def _emit_to_loop(self, record: logging.LogRecord, loop: Any) -> None:
+        self.sender.loop_sender(loop).emit(tag=self.tag, created=record.created, data=self.format(record))
@@ -0,0 +1,192 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Logging handlers for fluentd, and buffered handlers for streams and files.
+
+The fluent handlers and formatter (FluentRecordFormatter, FluentHandler, AsyncFluentHandler and AsyncioFluentHandler)
+are the ones of the fluent-logger package, extended to share the connections of the sender pool; see
+ondewo.logging.fluent_handlers. They are loaded when they are first used, so importing this module doesn't import
+fluent-logger and msgpack.
+
+BufferedStreamHandler and BufferedFileHandler write the formatted lines of many records with one write and flush.
+"""
+
+import logging
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    List,
+    Optional,
+)
+
+from ondewo.logging.reconfigure import to_level
+
+if TYPE_CHECKING:
+    from ondewo.logging.fluent_handlers import (  # noqa: F401
+        AsyncFluentHandler,
+        AsyncioFluentHandler,
+        FluentHandler,
+        FluentRecordFormatter,
+    )
+
+FLUENT_CLASSES: List[str] = ["FluentRecordFormatter", "FluentHandler", "AsyncFluentHandler", "AsyncioFluentHandler"]
+
+
+def __getattr__(name: str) -> Any:
+    """Load the fluent handlers and formatter when they are first used."""
+    if name in FLUENT_CLASSES:
+        from ondewo.logging import fluent_handlers
+
+        return getattr(fluent_handlers, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler collecting the formatted lines and writing them with one write and flush.
+
+    A plain StreamHandler flushes its stream after every record, which dominates at high rates. The buffered lines are
+    written when they reach capacity characters, flush_interval seconds after the first of them was buffered (by a
+    flusher thread of the handler, which is started with the first buffered line and runs until the handler is
+    closed) and right away with a record of flush_level or above, so the lines before an error are not lost if the
+    process crashes. The buffer is written when the handler is closed, which logging.shutdown does for all handlers
+    at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        stream: Any = None,
+        capacity: int = 1 << 16,
+        flush_interval: float = 0.5,
+        flush_level: Any = logging.WARNING,
+    ) -> None:
+        """
+
+        Args:
+            stream: the stream to write to, sys.stderr by default
+            capacity: number of buffered characters which are written right away
+            flush_interval: maximal number of seconds a line is buffered
+            flush_level: level from which a record is written right away, together with the buffered lines
+        """
+        super().__init__(stream)
+        self._init_buffer(capacity=capacity, flush_interval=flush_interval, flush_level=flush_level)
+
+    def _init_buffer(self, capacity: int, flush_interval: float, flush_level: Any) -> None:
+        self.capacity: int = capacity
+        self.flush_interval: float = flush_interval
+        self.flush_level: int = to_level(flush_level)
+        self._lines: List[str] = []
+        self._size: int = 0
+        # set when a line is buffered into the empty buffer, and when the handler is closed
+        self._buffered: threading.Event = threading.Event()
+        self._stop_flusher: threading.Event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line: str = self.format(record) + self.terminator
+            self._lines.append(line)
+            self._size += len(line)
+            if record.levelno >= self.flush_level or self._size >= self.capacity:
+                self.flush()
+            elif len(self._lines) == 1:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._flush_periodically, name="ondewo-logging-flusher", daemon=True,
+                    )
+                    self._flusher.start()
+                self._buffered.set()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _flush_periodically(self) -> None:
+        """Write the buffered lines flush_interval seconds after the first of them was buffered, until closed."""
+        while True:
+            self._buffered.wait()
+            self._buffered.clear()
+            if self._stop_flusher.wait(self.flush_interval):
+                return
+            try:
+                self.flush()
+            except Exception:
+                self.handleError(logging.makeLogRecord({"msg": "Timed flush of the buffered lines"}))
+
+    def flush(self) -> None:
+        """Write the buffered lines and flush the stream."""
+        self.acquire()
+        try:
+            if not self._lines:
+                return
+            text: str = "".join(self._lines)
+            self._lines.clear()
+            self._size = 0
+            stream: Any = self._buffered_stream()
+            stream.write(text)
+            if hasattr(stream, "flush"):
+                stream.flush()
+        finally:
+            self.release()
+
+    def _buffered_stream(self) -> Any:
+        """The stream the buffered lines are written to."""
+        return self.stream
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            # stops the flusher thread, the buffered lines are written here
+            self._stop_flusher.set()
+            self._buffered.set()
+            try:
+                self.flush()
+            finally:
+                super().close()
+        finally:
+            self.release()
+
+
+class BufferedFileHandler(BufferedStreamHandler, logging.FileHandler):
+    """FileHandler collecting the formatted lines and writing them with one write and flush, see BufferedStreamHandler.
+
+    With delay, the file is opened with the first write of buffered lines.
+    """
+
+    def __init__(
+        self,
+        filename: Any,
+        mode: str = "a",
+        encoding: Optional[str] = None,
+        delay: bool = False,
+        capacity: int = 1 << 16,
+        flush_interval: float = 0.5,
+        flush_level: Any = logging.WARNING,
+    ) -> None:
+        """
+
+        Args:
+            filename: path of the file, see logging.FileHandler for mode, encoding and delay
+            capacity: number of buffered characters which are written right away
+            flush_interval: maximal number of seconds a line is buffered
+            flush_level: level from which a record is written right away, together with the buffered lines
+        """
+        logging.FileHandler.__init__(self, filename, mode=mode, encoding=encoding, delay=delay)
+        self._init_buffer(capacity=capacity, flush_interval=flush_interval, flush_level=flush_level)
+
+    def _buffered_stream(self) -> Any:
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream
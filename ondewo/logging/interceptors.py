@@ -0,0 +1,553 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+gRPC interceptors which log the calls of servers and clients.
+
+Each finished call is logged as a GrpcRequest event (see ondewo.logging.events) at the GRPC level, with the method,
+status code, latency, request and response type, the serialized sizes of the messages and, for streams, the number of
+messages. The fields are read from the message objects, nothing is rendered to text and parsed again as with
+CustomLogger.grpc. The payloads are only added for a sampled fraction of the calls (payload_sample_rate) and rendered
+lazily, i.e. only if the record is handled:
+
+    server = grpc.server(executor, interceptors=[LoggingServerInterceptor()])
+    channel = grpc.intercept_channel(grpc.insecure_channel(address), LoggingClientInterceptor())
+
+    server = grpc.aio.server(interceptors=[AsyncLoggingServerInterceptor()])
+    channel = grpc.aio.insecure_channel(address, interceptors=async_logging_client_interceptors())
+
+If the GRPC level is disabled, the interceptors cost a single level check per call. grpcio is an optional dependency
+of ondewo-logging, it is only imported by this module.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+
+import grpc
+import grpc.aio
+
+from ondewo.logging.events import GrpcRequest
+from ondewo.logging.lazy import Lazy
+from ondewo.logging.logger import (
+    CustomLogger,
+    flatten_json,
+    logger_console,
+)
+from ondewo.logging.summarizers import summarizers
+
+
+def message_type(message: Any) -> str:
+    """The full name of a protobuf message type, otherwise the name of the python type."""
+    descriptor: Any = getattr(message, "DESCRIPTOR", None)
+    full_name: Any = getattr(descriptor, "full_name", None)
+    return full_name if isinstance(full_name, str) else type(message).__qualname__
+
+
+def message_size(message: Any) -> Optional[int]:
+    """The serialized size of a protobuf message or the length of a binary message, None for other messages."""
+    if isinstance(message, (bytes, bytearray)):
+        return len(message)
+    byte_size: Any = getattr(message, "ByteSize", None)
+    return byte_size() if callable(byte_size) else None
+
+
+def render_payload(message: Any, max_level: int = 3) -> Any:
+    """A protobuf message as a flattened dict (see flatten_json), other messages as their summary."""
+    if hasattr(message, "DESCRIPTOR"):
+        from google.protobuf.json_format import MessageToDict
+
+        rendered: Any = MessageToDict(message)
+        # well known types like wrappers are rendered to json values
+        return flatten_json(rendered, max_level) if isinstance(rendered, dict) else rendered
+    return summarizers.summarize(message, 10000)
+
+
+class _Messages:
+    """Type, total size and number of the request or response messages of a call."""
+
+    __slots__ = ("streaming", "count", "size", "type", "first")
+
+    def __init__(self, streaming: bool) -> None:
+        self.streaming: bool = streaming
+        self.count: int = 0
+        self.size: Optional[int] = None
+        self.type: Optional[str] = None
+        # the message of a unary call, which is the sampled payload
+        self.first: Any = None
+
+    def add(self, message: Any) -> Any:
+        if not self.count:
+            self.type = message_type(message)
+            self.first = None if self.streaming else message
+        self.count += 1
+        size: Optional[int] = message_size(message)
+        if size is not None:
+            self.size = (self.size or 0) + size
+        return message
+
+    def wrap(self, messages: Iterable[Any]) -> Iterator[Any]:
+        for message in messages:
+            yield self.add(message)
+
+    async def wrap_async(self, messages: Any) -> AsyncIterator[Any]:
+        if hasattr(messages, "__aiter__"):
+            async for message in messages:
+                yield self.add(message)
+        else:
+            for message in messages:
+                yield self.add(message)
+
+
+class _CountingContext:
+    """The context of a grpc.aio call, counting the responses which the servicer writes with context.write."""
+
+    __slots__ = ("_context", "_responses")
+
+    def __init__(self, context: Any, responses: _Messages) -> None:
+        self._context: Any = context
+        self._responses: _Messages = responses
+
+    async def write(self, message: Any) -> None:
+        await self._context.write(message)
+        self._responses.add(message)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._context, name)
+
+
+class CallLogger:
+    """Logs the finished calls of the interceptors as GrpcRequest events."""
+
+    def __init__(
+        self,
+        side: str,
+        logger: Optional[logging.Logger] = None,
+        level: int = CustomLogger.GRPC_LEVEL_NUM,
+        payload_sample_rate: float = 0.0,
+        max_level: int = 3,
+    ) -> None:
+        """
+
+        Args:
+            side: "server" or "client"
+            logger: the logger of the calls (by default logger_console)
+            level: the level of the records
+            payload_sample_rate: fraction of the calls whose request and response (of unary calls) are logged
+            max_level: the depth up to which the payloads are rendered (see flatten_json)
+        """
+        self.side: str = side
+        self.logger: logging.Logger = logger or logger_console
+        self.level: int = level
+        self.payload_sample_rate: float = payload_sample_rate
+        self.max_level: int = max_level
+
+    @property
+    def enabled(self) -> bool:
+        return self.logger.isEnabledFor(self.level)
+
+    def log(self, method: Any, code: Any, started: float, requests: _Messages, responses: _Messages) -> None:
+        """Log a finished call.
+
+        Args:
+            method: the full method name, e.g. /ondewo.nlu.Sessions/DetectIntent
+            code: the status code of the call
+            started: the start of the call (time.perf_counter)
+            requests: the request messages of the call
+            responses: the response messages of the call
+        """
+        duration: float = time.perf_counter() - started
+        context: Optional[Dict[str, Any]] = None
+        if self.payload_sample_rate and random.random() < self.payload_sample_rate:
+            context = {}
+            if requests.first is not None:
+                context["request"] = Lazy(render_payload, requests.first, self.max_level)
+            if responses.first is not None:
+                context["response"] = Lazy(render_payload, responses.first, self.max_level)
+        event: GrpcRequest = GrpcRequest(
+            method.decode() if isinstance(method, bytes) else method,
+            getattr(code, "name", code),
+            duration,
+            requests.type,
+            responses.type,
+            requests.size,
+            responses.size,
+            requests.count if requests.streaming else None,
+            responses.count if responses.streaming else None,
+            self.side,
+            context=context,
+        )
+        self.logger.log(self.level, event)
+
+
+def _server_code(context: Any, failed: bool) -> Any:
+    """The status code a servicer set, otherwise OK or UNKNOWN (for an exception)."""
+    code: Any = context.code()
+    if code is None or (code == grpc.StatusCode.OK and failed):
+        return grpc.StatusCode.UNKNOWN if failed else grpc.StatusCode.OK
+    return code
+
+
+class LoggingServerInterceptor(grpc.ServerInterceptor):
+    """Logs the calls of a (synchronous) grpc server, see the module documentation."""
+
+    def __init__(
+        self, logger: Optional[logging.Logger] = None, payload_sample_rate: float = 0.0, max_level: int = 3,
+    ) -> None:
+        self.call_logger: CallLogger = CallLogger(
+            side="server", logger=logger, payload_sample_rate=payload_sample_rate, max_level=max_level,
+        )
+
+    def intercept_service(self, continuation: Callable[[Any], Any], handler_call_details: Any) -> Any:
+        handler: Any = continuation(handler_call_details)
+        if handler is None or not self.call_logger.enabled:
+            return handler
+        method: str = handler_call_details.method
+        call_logger: CallLogger = self.call_logger
+
+        if handler.unary_unary:
+            return handler._replace(unary_unary=self._unary_unary(handler.unary_unary, method, call_logger))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=self._unary_stream(handler.unary_stream, method, call_logger))
+        if handler.stream_unary:
+            return handler._replace(stream_unary=self._stream_unary(handler.stream_unary, method, call_logger))
+        return handler._replace(stream_stream=self._stream_stream(handler.stream_stream, method, call_logger))
+
+    @staticmethod
+    def _unary_unary(behavior: Callable[..., Any], method: str, call_logger: CallLogger) -> Callable[..., Any]:
+        def logged(request: Any, context: Any) -> Any:
+            started: float = time.perf_counter()
+            requests: _Messages = _Messages(streaming=False)
+            responses: _Messages = _Messages(streaming=False)
+            requests.add(request)
+            failed: bool = True
+            try:
+                response: Any = responses.add(behavior(request, context))
+                failed = False
+                return response
+            finally:
+                call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+        return logged
+
+    @staticmethod
+    def _unary_stream(behavior: Callable[..., Any], method: str, call_logger: CallLogger) -> Callable[..., Any]:
+        def logged(request: Any, context: Any) -> Iterator[Any]:
+            started: float = time.perf_counter()
+            requests: _Messages = _Messages(streaming=False)
+            responses: _Messages = _Messages(streaming=True)
+            requests.add(request)
+            failed: bool = True
+            try:
+                yield from responses.wrap(behavior(request, context))
+                failed = False
+            finally:
+                call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+        return logged
+
+    @staticmethod
+    def _stream_unary(behavior: Callable[..., Any], method: str, call_logger: CallLogger) -> Callable[..., Any]:
+        def logged(request_iterator: Iterator[Any], context: Any) -> Any:
+            started: float = time.perf_counter()
+            requests: _Messages = _Messages(streaming=True)
+            responses: _Messages = _Messages(streaming=False)
+            failed: bool = True
+            try:
+                response: Any = responses.add(behavior(requests.wrap(request_iterator), context))
+                failed = False
+                return response
+            finally:
+                call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+        return logged
+
+    @staticmethod
+    def _stream_stream(behavior: Callable[..., Any], method: str, call_logger: CallLogger) -> Callable[..., Any]:
+        def logged(request_iterator: Iterator[Any], context: Any) -> Iterator[Any]:
+            started: float = time.perf_counter()
+            requests: _Messages = _Messages(streaming=True)
+            responses: _Messages = _Messages(streaming=True)
+            failed: bool = True
+            try:
+                yield from responses.wrap(behavior(requests.wrap(request_iterator), context))
+                failed = False
+            finally:
+                call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+        return logged
+
+
+class AsyncLoggingServerInterceptor(grpc.aio.ServerInterceptor):
+    """Logs the calls of a grpc.aio server, see the module documentation."""
+
+    def __init__(
+        self, logger: Optional[logging.Logger] = None, payload_sample_rate: float = 0.0, max_level: int = 3,
+    ) -> None:
+        self.call_logger: CallLogger = CallLogger(
+            side="server", logger=logger, payload_sample_rate=payload_sample_rate, max_level=max_level,
+        )
+
+    async def intercept_service(self, continuation: Callable[[Any], Any], handler_call_details: Any) -> Any:
+        handler: Any = await continuation(handler_call_details)
+        if handler is None or not self.call_logger.enabled:
+            return handler
+        method: str = handler_call_details.method
+        call_logger: CallLogger = self.call_logger
+
+        if handler.unary_unary:
+            return handler._replace(unary_unary=self._unary(handler.unary_unary, method, call_logger, False))
+        if handler.stream_unary:
+            return handler._replace(stream_unary=self._unary(handler.stream_unary, method, call_logger, True))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=self._stream(handler.unary_stream, method, call_logger, False))
+        return handler._replace(stream_stream=self._stream(handler.stream_stream, method, call_logger, True))
+
+    @staticmethod
+    def _unary(
+        behavior: Callable[..., Any], method: str, call_logger: CallLogger, streaming_requests: bool,
+    ) -> Callable[..., Any]:
+        async def logged(request: Any, context: Any) -> Any:
+            started: float = time.perf_counter()
+            requests: _Messages = _Messages(streaming=streaming_requests)
+            responses: _Messages = _Messages(streaming=False)
+            request = requests.wrap_async(request) if streaming_requests else requests.add(request)
+            failed: bool = True
+            try:
+                response: Any = behavior(request, context)
+                if inspect.isawaitable(response):
+                    response = await response
+                failed = False
+                return responses.add(response)
+            finally:
+                call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+        return logged
+
+    @staticmethod
+    def _stream(
+        behavior: Callable[..., Any], method: str, call_logger: CallLogger, streaming_requests: bool,
+    ) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(behavior):
+            # the responses are written with context.write, which is counted by the context given to the servicer
+            async def logged_writes(request: Any, context: Any) -> None:
+                started: float = time.perf_counter()
+                requests: _Messages = _Messages(streaming=streaming_requests)
+                responses: _Messages = _Messages(streaming=True)
+                request = requests.wrap_async(request) if streaming_requests else requests.add(request)
+                failed: bool = True
+                try:
+                    await behavior(request, _CountingContext(context, responses))
+                    failed = False
+                finally:
+                    call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+            return logged_writes
+
+        async def logged(request: Any, context: Any) -> AsyncIterator[Any]:
+            started: float = time.perf_counter()
+            requests: _Messages = _Messages(streaming=streaming_requests)
+            responses: _Messages = _Messages(streaming=True)
+            request = requests.wrap_async(request) if streaming_requests else requests.add(request)
+            failed: bool = True
+            try:
+                async for response in responses.wrap_async(behavior(request, context)):
+                    yield response
+                failed = False
+            finally:
+                call_logger.log(method, _server_code(context, failed), started, requests, responses)
+
+        return logged
+
+
+class LoggingClientInterceptor(
+    grpc.UnaryUnaryClientInterceptor,
+    grpc.UnaryStreamClientInterceptor,
+    grpc.StreamUnaryClientInterceptor,
+    grpc.StreamStreamClientInterceptor,
+):
+    """Logs the calls of a (synchronous) grpc channel, see the module documentation.
+
+    The calls are logged when they are done (with add_done_callback), so futures and response streams are not
+    blocked. The responses of streams are not counted.
+    """
+
+    def __init__(
+        self, logger: Optional[logging.Logger] = None, payload_sample_rate: float = 0.0, max_level: int = 3,
+    ) -> None:
+        self.call_logger: CallLogger = CallLogger(
+            side="client", logger=logger, payload_sample_rate=payload_sample_rate, max_level=max_level,
+        )
+
+    def intercept_unary_unary(self, continuation: Callable[..., Any], client_call_details: Any, request: Any) -> Any:
+        return self._intercept(continuation, client_call_details, request, False, False)
+
+    def intercept_unary_stream(self, continuation: Callable[..., Any], client_call_details: Any, request: Any) -> Any:
+        return self._intercept(continuation, client_call_details, request, False, True)
+
+    def intercept_stream_unary(
+        self, continuation: Callable[..., Any], client_call_details: Any, request_iterator: Any,
+    ) -> Any:
+        return self._intercept(continuation, client_call_details, request_iterator, True, False)
+
+    def intercept_stream_stream(
+        self, continuation: Callable[..., Any], client_call_details: Any, request_iterator: Any,
+    ) -> Any:
+        return self._intercept(continuation, client_call_details, request_iterator, True, True)
+
+    def _intercept(
+        self,
+        continuation: Callable[..., Any],
+        client_call_details: Any,
+        request: Any,
+        streaming_requests: bool,
+        streaming_responses: bool,
+    ) -> Any:
+        if not self.call_logger.enabled:
+            return continuation(client_call_details, request)
+        started: float = time.perf_counter()
+        requests: _Messages = _Messages(streaming=streaming_requests)
+        request = requests.wrap(request) if streaming_requests else requests.add(request)
+        call: Any = continuation(client_call_details, request)
+        call.add_done_callback(
+            functools.partial(self._done, client_call_details.method, started, requests, streaming_responses)
+        )
+        return call
+
+    def _done(self, method: str, started: float, requests: _Messages, streaming_responses: bool, call: Any) -> None:
+        code: Any = call.code()
+        # the responses of streams are neither counted nor sized
+        responses: _Messages = _Messages(streaming=False)
+        if code == grpc.StatusCode.OK and not streaming_responses:
+            responses.add(call.result())
+        self.call_logger.log(method, code, started, requests, responses)
+
+
+class _AsyncLoggingClientInterceptor:
+    """Logs the calls of a grpc.aio channel, see async_logging_client_interceptors."""
+
+    def __init__(self, call_logger: CallLogger) -> None:
+        self.call_logger: CallLogger = call_logger
+        # the logging tasks of done calls, referenced until they finished
+        self._tasks: Set["asyncio.Future[None]"] = set()
+
+    async def _intercept(
+        self,
+        continuation: Callable[..., Any],
+        client_call_details: Any,
+        request: Any,
+        streaming_requests: bool,
+        streaming_responses: bool,
+    ) -> Any:
+        if not self.call_logger.enabled:
+            return await continuation(client_call_details, request)
+        started: float = time.perf_counter()
+        requests: _Messages = _Messages(streaming=streaming_requests)
+        request = requests.wrap_async(request) if streaming_requests else requests.add(request)
+        call: Any = await continuation(client_call_details, request)
+        call.add_done_callback(
+            functools.partial(self._done, client_call_details.method, started, requests, streaming_responses)
+        )
+        return call
+
+    def _done(self, method: Any, started: float, requests: _Messages, streaming_responses: bool, call: Any) -> None:
+        # the status of a grpc.aio call is awaited, even though the call is done
+        task: "asyncio.Future[None]" = asyncio.ensure_future(
+            self._log(method, started, requests, streaming_responses, call)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _log(
+        self, method: Any, started: float, requests: _Messages, streaming_responses: bool, call: Any,
+    ) -> None:
+        code: Any = await call.code()
+        # the responses of streams are neither counted nor sized
+        responses: _Messages = _Messages(streaming=False)
+        if code == grpc.StatusCode.OK and not streaming_responses:
+            responses.add(await call)
+        self.call_logger.log(method, code, started, requests, responses)
+
+
+class _AsyncUnaryUnaryInterceptor(_AsyncLoggingClientInterceptor, grpc.aio.UnaryUnaryClientInterceptor):
+    async def intercept_unary_unary(
+        self, continuation: Callable[..., Any], client_call_details: Any, request: Any,
+    ) -> Any:
+        return await self._intercept(continuation, client_call_details, request, False, False)
+
+
+class _AsyncUnaryStreamInterceptor(_AsyncLoggingClientInterceptor, grpc.aio.UnaryStreamClientInterceptor):
+    async def intercept_unary_stream(
+        self, continuation: Callable[..., Any], client_call_details: Any, request: Any,
+    ) -> Any:
+        return await self._intercept(continuation, client_call_details, request, False, True)
+
+
+class _AsyncStreamUnaryInterceptor(_AsyncLoggingClientInterceptor, grpc.aio.StreamUnaryClientInterceptor):
+    async def intercept_stream_unary(
+        self, continuation: Callable[..., Any], client_call_details: Any, request_iterator: Any,
+    ) -> Any:
+        return await self._intercept(continuation, client_call_details, request_iterator, True, False)
+
+
+class _AsyncStreamStreamInterceptor(_AsyncLoggingClientInterceptor, grpc.aio.StreamStreamClientInterceptor):
+    async def intercept_stream_stream(
+        self, continuation: Callable[..., Any], client_call_details: Any, request_iterator: Any,
+    ) -> Any:
+        return await self._intercept(continuation, client_call_details, request_iterator, True, True)
+
+
+def async_logging_client_interceptors(
+    logger: Optional[logging.Logger] = None, payload_sample_rate: float = 0.0, max_level: int = 3,
+) -> List[Any]:
+    """The interceptors which log the calls of a grpc.aio channel, see the module documentation.
+
+    A grpc.aio channel uses an interceptor for one kind of call only, so there is one interceptor per kind. The calls
+    are logged when they are done (with add_done_callback), so the caller is not delayed. The responses of streams
+    are not counted.
+
+    Args:
+        logger: the logger of the calls (by default logger_console)
+        payload_sample_rate: fraction of the calls whose request and response (of unary calls) are logged
+        max_level: the depth up to which the payloads are rendered (see flatten_json)
+
+    Returns:
+        the interceptors of unary-unary, unary-stream, stream-unary and stream-stream calls
+    """
+    call_logger: CallLogger = CallLogger(
+        side="client", logger=logger, payload_sample_rate=payload_sample_rate, max_level=max_level,
+    )
+    return [
+        interceptor(call_logger)
+        for interceptor in (
+            _AsyncUnaryUnaryInterceptor,
+            _AsyncUnaryStreamInterceptor,
+            _AsyncStreamUnaryInterceptor,
+            _AsyncStreamStreamInterceptor,
+        )
+    ]
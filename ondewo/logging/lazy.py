@@ -0,0 +1,78 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Tuple,
+)
+
+from ondewo.logging.constants import LAZY_FAILED
+from ondewo.logging.events import Event
+
+
+class Lazy:
+    """A log message or message value which is only evaluated when the record is actually handled.
+
+    Only values wrapped in Lazy are evaluated, other callables (e.g. a callback in a message dict) are logged as they
+    are. If the evaluation raises an exception, the value is replaced by a description of the error.
+
+    Example:
+        logger_console.debug({"message": "Got request", "request": Lazy(MessageToJson, request)})
+    """
+
+    __slots__ = ("func", "args", "kwargs")
+
+    def __init__(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        self.func: Callable[..., Any] = func
+        self.args: Tuple[Any, ...] = args
+        self.kwargs: Dict[str, Any] = kwargs
+
+    def __call__(self) -> Any:
+        return self.func(*self.args, **self.kwargs)
+
+
+def is_lazy(value: Any) -> bool:
+    """Check if the value is a lazily evaluated message or message value."""
+    return isinstance(value, Lazy)
+
+
+def evaluate(value: Lazy) -> Any:
+    """Evaluate a lazy value, an exception is not raised but described by the returned string."""
+    try:
+        return value()
+    except Exception as exc:
+        return LAZY_FAILED.format(getattr(value.func, "__qualname__", value.func), exc)
+
+
+def resolve_message(msg: Any) -> Any:
+    """Evaluate a lazy message and the lazy values of a dict message or of the context of an event.
+
+    The dict or event given by the caller is never modified, a copy is created if any of its values is lazy. The
+    evaluation never raises (see evaluate).
+
+    Args:
+        msg: the message of a log record
+
+    Returns:
+        the message with all lazy parts evaluated
+    """
+    if is_lazy(msg):
+        msg = evaluate(msg)
+    if isinstance(msg, dict) and any(is_lazy(value) for value in msg.values()):
+        msg = {key: evaluate(value) if is_lazy(value) else value for key, value in msg.items()}
+    elif isinstance(msg, Event) and msg.context and any(is_lazy(value) for value in msg.context.values()):
+        msg = msg.with_context({key: evaluate(value) for key, value in msg.context.items() if is_lazy(value)})
+    return msg
@@ -17,6 +17,10 @@ import logging.config
 import os
 import re
 import sys
+from threading import (
+    Lock,
+    get_ident,
+)
 from typing import (
     Any,
     Dict,
@@ -25,11 +29,47 @@ from typing import (
 )
 
 import yaml
-from dotenv import load_dotenv
 
 import ondewo.logging.constants as file_anchor  # type:ignore
+from ondewo.logging.lazy import (
+    Lazy,
+    resolve_message,
+)
+from ondewo.logging.reconfigure import configurator
+
+
+def find_dotenv() -> str:
+    """
+    Search the .env file which load_dotenv() of python-dotenv loads when it is called from this module.
 
-load_dotenv()
+    Like dotenv.find_dotenv(), the search starts in the working directory in interactive sessions, debuggers and frozen
+    applications and in the directory of this module otherwise, and continues in the parent directories. The search
+    only takes a few stat calls, so python-dotenv is only imported if there is a file to load.
+
+    Returns:
+        the path of the .env file or an empty string if there is none
+    """
+    main: Any = sys.modules.get("__main__")
+    interactive: bool = hasattr(sys, "ps1") or hasattr(sys, "ps2") or not hasattr(main, "__file__")
+    if interactive or sys.gettrace() is not None or getattr(sys, "frozen", False):
+        directory: str = os.getcwd()
+    else:
+        directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path: str = os.path.join(directory, ".env")
+        if os.path.exists(path) and not os.path.isdir(path):
+            return path
+        parent: str = os.path.dirname(directory)
+        if parent == directory:
+            return ""
+        directory = parent
+
+
+DOTENV_PATH: str = find_dotenv()
+if DOTENV_PATH:
+    from dotenv import load_dotenv
+
+    load_dotenv(DOTENV_PATH)
 MODULE_NAME: str = os.getenv("MODULE_NAME", "")
 GIT_REPO_NAME: str = os.getenv("GIT_REPO_NAME", "")
 DOCKER_IMAGE_NAME: str = os.getenv("DOCKER_IMAGE_NAME", "")
@@ -62,6 +102,43 @@ class CustomLogger(logging.Logger):
     GRPC_LEVEL_NUM = 25
     logging.addLevelName(GRPC_LEVEL_NUM, "GRPC")
 
+    def __init__(self, name: str, level: int = logging.NOTSET) -> None:
+        super().__init__(name, level)
+        # thread id -> highest level which is enabled in the thread regardless of the level of the logger, used by
+        # the buffering scopes of ThreadContextLogger to create the records they buffer
+        self.thread_buffer_levels: Dict[int, int] = {}
+        self._buffer_levels_lock: Lock = Lock()
+
+    def set_thread_buffer_level(self, level: Optional[int]) -> Optional[int]:
+        """
+        Set the buffer level of the current thread, the records up to which are created regardless of the level of
+        the logger. While no thread has a buffer level, the level check of logging.Logger is used as is.
+
+        Args:
+            level: the buffer level, or None to remove it
+
+        Returns:
+            the previous buffer level of the thread
+        """
+        with self._buffer_levels_lock:
+            previous: Optional[int]
+            if level is None:
+                previous = self.thread_buffer_levels.pop(get_ident(), None)
+            else:
+                previous = self.thread_buffer_levels.get(get_ident())
+                self.thread_buffer_levels[get_ident()] = level
+            if self.thread_buffer_levels:
+                self.isEnabledFor = self._is_enabled_for_buffering  # type: ignore
+            else:
+                self.__dict__.pop("isEnabledFor", None)
+            return previous
+
+    def _is_enabled_for_buffering(self, level: int) -> bool:
+        """Check the level of the logger, or the buffer level of the current thread if it has a buffering scope."""
+        if logging.Logger.isEnabledFor(self, level):
+            return True
+        return level <= self.thread_buffer_levels.get(get_ident(), -1)
+
     @staticmethod
     def extract_grpc_request_class(msg: str) -> str:
         pattern_request_type = re.compile("\\(type <class '(.*)'>")
@@ -84,33 +161,52 @@ class CustomLogger(logging.Logger):
                 extracted = flatten_json(grpc_json)
         return extracted
 
-    def grpc(self, message_dict: Dict[str, Any], *args, **kwargs) -> None:  # type: ignore
-        if logging.getLogger().isEnabledFor(self.GRPC_LEVEL_NUM):
-            message: str = message_dict["message"]
-            if "Got request (type <class" in message:
-                request_type = CustomLogger.extract_grpc_request_class(message)
-                extracted = CustomLogger.extract_grpc_message(message, kwargs)
-                to_log = {"original": message, **extracted}
-                # Add request type
-                if request_type:
-                    to_log["request_type"] = request_type
-                    # Update tags with 'grpc'
-                    to_log["tags"] = (
-                        message_dict["tags"] + ["grpc"]
-                        if "tags" in message_dict
-                        else ["grpc"]
-                    )
-                if "max_level" in kwargs:
-                    kwargs.pop("max_level")
-                return super(CustomLogger, self).log(
-                    self.GRPC_LEVEL_NUM, to_log, *args, **kwargs
-                )
-            else:
-                if "max_level" in kwargs:
-                    kwargs.pop("max_level")
-                return super(CustomLogger, self).log(
-                    self.GRPC_LEVEL_NUM, message_dict, *args, **kwargs
-                )
+    def grpc(self, message_dict: Any, *args, **kwargs) -> None:  # type: ignore
+        """
+        Logs a message on the GRPC level. A message of the form "Got request (type <class ...>): {json}" is parsed
+        into its request type and flattened json content (up to the depth given by max_level).
+
+        The message dict may be lazy (see ondewo.logging.lazy.Lazy): it is only evaluated and parsed if the GRPC level
+        is enabled for this logger and the record passed the filters.
+        """
+        if not self.isEnabledFor(self.GRPC_LEVEL_NUM):
+            return
+        max_level: Optional[int] = kwargs.pop("max_level", None)
+        kwargs.setdefault("stacklevel", 2)
+        self._log(self.GRPC_LEVEL_NUM, Lazy(self._grpc_message, message_dict, max_level), args, **kwargs)
+
+    @staticmethod
+    def _grpc_message(message_dict: Any, max_level: Optional[int] = None) -> Any:
+        message_dict = resolve_message(message_dict)
+        message: str = message_dict["message"]
+        if "Got request (type <class" not in message:
+            return message_dict
+
+        request_type = CustomLogger.extract_grpc_request_class(message)
+        extracted = CustomLogger.extract_grpc_message(message, {} if max_level is None else {"max_level": max_level})
+        to_log = {"original": message, **extracted}
+        # Add request type
+        if request_type:
+            to_log["request_type"] = request_type
+            # Update tags with 'grpc'
+            to_log["tags"] = (
+                message_dict["tags"] + ["grpc"]
+                if "tags" in message_dict
+                else ["grpc"]
+            )
+        return to_log
+
+    def handle(self, record: logging.LogRecord) -> None:
+        """Evaluates the lazy parts of the message once the record passed the level check and the filters."""
+        if self.disabled:
+            return
+        filtered: Any = self.filter(record)
+        if not filtered:
+            return
+        if isinstance(filtered, logging.LogRecord):
+            record = filtered
+        record.msg = resolve_message(record.msg)
+        self.callHandlers(record)
 
 
 def import_config() -> Dict[str, Any]:
@@ -127,7 +223,8 @@ def import_config() -> Dict[str, Any]:
         config_path = f"{parent}/config/logging.yaml"
 
     with open(config_path) as fd:
-        conf = yaml.safe_load(fd)
+        # the loader of libyaml is an order of magnitude faster than the pure python one, if pyyaml was built with it
+        conf = yaml.load(fd, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
     return conf  # type: ignore
 
@@ -160,11 +257,14 @@ def initiate_loggers(conf: Dict[str, Any]) -> Tuple[logging.Logger, ...]:
     """
     Initiate the loggers with the config and return them. Will complain if the module name is not set.
 
+    The first config is applied with dictConfig, later configs are applied incrementally: only the handlers whose
+    construction changed are replaced, all other handlers (and their connections and buffers) stay alive.
+
     :param conf:                the config of the logger
     :return:                    the loggers
     """
     logging.setLoggerClass(CustomLogger)
-    logging.config.dictConfig(conf["logging"])
+    configurator.configure(conf["logging"])
 
     if not GIT_REPO_NAME:
         logging.warning(
@@ -0,0 +1,406 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import logging.config
+import os
+import signal
+import threading
+from copy import deepcopy
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# handler settings which can be changed on a live handler, all other settings require a new handler
+LIVE_HANDLER_SETTINGS: Tuple[str, ...] = ("level", "formatter", "filters")
+
+
+def get_handler(name: str) -> Optional[logging.Handler]:
+    """Get a handler configured by dictConfig by its name."""
+    return logging._handlers.get(name)  # type: ignore
+
+
+def to_level(level: Union[int, str]) -> int:
+    """Convert a level name (e.g. "DEBUG" or "GRPC") or number to the level number."""
+    if isinstance(level, int):
+        return level
+    level_number: Any = logging.getLevelName(str(level).upper())
+    if not isinstance(level_number, int):
+        raise ValueError(f"Unknown logging level {level!r}.")
+    return level_number
+
+
+def _get_logger(name: str) -> logging.Logger:
+    """Get a logger by its config name, where both '' and 'root' refer to the root logger."""
+    return logging.getLogger() if name in ("", "root") else logging.getLogger(name)
+
+
+class IncrementalConfigurator:
+    """Apply logging dict configs, touching only what changed since the last applied config.
+
+    The first config is applied with ``logging.config.dictConfig``. Every later config is compared with the live one:
+
+        * handlers whose class or constructor arguments changed are replaced, removed handlers are closed
+        * all other handlers are kept alive (no reconnects or lost buffers) and only get their level, formatter and
+          filters updated where these changed
+        * loggers get their level, propagation, handlers and filters updated in place
+
+    Only the formatters and filters whose config changed are created again. Handlers and filters which were added
+    programmatically (not by a config) are left untouched.
+
+    If the logging setup was replaced behind the configurator's back (``logging.config.dictConfig`` called directly
+    closes all handlers), the configured handlers are no longer the live ones; the next config is then applied in full
+    with ``dictConfig`` again.
+    """
+
+    def __init__(self) -> None:
+        self.config: Optional[Dict[str, Any]] = None
+        # incremented by every applied config, so anything caching the configured handlers can tell it is stale
+        self.generation: int = 0
+        self._lock: threading.RLock = threading.RLock()
+        # the live objects created from the config, by name
+        self._formatters: Dict[str, logging.Formatter] = {}
+        self._filters: Dict[str, Any] = {}
+        self._handlers: Dict[str, logging.Handler] = {}
+        # filters installed from the config, so they can be told apart from the programmatically added ones
+        self._handler_filters: Dict[str, List[Any]] = {}
+        self._logger_filters: Dict[str, List[Any]] = {}
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """Apply the logging config.
+
+        Args:
+            config: logging dict config (the "logging" section of the ondewo logging.yaml)
+        """
+        with self._lock:
+            if config.get("incremental", False):
+                logging.config.dictConfig(deepcopy(config))
+            elif self.config is None or self.is_stale():
+                # the configurator consumes the dictionaries it is given and replaces the formatter and filter
+                # configs with the created objects
+                configurator: Any = logging.config.DictConfigurator(deepcopy(config))
+                configurator.configure()
+                self._formatters = dict(configurator.config.get("formatters", {}))
+                self._filters = dict(configurator.config.get("filters", {}))
+            else:
+                self._apply_difference(old=self.config, new=config)
+            self.config = deepcopy(config)
+            self._remember_filters(config=config)
+            self._handlers = {
+                name: handler for name in config.get("handlers", {}) for handler in [get_handler(name)] if handler
+            }
+            self.generation += 1
+
+    def is_stale(self) -> bool:
+        """Whether the configured handlers were replaced or closed by something else, e.g. a direct dictConfig."""
+        return any(get_handler(name) is not handler for name, handler in self._handlers.items())
+
+    def _apply_difference(self, old: Dict[str, Any], new: Dict[str, Any]) -> None:
+        """Update the live logging setup from the old config to the new one."""
+        configurator: Any = logging.config.DictConfigurator(deepcopy(new))
+        changed_formatters: List[str] = []
+        for name, formatter_config in new.get("formatters", {}).items():
+            if name not in self._formatters or old.get("formatters", {}).get(name) != formatter_config:
+                self._formatters[name] = configurator.configure_formatter(configurator.config["formatters"][name])
+                changed_formatters.append(name)
+        changed_filters: List[str] = []
+        for name, filter_config in new.get("filters", {}).items():
+            if name not in self._filters or old.get("filters", {}).get(name) != filter_config:
+                self._filters[name] = configurator.configure_filter(configurator.config["filters"][name])
+                changed_filters.append(name)
+        self._formatters = {name: self._formatters[name] for name in new.get("formatters", {})}
+        self._filters = {name: self._filters[name] for name in new.get("filters", {})}
+        formatters: Dict[str, logging.Formatter] = self._formatters
+        filters: Dict[str, Any] = self._filters
+        for name, formatter in formatters.items():
+            configurator.config["formatters"][name] = formatter
+        for name, filter_ in filters.items():
+            configurator.config["filters"][name] = filter_
+
+        old_handlers: Dict[str, Any] = old.get("handlers", {})
+        new_handlers: Dict[str, Any] = new.get("handlers", {})
+        replaced: Dict[logging.Handler, Optional[logging.Handler]] = {}
+        created: Dict[str, logging.Handler] = {}
+
+        for name in old_handlers.keys() - new_handlers.keys():
+            handler: Optional[logging.Handler] = get_handler(name)
+            if handler:
+                replaced[handler] = None
+
+        # in the order of dictConfig, handlers referring to other handlers by name (e.g. a router) come after them
+        for name, handler_config in sorted(new_handlers.items()):
+            old_handler_config: Optional[Dict[str, Any]] = old_handlers.get(name)
+            handler = get_handler(name)
+            if handler is None or old_handler_config is None or \
+                    self._construction(old_handler_config) != self._construction(handler_config):
+                new_handler: logging.Handler = configurator.configure_handler(configurator.config["handlers"][name])
+                if handler:
+                    replaced[handler] = new_handler
+                    created[name] = new_handler
+                else:
+                    new_handler.name = name
+                continue
+
+            if old_handler_config.get("level") != handler_config.get("level"):
+                handler.setLevel(to_level(handler_config.get("level", logging.NOTSET)))
+
+            formatter_name: Optional[str] = handler_config.get("formatter")
+            if formatter_name != old_handler_config.get("formatter") or formatter_name in changed_formatters:
+                handler.setFormatter(formatters[formatter_name] if formatter_name else None)
+
+            if old_handler_config.get("filters") != handler_config.get("filters") or any(
+                filter_name in changed_filters for filter_name in handler_config.get("filters", [])
+            ):
+                for filter_ in self._handler_filters.get(name, []):
+                    handler.removeFilter(filter_)
+                for filter_name in handler_config.get("filters", []):
+                    handler.addFilter(filters[filter_name])
+
+        self._apply_loggers(
+            old=old, new=new, replaced=replaced, created=created, filters=filters, changed_filters=changed_filters,
+        )
+
+    def _apply_loggers(
+        self,
+        old: Dict[str, Any],
+        new: Dict[str, Any],
+        replaced: Dict[logging.Handler, Optional[logging.Handler]],
+        created: Dict[str, logging.Handler],
+        filters: Dict[str, Any],
+        changed_filters: List[str],
+    ) -> None:
+        """Update the levels, propagation, handlers and filters of the configured loggers."""
+        old_loggers: Dict[str, Any] = self._loggers(config=old)
+        new_loggers: Dict[str, Any] = self._loggers(config=new)
+        configured_handlers: List[str] = list(new.get("handlers", {}))
+
+        # detach replaced and removed handlers from all loggers, including the ones not in the config
+        all_loggers: List[logging.Logger] = [logging.getLogger()] + [
+            logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)
+        ]
+        for logger in all_loggers:
+            for handler in list(logger.handlers):
+                if handler in replaced:
+                    logger.removeHandler(handler)
+                    new_handler: Optional[logging.Handler] = replaced[handler]
+                    if new_handler:
+                        logger.addHandler(new_handler)
+
+        # closing a handler unregisters its name, so the new handlers are only named afterwards
+        for handler in replaced:
+            handler.close()
+        for name, new_handler in created.items():
+            new_handler.name = name
+
+        for name in old_loggers.keys() - new_loggers.keys():
+            logger = _get_logger(name)
+            logger.setLevel(logging.NOTSET)
+            logger.propagate = True
+            for handler_name in old_loggers[name].get("handlers", []):
+                old_handler: Optional[logging.Handler] = get_handler(handler_name)
+                if old_handler:
+                    logger.removeHandler(old_handler)
+
+        for name, logger_config in new_loggers.items():
+            logger = _get_logger(name)
+            if "level" in logger_config:
+                logger.setLevel(to_level(logger_config["level"]))
+            if name not in ("", "root"):
+                logger.propagate = logger_config.get("propagate", True)
+                logger.disabled = False
+
+            wanted: List[str] = logger_config.get("handlers", [])
+            for handler in list(logger.handlers):
+                if handler.name in configured_handlers and handler.name not in wanted:
+                    logger.removeHandler(handler)
+            for handler_name in wanted:
+                wanted_handler: Optional[logging.Handler] = get_handler(handler_name)
+                if wanted_handler and wanted_handler not in logger.handlers:
+                    logger.addHandler(wanted_handler)
+
+            if old_loggers.get(name, {}).get("filters") != logger_config.get("filters") or any(
+                filter_name in changed_filters for filter_name in logger_config.get("filters", [])
+            ):
+                for filter_ in self._logger_filters.get(name, []):
+                    logger.removeFilter(filter_)
+                for filter_name in logger_config.get("filters", []):
+                    logger.addFilter(filters[filter_name])
+
+    def _remember_filters(self, config: Dict[str, Any]) -> None:
+        """Remember the filters installed from the config."""
+        self._handler_filters = {
+            name: [self._filters[filter_name] for filter_name in handler_config["filters"] if filter_name in self._filters]
+            for name, handler_config in config.get("handlers", {}).items()
+            if handler_config.get("filters")
+        }
+        self._logger_filters = {
+            name: [self._filters[filter_name] for filter_name in logger_config["filters"] if filter_name in self._filters]
+            for name, logger_config in self._loggers(config=config).items()
+            if logger_config.get("filters")
+        }
+
+    @staticmethod
+    def _construction(handler_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Settings of a handler config which are used to construct the handler."""
+        return {key: value for key, value in handler_config.items() if key not in LIVE_HANDLER_SETTINGS}
+
+    @staticmethod
+    def _loggers(config: Dict[str, Any]) -> Dict[str, Any]:
+        """All logger configs including the root logger."""
+        loggers: Dict[str, Any] = dict(config.get("loggers", {}))
+        if "root" in config:
+            loggers["root"] = config["root"]
+        return loggers
+
+
+class LevelController:
+    """Change logger levels at runtime, e.g. to enable DEBUG for one module in production for a few minutes.
+
+    Levels can be set directly (optionally only for a limited duration), read from a YAML file mapping logger names to
+    levels, which can be watched for changes, or re-read whenever the process receives a signal. Loggers which are no
+    longer mentioned in the file get their original level back.
+    """
+
+    def __init__(self) -> None:
+        self._lock: threading.RLock = threading.RLock()
+        self._original_levels: Dict[str, int] = {}
+        self._timers: Dict[str, threading.Timer] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching: threading.Event = threading.Event()
+
+    def set_level(self, logger_name: str, level: Union[int, str], duration: Optional[float] = None) -> None:
+        """Set the level of a logger.
+
+        Args:
+            logger_name: name of the logger ('' or 'root' for the root logger)
+            level: level name or number
+            duration: optional number of seconds after which the original level is restored
+        """
+        with self._lock:
+            logger: logging.Logger = _get_logger(logger_name)
+            self._original_levels.setdefault(logger_name, logger.level)
+            logger.setLevel(to_level(level))
+            timer: Optional[threading.Timer] = self._timers.pop(logger_name, None)
+            if timer:
+                timer.cancel()
+            if duration is not None:
+                timer = threading.Timer(duration, self.reset_level, args=(logger_name,))
+                timer.daemon = True
+                self._timers[logger_name] = timer
+                timer.start()
+
+    def reset_level(self, logger_name: str) -> None:
+        """Restore the level the logger had before it was changed by the controller."""
+        with self._lock:
+            timer: Optional[threading.Timer] = self._timers.pop(logger_name, None)
+            if timer:
+                timer.cancel()
+            if logger_name in self._original_levels:
+                _get_logger(logger_name).setLevel(self._original_levels.pop(logger_name))
+
+    def reset(self) -> None:
+        """Restore the original levels of all loggers changed by the controller."""
+        with self._lock:
+            for logger_name in list(self._original_levels):
+                self.reset_level(logger_name)
+
+    def apply_levels(self, levels: Dict[str, Union[int, str]]) -> None:
+        """Set the given levels and restore the original levels of all other loggers changed by the controller.
+
+        Args:
+            levels: logger names mapped to level names or numbers
+        """
+        with self._lock:
+            for logger_name in list(self._original_levels):
+                if logger_name not in levels:
+                    self.reset_level(logger_name)
+            for logger_name, level in levels.items():
+                self.set_level(logger_name, level)
+
+    def load_file(self, path: str) -> None:
+        """Apply the levels from a YAML file, e.g. `{ondewo.nlu.intents: DEBUG}`. A missing file resets all levels."""
+        import yaml
+
+        levels: Dict[str, Union[int, str]] = {}
+        if os.path.exists(path):
+            with open(path) as fd:
+                levels = yaml.safe_load(fd) or {}
+        self.apply_levels(levels)
+
+    def watch_file(self, path: str, interval: float = 5.0) -> None:
+        """Poll the level file for changes in a daemon thread and apply it whenever it changes.
+
+        Args:
+            path: path of the YAML level file
+            interval: polling interval in seconds
+        """
+        self.stop_watching()
+        self._stop_watching.clear()
+
+        def watch() -> None:
+            last_modified: Optional[int] = None
+            while not self._stop_watching.is_set():
+                try:
+                    modified: Optional[int] = os.stat(path).st_mtime_ns
+                except OSError:
+                    modified = None
+                if modified != last_modified:
+                    last_modified = modified
+                    try:
+                        self.load_file(path)
+                    except Exception as exc:
+                        logging.getLogger().error(f"Could not apply the log levels from {path}: {exc}")
+                self._stop_watching.wait(interval)
+
+        self._watcher = threading.Thread(target=watch, name="ondewo-logging-level-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """Stop the level file watcher."""
+        self._stop_watching.set()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
+
+    def install_signal_handler(self, path: str, signum: Optional[int] = None) -> None:
+        """Re-read the level file whenever the process receives the signal (must be called from the main thread).
+
+        Args:
+            path: path of the YAML level file
+            signum: the signal, by default SIGUSR1
+
+        Raises:
+            ValueError: if no signal is given and the platform has no SIGUSR1 (e.g. Windows)
+        """
+        if signum is None:
+            if not hasattr(signal, "SIGUSR1"):
+                raise ValueError(
+                    "SIGUSR1 is not available on this platform, pass the signal to re-read the level file on."
+                )
+            signum = signal.SIGUSR1
+
+        def handle_signal(received_signum: int, frame: Any) -> None:
+            # do not touch the logging locks from within the signal handler
+            threading.Thread(target=self.load_file, args=(path,), daemon=True).start()
+
+        signal.signal(signum, handle_signal)
+
+
+configurator: IncrementalConfigurator = IncrementalConfigurator()
+level_controller: LevelController = LevelController()
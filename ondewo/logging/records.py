@@ -0,0 +1,222 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+)
+
+# attributes of a log record which are computed on first access, they are derived from the pathname of the record
+LAZY_ATTRIBUTES: List[str] = ["filename", "module"]
+
+
+class CompactLogRecord:
+    """A log record with __slots__ which computes the attributes derived from its pathname lazily.
+
+    It offers the same attributes and methods as logging.LogRecord, but has no instance dictionary and only computes
+    filename and module when they are first accessed (e.g. by a formatter). The names of the thread, process and
+    asyncio task are taken when the record is created, like logging.LogRecord does, since a record may be formatted
+    later or in another thread (e.g. by a buffering or queue handler). Formatters which access `record.__dict__` get
+    a mapping view of the record.
+
+    Attributes which are not known to logging.LogRecord can be attached with the `extra` argument of the log methods
+    or by assigning to `record.__dict__[key]`; direct attribute assignment only works for the known attributes.
+    """
+
+    __slots__ = (
+        "name", "msg", "args", "levelname", "levelno", "pathname", "lineno", "funcName", "exc_info", "exc_text",
+        "stack_info", "created", "msecs", "relativeCreated", "thread", "threadName", "processName", "process",
+        "taskName", "message", "asctime", "hostname", "_filename", "_module", "_extra",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        level: int,
+        pathname: str,
+        lineno: int,
+        msg: Any,
+        args: Any,
+        exc_info: Any,
+        func: Optional[str] = None,
+        sinfo: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        created_ns: int = time.time_ns()
+        self.name: str = name
+        self.msg: Any = msg
+        if args and len(args) == 1 and isinstance(args[0], Mapping) and args[0]:
+            args = args[0]
+        self.args: Any = args
+        self.levelname: str = logging.getLevelName(level)
+        self.levelno: int = level
+        self.pathname: str = pathname
+        self.lineno: int = lineno
+        self.funcName: Optional[str] = func
+        self.exc_info: Any = exc_info
+        self.exc_text: Optional[str] = None
+        self.stack_info: Optional[str] = sinfo
+        self.created: float = created_ns / 1e9
+        self.msecs: float = (created_ns % 1_000_000_000) // 1_000_000 + 0.0
+        self.relativeCreated: float = (self.created - logging._startTime) * 1000  # type: ignore
+        self.thread: Optional[int] = None
+        self.threadName: Optional[str] = None
+        if logging.logThreads:
+            self.thread = threading.get_ident()
+            self.threadName = threading.current_thread().name
+        self.processName: Optional[str] = None
+        if logging.logMultiprocessing:
+            self.processName = "MainProcess"
+            multiprocessing: Any = sys.modules.get("multiprocessing")
+            if multiprocessing is not None:
+                try:
+                    self.processName = multiprocessing.current_process().name
+                except Exception:
+                    pass
+        self.process: Optional[int] = os.getpid() if logging.logProcesses else None
+        self.taskName: Optional[str] = None
+        if getattr(logging, "logAsyncioTasks", True):
+            asyncio: Any = sys.modules.get("asyncio")
+            if asyncio is not None:
+                try:
+                    self.taskName = asyncio.current_task().get_name()
+                except Exception:
+                    pass
+        self._filename: Optional[str] = None
+        self._module: Optional[str] = None
+        self._extra: Optional[Dict[str, Any]] = None
+
+    def __repr__(self) -> str:
+        return f'<LogRecord: {self.name}, {self.levelno}, {self.pathname}, {self.lineno}, "{self.msg}">'
+
+    def __getattr__(self, name: str) -> Any:
+        """Look up the attributes attached with `extra`."""
+        if name[0] != "_" and self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def getMessage(self) -> str:
+        """Return the message with the user-supplied arguments merged in (see logging.LogRecord.getMessage)."""
+        msg: str = str(self.msg)
+        if self.args:
+            msg = msg % self.args
+        return msg
+
+    @property
+    def __dict__(self) -> MutableMapping[str, Any]:  # type: ignore
+        return RecordView(self)
+
+    @property
+    def filename(self) -> str:
+        if self._filename is None:
+            self._filename = os.path.basename(self.pathname)
+        return self._filename
+
+    @filename.setter
+    def filename(self, value: str) -> None:
+        self._filename = value
+
+    @property
+    def module(self) -> str:
+        if self._module is None:
+            self._module = os.path.splitext(self.filename)[0]
+        return self._module
+
+    @module.setter
+    def module(self, value: str) -> None:
+        self._module = value
+
+
+# all public attributes of a compact record
+RECORD_ATTRIBUTES: List[str] = [
+    attribute for attribute in CompactLogRecord.__slots__ if not attribute.startswith("_")
+] + LAZY_ATTRIBUTES
+
+
+class RecordView(MutableMapping):
+    """The `__dict__` of a CompactLogRecord: a mapping view of its attributes."""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record: CompactLogRecord) -> None:
+        self.record: CompactLogRecord = record
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self.record, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in RECORD_ATTRIBUTES:
+            setattr(self.record, key, value)
+            return
+        if self.record._extra is None:
+            self.record._extra = {}
+        self.record._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if self.record._extra is not None and key in self.record._extra:
+            del self.record._extra[key]
+        elif key in RECORD_ATTRIBUTES and key in self:
+            setattr(self.record, key, None)
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in RECORD_ATTRIBUTES:
+            if key in self:
+                yield key
+        if self.record._extra is not None:
+            yield from self.record._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            getattr(self.record, key)  # type: ignore
+        except (AttributeError, TypeError):
+            return False
+        return True
+
+
+def install_record_factory(factory: Callable[..., Any] = CompactLogRecord) -> Callable[..., Any]:
+    """Make the logging module create all log records with the compact record factory.
+
+    Args:
+        factory: the record factory to install
+
+    Returns:
+        the previously installed record factory, e.g. to restore it with logging.setLogRecordFactory
+    """
+    previous_factory: Callable[..., Any] = logging.getLogRecordFactory()
+    logging.setLogRecordFactory(factory)
+    return previous_factory
+
+
+def uninstall_record_factory() -> None:
+    """Restore the default logging.LogRecord record factory."""
+    logging.setLogRecordFactory(logging.LogRecord)
@@ -0,0 +1,122 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import sys
+import time
+from typing import (
+    Any,
+    Dict,
+    Tuple,
+)
+
+Snapshot = Tuple[float, float, int, int]
+
+
+class GCMonitor:
+    """Measure the time spent in garbage collections of the process with gc.callbacks.
+
+    A collection stops all threads (it holds the GIL), so the collections during a call delay the call no matter which
+    thread triggered them.
+    """
+
+    def __init__(self) -> None:
+        self.total: float = 0.0
+        self.collections: int = 0
+        self._started: float = 0.0
+
+    def _callback(self, phase: str, info: Dict[str, Any]) -> None:
+        if phase == "start":
+            self._started = time.perf_counter()
+        else:
+            self.total += time.perf_counter() - self._started
+            self.collections += 1
+
+    @property
+    def enabled(self) -> bool:
+        return self._callback in gc.callbacks
+
+    def enable(self) -> None:
+        """Start measuring the collections."""
+        if not self.enabled:
+            gc.callbacks.append(self._callback)
+
+    def disable(self) -> None:
+        """Stop measuring the collections."""
+        if self.enabled:
+            gc.callbacks.remove(self._callback)
+
+
+gc_monitor: GCMonitor = GCMonitor()
+
+
+class ResourceUsage:
+    """Accumulate the resources used by measured sections of code (e.g. a call or the steps of a generator).
+
+    Each kind of measurement is opt-in: the CPU time of the current thread (time.thread_time), the time spent in
+    garbage collections (needs the gc_monitor, which is enabled on demand) and the net number of allocated memory
+    blocks (sys.getallocatedblocks, which is more expensive on large heaps). The CPU time tells apart slowness of the
+    code itself from waiting on I/O, locks or the GIL.
+    """
+
+    __slots__ = ("cpu_time", "gc_time", "allocations", "cpu", "gc_pause", "gc_collections", "allocated_blocks")
+
+    def __init__(self, cpu_time: bool = False, gc_time: bool = False, allocations: bool = False) -> None:
+        """
+
+        Args:
+            cpu_time: measure the CPU time of the current thread
+            gc_time: measure the time spent in garbage collections
+            allocations: count the net number of allocated memory blocks
+        """
+        self.cpu_time: bool = cpu_time
+        self.gc_time: bool = gc_time
+        self.allocations: bool = allocations
+        self.cpu: float = 0.0
+        self.gc_pause: float = 0.0
+        self.gc_collections: int = 0
+        self.allocated_blocks: int = 0
+        if gc_time:
+            gc_monitor.enable()
+
+    def start(self) -> Snapshot:
+        """Take a snapshot at the start of a measured section."""
+        return (
+            time.thread_time() if self.cpu_time else 0.0,
+            gc_monitor.total if self.gc_time else 0.0,
+            gc_monitor.collections if self.gc_time else 0,
+            sys.getallocatedblocks() if self.allocations else 0,
+        )
+
+    def stop(self, snapshot: Snapshot) -> None:
+        """Add the resources used since the snapshot."""
+        if self.cpu_time:
+            self.cpu += time.thread_time() - snapshot[0]
+        if self.gc_time:
+            self.gc_pause += gc_monitor.total - snapshot[1]
+            self.gc_collections += gc_monitor.collections - snapshot[2]
+        if self.allocations:
+            self.allocated_blocks += sys.getallocatedblocks() - snapshot[3]
+
+    def fields(self) -> Dict[str, Any]:
+        """The measured resources as fields of a log record."""
+        fields: Dict[str, Any] = {}
+        if self.cpu_time:
+            fields["cpu time"] = self.cpu
+        if self.gc_time:
+            fields["gc time"] = self.gc_pause
+            fields["gc collections"] = self.gc_collections
+        if self.allocations:
+            fields["allocated blocks"] = self.allocated_blocks
+        return fields
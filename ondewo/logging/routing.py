@@ -0,0 +1,227 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Routing of log records to their sinks.
+
+With handlers attached to several loggers, a record is emitted by every handler on its way up the logger hierarchy,
+e.g. a record of the console logger is written to stdout and then sent by all fluent handlers of the root logger.
+The RoutingHandler is attached to the root logger instead and dispatches each record to the handlers (the sinks)
+which its routes select by logger, level and tags, each at most once:
+
+    handlers:
+      router:
+        class: ondewo.logging.routing.RoutingHandler
+        routes:
+          - level: WARNING
+            targets: [fluent-async-elastic]
+          - tags: [timing, exception, grpc]
+            targets: [fluent-async-elastic]
+          - loggers: [console]
+            targets: [console, fluent-async-console]
+            final: true
+          - targets: [fluent-async-debug]
+
+The targets are the names of handlers of the config, which need not be attached to any logger. They are resolved when
+the router is created and the router keeps them alive, logging itself holds handlers only weakly. dictConfig creates
+the handlers in the order of their names, so the name of the router must sort after the names of its targets. All
+routes matching a record contribute their targets in order, unless a matching route is final, which ends the
+evaluation. The targets of a combination of logger, level and routed tags are computed once and then looked up, the
+handler chain is not walked.
+"""
+
+import logging
+import threading
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from ondewo.logging.events import Event
+from ondewo.logging.reconfigure import (
+    configurator,
+    get_handler,
+    to_level,
+)
+
+RouteKey = Tuple[str, int, Tuple[str, ...]]
+
+
+def record_tags(record: logging.LogRecord) -> Iterable[str]:
+    """The tags of a record: the tags of a dict message or of an event."""
+    msg: Any = record.msg
+    if isinstance(msg, dict):
+        tags: Any = msg.get("tags")
+        return tags if isinstance(tags, (list, tuple)) else ()
+    if isinstance(msg, Event):
+        return msg.tags
+    return ()
+
+
+class Route:
+    """Selects the records of some loggers, levels and tags for a list of targets."""
+
+    def __init__(
+        self,
+        targets: Iterable[str],
+        loggers: Optional[Iterable[str]] = None,
+        level: Any = logging.NOTSET,
+        max_level: Any = None,
+        tags: Optional[Iterable[str]] = None,
+        final: bool = False,
+    ) -> None:
+        """
+
+        Args:
+            targets: names of the handlers the selected records are dispatched to
+            loggers: names of the loggers whose records (and the ones of their children) are selected, all by default
+            level: minimal level of the selected records, as a name or number
+            max_level: maximal level of the selected records, as a name or number
+            tags: the selected records have at least one of these tags, if given
+            final: no later route is evaluated for a record selected by this route
+        """
+        self.targets: Tuple[str, ...] = tuple(targets)
+        self.loggers: Optional[Tuple[str, ...]] = None if loggers is None else tuple(loggers)
+        self.level: int = to_level(level)
+        self.max_level: Optional[int] = None if max_level is None else to_level(max_level)
+        self.tags: Optional[FrozenSet[str]] = None if tags is None else frozenset(tags)
+        self.final: bool = final
+
+    def matches(self, name: str, level: int, tags: Tuple[str, ...]) -> bool:
+        """Whether the route selects the records of a logger, level and tags."""
+        if level < self.level or self.max_level is not None and level > self.max_level:
+            return False
+        if self.tags is not None and self.tags.isdisjoint(tags):
+            return False
+        return self.loggers is None or any(
+            name == logger or name.startswith(f"{logger}.") for logger in self.loggers
+        )
+
+
+class RoutingHandler(logging.Handler):
+    """Dispatches each record to the handlers selected by its routes, see the module documentation.
+
+    The handler takes no lock of its own, the targets lock themselves. The table of computed targets holds up to
+    max_routes combinations of logger, level and routed tags and is emptied when it is full. When the logging config
+    was changed, the targets are resolved again (they may have been replaced) and the table is emptied.
+    """
+
+    def __init__(self, routes: Iterable[Any], max_routes: int = 1024, level: Any = logging.NOTSET) -> None:
+        """
+
+        Args:
+            routes: Route objects or dicts with their arguments
+            max_routes: maximal number of cached combinations of logger, level and routed tags
+            level: level of the handler
+
+        Raises:
+            ValueError: if a target is not a configured handler
+        """
+        super().__init__(to_level(level))
+        self.routes: List[Route] = [
+            route if isinstance(route, Route) else Route(**dict(route)) for route in routes
+        ]
+        self.max_routes: int = max_routes
+        # only the tags which some route selects on are part of the key of a combination
+        self.routed_tags: FrozenSet[str] = frozenset(
+            tag for route in self.routes if route.tags is not None for tag in route.tags
+        )
+        self._table: Dict[RouteKey, Tuple[logging.Handler, ...]] = {}
+        self._generation: int = configurator.generation
+        self._table_lock: threading.Lock = threading.Lock()
+        # strong references, logging._handlers only holds the handlers weakly
+        self._handlers: Dict[str, logging.Handler] = self._resolve()
+
+    def handle(self, record: logging.LogRecord) -> Any:
+        # without the lock of logging.Handler.handle, which would serialize the records of all threads
+        filtered: Any = self.filter(record)
+        if filtered:
+            if isinstance(filtered, logging.LogRecord):
+                record = filtered
+            self.emit(record)
+        return filtered
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # like the emit of other handlers, an error is reported with handleError and not raised to the logging call;
+        # a failing target doesn't keep the record from the other ones
+        try:
+            targets: Tuple[logging.Handler, ...] = self.targets(record)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+        for target in targets:
+            if record.levelno >= target.level:
+                try:
+                    target.handle(record)
+                except RecursionError:
+                    raise
+                except Exception:
+                    self.handleError(record)
+
+    def targets(self, record: logging.LogRecord) -> Tuple[logging.Handler, ...]:
+        """The handlers a record is dispatched to."""
+        tags: Tuple[str, ...] = ()
+        if self.routed_tags:
+            # tags which are no strings (e.g. unhashable lists) can't be routed on
+            tags = tuple(tag for tag in record_tags(record) if isinstance(tag, str) and tag in self.routed_tags)
+        key: RouteKey = (record.name, record.levelno, tags)
+        targets: Optional[Tuple[logging.Handler, ...]] = self._table.get(key)
+        if targets is None or self._generation != configurator.generation:
+            targets = self._route(key)
+        return targets
+
+    def _resolve(self) -> Dict[str, logging.Handler]:
+        """Look up the targets of all routes by their names."""
+        handlers: Dict[str, logging.Handler] = {}
+        for route in self.routes:
+            for name in route.targets:
+                handler: Optional[logging.Handler] = get_handler(name)
+                if handler is None:
+                    raise ValueError(
+                        f"Routing target {name!r} is not a configured handler. The handlers of a config are created "
+                        "in the order of their names, the name of the router must sort after its targets."
+                    )
+                handlers[name] = handler
+        return handlers
+
+    def _route(self, key: RouteKey) -> Tuple[logging.Handler, ...]:
+        """Compute the handlers of a combination of logger, level and tags and store them in the table."""
+        name, level, tags = key
+        # a dict keeps the order of the targets and each of them once
+        names: Dict[str, None] = {}
+        for route in self.routes:
+            if route.matches(name=name, level=level, tags=tags):
+                names.update(dict.fromkeys(route.targets))
+                if route.final:
+                    break
+        with self._table_lock:
+            if self._generation != configurator.generation:
+                # the configurator holds the configured handlers until the next config, none of them is lost
+                self._handlers = self._resolve()
+                self._table.clear()
+                self._generation = configurator.generation
+            elif len(self._table) >= self.max_routes:
+                self._table.clear()
+            targets: Tuple[logging.Handler, ...] = tuple(
+                self._handlers[name] for name in names if self._handlers[name] is not self
+            )
+            self._table[key] = targets
+        return targets
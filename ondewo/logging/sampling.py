@@ -0,0 +1,130 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+
+class StackWatch:
+    """A call which is sampled once it runs longer than its threshold."""
+
+    __slots__ = ("thread_id", "deadline", "root", "stacks")
+
+    def __init__(self, thread_id: int, deadline: float, root: Optional[FrameType]) -> None:
+        self.thread_id: int = thread_id
+        self.deadline: float = deadline
+        self.root: Optional[FrameType] = root
+        # created with the first sample, fast calls are never sampled
+        self.stacks: Optional["Counter[str]"] = None
+
+
+class StackSampler:
+    """Sample the stacks of slow calls from a helper thread.
+
+    A watched call costs a dictionary insert and removal as long as it finishes within its threshold. The helper
+    thread sleeps until the earliest deadline of the watched calls; once a call passed it, its thread's stack is
+    sampled with sys._current_frames every interval until the call finishes. The samples are collapsed into
+    "outer;...;inner" stacks (the format of flame graph tools) with their counts.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64) -> None:
+        """
+
+        Args:
+            interval: seconds between two samples of a slow call
+            max_depth: maximal number of frames of a collapsed stack (the innermost frames are kept)
+        """
+        self.interval: float = interval
+        self.max_depth: int = max_depth
+        self._watches: Dict[int, StackWatch] = {}
+        self._condition: threading.Condition = threading.Condition()
+        self._next_wakeup: float = float("inf")
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, threshold: float, root: Optional[FrameType] = None) -> StackWatch:
+        """Watch the call of the current thread.
+
+        Args:
+            threshold: seconds after which the call is sampled
+            root: the frame which calls the watched code, the stacks contain only the frames called by it
+
+        Returns:
+            the watch, to be passed to unwatch when the call finished
+        """
+        watch: StackWatch = StackWatch(threading.get_ident(), time.monotonic() + threshold, root)
+        with self._condition:
+            self._watches[id(watch)] = watch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ondewo-logging-stack-sampler", daemon=True)
+                self._thread.start()
+            elif watch.deadline < self._next_wakeup:
+                self._condition.notify()
+        return watch
+
+    def unwatch(self, watch: StackWatch) -> Optional["Counter[str]"]:
+        """Stop watching the call.
+
+        Returns:
+            the collapsed stacks with their number of samples, None if the call was not sampled
+        """
+        with self._condition:
+            self._watches.pop(id(watch), None)
+            watch.root = None
+        return watch.stacks
+
+    def _run(self) -> None:
+        """Sample the calls which passed their deadline."""
+        with self._condition:
+            while True:
+                now: float = time.monotonic()
+                slow: List[StackWatch] = [watch for watch in self._watches.values() if watch.deadline <= now]
+                if slow:
+                    self._sample(slow)
+                    self._next_wakeup = now + self.interval
+                else:
+                    self._next_wakeup = min((watch.deadline for watch in self._watches.values()), default=float("inf"))
+                timeout: Optional[float] = None
+                if self._next_wakeup != float("inf"):
+                    timeout = max(self._next_wakeup - time.monotonic(), 0.0)
+                self._condition.wait(timeout)
+
+    def _sample(self, watches: List[StackWatch]) -> None:
+        frames: Dict[int, FrameType] = sys._current_frames()
+        for watch in watches:
+            frame: Optional[FrameType] = frames.get(watch.thread_id)
+            if frame is None:
+                continue
+            if watch.stacks is None:
+                watch.stacks = Counter()
+            watch.stacks[self._collapse(frame, watch.root)] += 1
+
+    def _collapse(self, frame: Optional[FrameType], root: Optional[FrameType]) -> str:
+        """Collapse the frames from the root (exclusive) to the given frame into "outer;...;inner"."""
+        names: List[str] = []
+        while frame is not None and frame is not root and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{frame.f_globals.get('__name__', code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+stack_sampler: StackSampler = StackSampler()
@@ -0,0 +1,559 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Process-wide pool of fluentd senders.
+
+All handlers sending to the same endpoint with the same settings share one PooledSender, i.e. one connection with its
+buffering and reconnect logic (provided by the FluentSender of fluent-logger) and one background thread. The background
+thread sends all records which are queued at the same time in a single write, so a burst of records costs one system
+call instead of one per record and handler. The records are packed into the reusable buffer of a RecordPacker.
+
+Records logged from the coroutines of an asyncio event loop can be sent by a LoopSender instead, which writes them
+through a non-blocking transport of that loop, so they neither cross a thread boundary nor take a lock shared with
+other threads.
+"""
+
+import queue
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from ondewo.logging.encoding import RecordPacker
+
+if TYPE_CHECKING:
+    # asyncio is only imported by the LoopSender of a running loop, i.e. once it was imported anyway
+    import asyncio
+
+Endpoint = Tuple[str, int]
+PoolKey = Tuple[Endpoint, Tuple[Tuple[str, str], ...]]
+
+# hosts with this prefix are paths of unix domain sockets, e.g. unix:///var/run/fluent/fluent.sock
+UNIX_SCHEME: str = "unix://"
+
+# the packer of a thread which sends synchronously holds one record at a time, a buffer which grew larger than this
+# (in bytes) for a large record is released after it was written
+THREAD_BUFFER_SIZE: int = 1 << 14
+
+
+def endpoint_of(host: str, port: int) -> Endpoint:
+    """The key of an endpoint in the sender pool, the port is ignored for unix domain sockets."""
+    if host.startswith(UNIX_SCHEME):
+        return host, 0
+    return host, port
+
+
+def pool_key(
+    host: str = "localhost",
+    port: int = 24224,
+    timeout: float = 3.0,
+    verbose: bool = False,
+    buffer_overflow_handler: Any = None,
+    msgpack_kwargs: Optional[Dict[str, Any]] = None,
+    nanosecond_precision: bool = False,
+    queue_circular: bool = False,
+    **kwargs: Any,
+) -> PoolKey:
+    """The key of a sender in the sender pool: its endpoint and the settings of its connection (except the size of
+    the queue). The settings are compared by their representation, so they don't need to be hashable.
+    """
+    settings: Dict[str, Any] = {
+        "timeout": float(timeout),
+        "verbose": verbose,
+        "buffer_overflow_handler": buffer_overflow_handler,
+        "msgpack_kwargs": sorted((msgpack_kwargs or {}).items()),
+        "nanosecond_precision": nanosecond_precision,
+        "queue_circular": queue_circular,
+        **kwargs,
+    }
+    return endpoint_of(host, port), tuple((name, repr(value)) for name, value in sorted(settings.items()))
+
+
+class PooledSender:
+    """Connection to a fluentd endpoint which is shared by all handlers sending to it.
+
+    The host is either a host name or address for TCP, or the path of a unix domain socket prefixed with unix://
+    (e.g. unix:///var/run/fluent/fluent.sock), which avoids the TCP stack for a node-local fluentd or fluent bit. Both
+    transports are batched, buffered and reconnected in the same way. The records carry the full tag of their handler,
+    so records of different handlers can be sent in the same write.
+    Records are either sent synchronously (send) or queued for the background thread (emit). The background thread is
+    started with the first queued record. If the queue is full, the logging thread blocks unless queue_circular is
+    set, in which case the oldest record is discarded.
+    """
+
+    _STOP: Tuple[()] = ()
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 24224,
+        timeout: float = 3.0,
+        verbose: bool = False,
+        buffer_overflow_handler: Any = None,
+        msgpack_kwargs: Optional[Dict[str, Any]] = None,
+        nanosecond_precision: bool = False,
+        queue_maxsize: int = 100,
+        queue_circular: bool = False,
+        max_batch_size: int = 1000,
+        **kwargs: Any,
+    ) -> None:
+        """
+
+        Args:
+            host: host of fluentd, or unix:// followed by the path of its unix domain socket
+            port: port of fluentd (ignored for unix domain sockets)
+            timeout: socket timeout in seconds, also the time to wait for the background thread when closing
+            verbose: print the sent records
+            buffer_overflow_handler: called with the unsent data if the buffer of the sender overflows
+            msgpack_kwargs: arguments for packing the records with msgpack
+            nanosecond_precision: send the time of the records with nanosecond precision
+            queue_maxsize: maximal number of queued records
+            queue_circular: discard the oldest record instead of blocking if the queue is full
+            max_batch_size: maximal number of queued records which are sent in one write
+            **kwargs: further arguments for fluent.sender.FluentSender (e.g. bufmax)
+        """
+        self.host: str = host
+        self.port: int = port
+        self.timeout: float = timeout
+        self.verbose: bool = verbose
+        self.msgpack_kwargs: Dict[str, Any] = msgpack_kwargs or {}
+        self.nanosecond_precision: bool = nanosecond_precision
+        self.queue_circular: bool = queue_circular
+        self.max_batch_size: int = max_batch_size
+        self._sender_arguments: Dict[str, Any] = {
+            "host": host,
+            "port": port,
+            "timeout": timeout,
+            "buffer_overflow_handler": buffer_overflow_handler,
+            "msgpack_kwargs": msgpack_kwargs,
+            "nanosecond_precision": nanosecond_precision,
+            **kwargs,
+        }
+        self._sender: Any = None
+        self._sender_lock: threading.Lock = threading.Lock()
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock: threading.Lock = threading.Lock()
+        self._packers: threading.local = threading.local()
+        self._loop_senders: Dict["asyncio.AbstractEventLoop", LoopSender] = {}
+
+    @property
+    def endpoint(self) -> Endpoint:
+        return endpoint_of(self.host, self.port)
+
+    @property
+    def address(self) -> str:
+        """Readable address of the endpoint."""
+        if self.host.startswith(UNIX_SCHEME):
+            return self.host
+        return f"{self.host}:{self.port}"
+
+    @property
+    def sender(self) -> Any:
+        """The FluentSender of fluent-logger which owns the connection, created with the first record."""
+        if self._sender is None:
+            with self._sender_lock:
+                if self._sender is None:
+                    from fluent.sender import FluentSender
+
+                    # without a tag of the sender, the label of a record is its full tag
+                    self._sender = FluentSender(None, **self._sender_arguments)
+        return self._sender
+
+    def pack(self, tag: str, created: float, data: Any) -> bytes:
+        """Pack a record in the forward protocol (message mode).
+
+        Args:
+            tag: tag of the record
+            created: creation time of the record
+            data: the formatted record
+
+        Returns:
+            the packed record
+        """
+        if self.verbose:
+            print((tag, created, data))
+        return self._new_record_packer(initial_size=0).pack(tag=tag, created=created, data=data)
+
+    def send(self, tag: str, created: float, data: Any) -> bool:
+        """Send a record from the calling thread.
+
+        Returns:
+            whether the record (and the buffered ones) were sent, otherwise they stay buffered for the next write
+        """
+        packer: RecordPacker = self._record_packer()
+        if packer.busy:
+            # logged while the buffer of this thread is written
+            return self.write(self.pack(tag=tag, created=created, data=data))
+        if self.verbose:
+            print((tag, created, data))
+        packer.add(tag=tag, created=created, data=data)
+        return packer.write(self.write)
+
+    def write(self, data: Any) -> bool:
+        """Write packed records, reconnecting if necessary.
+
+        FluentSender has no public method to write packed data, so this uses its internals (lock, _closed,
+        _send_internal and pendings), which is why requirements.txt pins the tested versions of fluent-logger.
+
+        Args:
+            data: bytes or a memoryview of the buffer of a RecordPacker, which is copied if it stays pending
+        """
+        sender: Any = self.sender
+        with sender.lock:
+            if sender._closed:
+                return False
+            sent: bool = sender._send_internal(data)
+            if isinstance(sender.pendings, memoryview):
+                sender.pendings = bytes(sender.pendings)
+            return sent
+
+    def _record_packer(self) -> RecordPacker:
+        """The record packer of the calling thread, its buffer only grows to the size of the records of the thread."""
+        packer: Optional[RecordPacker] = getattr(self._packers, "packer", None)
+        if packer is None:
+            packer = self._new_record_packer(initial_size=0, max_retained_size=THREAD_BUFFER_SIZE)
+            self._packers.packer = packer
+        return packer
+
+    def _new_record_packer(self, **kwargs: Any) -> RecordPacker:
+        """A record packer with the settings of the sender, see RecordPacker for the other arguments."""
+        return RecordPacker(
+            msgpack_kwargs=self.msgpack_kwargs,
+            nanosecond_precision=self.nanosecond_precision,
+            on_error=self._on_pack_error,
+            **kwargs,
+        )
+
+    def _on_pack_error(self, exc: Exception) -> None:
+        self.sender.last_error = exc
+
+    def loop_sender(self, loop: "asyncio.AbstractEventLoop") -> "LoopSender":
+        """The sender of the records logged in an event loop, which has its own connection to the endpoint."""
+        loop_sender: Optional[LoopSender] = self._loop_senders.get(loop)
+        if loop_sender is None:
+            with self._thread_lock:
+                # the senders of closed loops (e.g. of former asyncio.run calls) are dropped
+                closed: List[LoopSender] = [sender for sender in self._loop_senders.values() if sender.loop.is_closed()]
+                for sender in closed:
+                    del self._loop_senders[sender.loop]
+                loop_sender = self._loop_senders.setdefault(loop, LoopSender(self, loop))
+            for sender in closed:
+                # sends what they could not write through their loop
+                sender.close()
+        return loop_sender
+
+    def emit(self, tag: str, created: float, data: Any) -> None:
+        """Queue a record for the background thread."""
+        item: Tuple[str, float, Any] = (tag, created, data)
+        if self._thread is None:
+            self._start()
+        if not self.queue_circular:
+            self._queue.put(item)
+            return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _start(self) -> None:
+        """Start the background thread."""
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._send_loop, name=f"ondewo-logging-fluent-{self.address}", daemon=True,
+                )
+                self._thread.start()
+
+    def _send_loop(self) -> None:
+        """Send the queued records in batches until the sender is closed."""
+        stop: bool = False
+        packer: RecordPacker = self._new_record_packer()
+        while not stop:
+            items: List[Any] = [self._queue.get()]
+            while len(items) < self.max_batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in items:
+                if item is self._STOP:
+                    stop = True
+                    continue
+                if self.verbose:
+                    print(item)
+                try:
+                    packer.add(*item)
+                except Exception:
+                    pass
+            try:
+                packer.write(self.write)
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """Send the queued records and close the connections."""
+        with self._thread_lock:
+            thread: Optional[threading.Thread] = self._thread
+            self._thread = None
+            loop_senders: List[LoopSender] = list(self._loop_senders.values())
+            self._loop_senders.clear()
+        for loop_sender in loop_senders:
+            loop_sender.close_threadsafe()
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join(self.timeout)
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+
+
+class LoopSender:
+    """Sends the records logged in the coroutines of one asyncio event loop through a transport of that loop.
+
+    The records are packed when they are logged and written in one batch from a callback of the next iteration of the
+    loop, so all records of an iteration cost one write which never blocks the loop. The connection is opened in the
+    background with the first record. Until it is open and while it is down, the records are kept in a buffer of up
+    to bufmax bytes (like the FluentSender of fluent-logger), beyond that the buffer is handed to the
+    buffer_overflow_handler of the pooled sender and dropped. A failed attempt to connect is repeated after
+    RECONNECT_DELAY seconds while records are buffered, also if no further records are logged. If the loop shuts
+    down while connecting (e.g. at the end of asyncio.run), the buffered records are sent with the blocking connection
+    of the pooled sender. A LoopSender is only used from the thread of its loop, except for close_threadsafe.
+    """
+
+    # seconds to wait before the next attempt to connect after a failed one
+    RECONNECT_DELAY: float = 1.0
+
+    def __init__(self, pooled_sender: PooledSender, loop: "asyncio.AbstractEventLoop") -> None:
+        self.pooled_sender: PooledSender = pooled_sender
+        self.loop: "asyncio.AbstractEventLoop" = loop
+        self.bufmax: int = pooled_sender._sender_arguments.get("bufmax", 1 << 20)
+        self.last_error: Optional[Exception] = None
+        self._packer: RecordPacker = pooled_sender._new_record_packer()
+        # records which were not written since the connection is not open
+        self._pending: bytearray = bytearray()
+        self._writer: Optional["asyncio.StreamWriter"] = None
+        self._connecting: Optional["asyncio.Task[None]"] = None
+        self._reconnect_at: float = 0.0
+        self._flush_scheduled: bool = False
+        self._closed: bool = False
+
+    def emit(self, tag: str, created: float, data: Any) -> None:
+        """Pack a record and schedule the write of the records of this iteration of the loop."""
+        if self.pooled_sender.verbose:
+            print((tag, created, data))
+        self._packer.add(tag=tag, created=created, data=data)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        """Write the packed records."""
+        self._flush_scheduled = False
+        self._packer.write(self._write)
+
+    def _write(self, records: memoryview) -> bool:
+        writer: Optional["asyncio.StreamWriter"] = self._writer
+        if writer is not None and writer.is_closing():
+            self._writer = writer = None
+        if writer is None or self._pending:
+            self._buffer(records)
+            self._connect()
+            return False
+        if writer.transport.get_write_buffer_size() > self.bufmax:
+            # fluentd doesn't keep up, don't let the buffer of the transport grow without bounds
+            self._overflow(bytes(records))
+            return False
+        # the transport may keep the data, it must not be the reused buffer of the packer
+        writer.write(bytes(records))
+        return True
+
+    def _buffer(self, records: Any) -> bool:
+        """Keep records until the connection is open.
+
+        Returns:
+            False, the records were not written
+        """
+        self._pending += records
+        if len(self._pending) > self.bufmax:
+            self._overflow(bytes(self._pending))
+            self._pending.clear()
+        return False
+
+    def _overflow(self, data: bytes) -> None:
+        handler: Any = self.pooled_sender._sender_arguments.get("buffer_overflow_handler")
+        if handler is not None:
+            try:
+                handler(data)
+            except Exception:
+                pass
+
+    def _connect(self) -> None:
+        if self._connecting is not None or self._closed or self.loop.time() < self._reconnect_at:
+            return
+        self._connecting = self.loop.create_task(self._open())
+        self._connecting.add_done_callback(self._connection_done)
+
+    async def _open(self) -> None:
+        """Open the connection and write the pending records."""
+        import asyncio
+
+        host: str = self.pooled_sender.host
+        try:
+            connection: Any
+            if host.startswith(UNIX_SCHEME):
+                connection = asyncio.open_unix_connection(host[len(UNIX_SCHEME):])
+            else:
+                connection = asyncio.open_connection(host, self.pooled_sender.port)
+            writer: "asyncio.StreamWriter"
+            _, writer = await asyncio.wait_for(connection, self.pooled_sender.timeout)
+        except Exception as exc:
+            self.last_error = exc
+            self._reconnect_at = self.loop.time() + self.RECONNECT_DELAY
+            self.loop.call_later(self.RECONNECT_DELAY, self._retry)
+            return
+        finally:
+            self._connecting = None
+        self._writer = writer
+        if self._pending:
+            writer.write(bytes(self._pending))
+            self._pending.clear()
+
+    def _connection_done(self, task: "asyncio.Task[None]") -> None:
+        if task.cancelled():
+            # the loop shuts down (e.g. at the end of asyncio.run) and won't write the records anymore
+            self._hand_over()
+
+    def _retry(self) -> None:
+        """Connect again after a failed attempt, if records are waiting for the connection."""
+        if self._pending and self._writer is None:
+            self._reconnect_at = 0.0
+            self._connect()
+
+    def _hand_over(self) -> None:
+        """Send the records which the loop didn't write with the blocking connection of the pooled sender."""
+        self._packer.write(self._buffer)
+        if self._pending:
+            pending: bytes = bytes(self._pending)
+            self._pending.clear()
+            self.pooled_sender.write(pending)
+
+    def close(self) -> None:
+        """Write the packed records and close the connection, in the thread of the loop.
+
+        Records which could not be written through the loop are sent with the blocking connection of the pooled
+        sender.
+        """
+        self._closed = True
+        if self.loop.is_closed():
+            self._writer = None
+        self.flush()
+        if self._connecting is not None:
+            self._connecting.cancel()
+            self._connecting = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._hand_over()
+
+    def close_threadsafe(self) -> None:
+        """Close the sender from any thread, in the loop if it is still running."""
+        import asyncio
+
+        running: Optional["asyncio.AbstractEventLoop"]
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.close)
+        else:
+            self.close()
+
+
+class SenderPool:
+    """Hands out one PooledSender per endpoint and settings, and closes it once the last handler released it.
+
+    Handlers sending to the same endpoint share a connection if they use the same settings (e.g. timeout,
+    buffer_overflow_handler, msgpack_kwargs, nanosecond_precision and queue_circular), otherwise they get a connection
+    of their own. The size of the queue is not part of the settings, it grows to the largest requested size.
+    """
+
+    def __init__(self) -> None:
+        self._senders: Dict[PoolKey, PooledSender] = {}
+        self._references: Dict[PoolKey, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def acquire(
+        self,
+        host: str = "localhost",
+        port: int = 24224,
+        queue_maxsize: int = 100,
+        **kwargs: Any,
+    ) -> PooledSender:
+        """Get the sender of the endpoint and settings, see PooledSender for the arguments."""
+        key: PoolKey = pool_key(host=host, port=port, **kwargs)
+        with self._lock:
+            sender: Optional[PooledSender] = self._senders.get(key)
+            if sender is None:
+                sender = PooledSender(host=host, port=port, queue_maxsize=queue_maxsize, **kwargs)
+                self._senders[key] = sender
+                self._references[key] = 0
+            elif queue_maxsize > sender._queue.maxsize:
+                sender._queue.maxsize = queue_maxsize
+            self._references[key] += 1
+            return sender
+
+    def release(self, sender: PooledSender) -> None:
+        """Release the sender of a handler, closing it if no other handler uses it."""
+        with self._lock:
+            keys: List[PoolKey] = [key for key, pooled in self._senders.items() if pooled is sender]
+            if not keys:
+                return
+            self._references[keys[0]] -= 1
+            if self._references[keys[0]] > 0:
+                return
+            del self._senders[keys[0]]
+            del self._references[keys[0]]
+        sender.close()
+
+    def close(self) -> None:
+        """Close all senders."""
+        with self._lock:
+            senders: List[PooledSender] = list(self._senders.values())
+            self._senders.clear()
+            self._references.clear()
+        for sender in senders:
+            sender.close()
+
+    def __contains__(self, endpoint: Endpoint) -> bool:
+        return any(key[0] == endpoint_of(*endpoint) for key in self._senders)
+
+    def __len__(self) -> int:
+        return len(self._senders)
+
+
+sender_pool: SenderPool = SenderPool()
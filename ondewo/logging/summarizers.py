@@ -0,0 +1,148 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Summaries of logged function arguments and results.
+
+Rendering an argument with str() is slow and useless for large values such as arrays, data frames, protobuf messages
+or binary payloads. The summarizer registry renders values of registered types as a short summary instead, e.g.
+
+    ndarray(shape=(32, 768), dtype=float32, min=-3.1, max=4.2, mean=0.0012)
+    bytes(length=52311, sha256=9f86d081884c)
+    ondewo.nlu.DetectIntentRequest(size=1532)
+
+Types of optional dependencies (numpy, pandas, protobuf) are registered by their qualified name, so they are never
+imported by the registry.
+"""
+
+import hashlib
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Union,
+)
+
+Summarizer = Callable[[Any], str]
+
+# summaries of larger arrays skip the statistics, which need a pass over the data
+MAX_STATISTICS_SIZE: int = 1_000_000
+
+# shorter binary values are rendered as they are
+MAX_RAW_BYTES: int = 32
+
+
+def truncate(text: str, max_length: int = -1) -> str:
+    """Truncate the text to max_length characters (-1 keeps the text as it is)."""
+    if max_length == -1 or len(text) <= max_length:
+        return text
+    return text[:max_length] + "<TRUNCATED!>"
+
+
+def summarize_array(value: Any) -> str:
+    """Shape, dtype and (for numeric arrays of up to MAX_STATISTICS_SIZE elements) min, max and mean of an array."""
+    summary: str = f"{type(value).__name__}(shape={tuple(value.shape)}, dtype={value.dtype}"
+    if 0 < value.size <= MAX_STATISTICS_SIZE and value.dtype.kind in "biuf":
+        summary += f", min={value.min():.4g}, max={value.max():.4g}, mean={value.mean():.4g}"
+    return summary + ")"
+
+
+def summarize_data_frame(value: Any) -> str:
+    """Shape and the first columns of a data frame."""
+    columns: str = ", ".join(str(column) for column in list(value.columns[:10]))
+    if len(value.columns) > 10:
+        columns += ", ..."
+    return f"{type(value).__name__}(shape={tuple(value.shape)}, columns=[{columns}])"
+
+
+def summarize_series(value: Any) -> str:
+    return f"{type(value).__name__}(name={value.name!r}, length={len(value)}, dtype={value.dtype})"
+
+
+def summarize_bytes(value: Union[bytes, bytearray, memoryview]) -> str:
+    """Short binary values as they are, longer ones as their length and the prefix of their hash."""
+    if len(value) <= MAX_RAW_BYTES:
+        return str(value)
+    return f"{type(value).__name__}(length={len(value)}, sha256={hashlib.sha256(value).hexdigest()[:12]})"
+
+
+def summarize_protobuf(value: Any) -> str:
+    """Type and serialized size of a protobuf message."""
+    return f"{value.DESCRIPTOR.full_name}(size={value.ByteSize()})"
+
+
+class SummarizerRegistry:
+    """Renders values as text, with the summarizer of the closest registered base class of their type."""
+
+    def __init__(self) -> None:
+        self._summarizers: Dict[Union[type, str], Summarizer] = {}
+        # the summarizer of each rendered type, None for types without one
+        self._resolved: Dict[type, Optional[Summarizer]] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def register(self, type_: Union[type, str], summarizer: Summarizer) -> None:
+        """Register the summarizer of a type and its subclasses.
+
+        Args:
+            type_: the type, or its qualified name (module and qualname, e.g. "numpy.ndarray") for types of optional
+                dependencies
+            summarizer: renders a value of the type as text
+        """
+        with self._lock:
+            self._summarizers[type_] = summarizer
+            self._resolved = {}
+
+    def unregister(self, type_: Union[type, str]) -> None:
+        with self._lock:
+            self._summarizers.pop(type_, None)
+            self._resolved = {}
+
+    def summarizer(self, type_: type) -> Optional[Summarizer]:
+        """The summarizer of the type, if it or one of its base classes is registered."""
+        try:
+            return self._resolved[type_]
+        except KeyError:
+            pass
+        found: Optional[Summarizer] = None
+        for base in type_.__mro__:
+            found = self._summarizers.get(base) or self._summarizers.get(f"{base.__module__}.{base.__qualname__}")
+            if found is not None:
+                break
+        self._resolved[type_] = found
+        return found
+
+    def summarize(self, value: Any, max_length: int = -1) -> str:
+        """Render the value with its summarizer or str(), truncated to max_length characters (-1 for no limit)."""
+        summarizer: Optional[Summarizer] = self.summarizer(type(value))
+        text: str
+        if summarizer is None:
+            text = str(value)
+        else:
+            try:
+                text = summarizer(value)
+            except Exception as exc:
+                text = f"{type(value).__name__}(<summary failed: {exc!r}>)"
+        return truncate(text, max_length)
+
+
+summarizers: SummarizerRegistry = SummarizerRegistry()
+summarizers.register(bytes, summarize_bytes)
+summarizers.register(bytearray, summarize_bytes)
+summarizers.register(memoryview, summarize_bytes)
+summarizers.register("numpy.ndarray", summarize_array)
+summarizers.register("pandas.core.frame.DataFrame", summarize_data_frame)
+summarizers.register("pandas.core.series.Series", summarize_series)
+summarizers.register("google.protobuf.message.Message", summarize_protobuf)
@@ -0,0 +1,299 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process stand-in for fluentd, for integration tests and benchmarks of the fluent handlers.
+
+The ForwardReceiver accepts connections over TCP or a unix domain socket, decodes all modes of the fluentd forward
+protocol (Message, Forward, PackedForward and CompressedPackedForward), acknowledges chunks if the client asks for
+it and counts what arrives. Latency, disconnects and back-pressure can be injected to see how the logging side
+behaves when fluentd is slow or restarts.
+"""
+
+import gzip
+import os
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+MESSAGE: str = "message"
+FORWARD: str = "forward"
+PACKED_FORWARD: str = "packed_forward"
+COMPRESSED_PACKED_FORWARD: str = "compressed_packed_forward"
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    """Decode the EventTime extension type of fluentd to float seconds."""
+    import msgpack
+
+    if code == 0 and len(data) == 8:
+        seconds, nanoseconds = struct.unpack(">II", data)
+        return seconds + nanoseconds / 1e9
+    return msgpack.ExtType(code, data)
+
+
+class ForwardReceiver:
+    """Local server speaking the fluentd forward protocol.
+
+    Use it as a context manager and point the handlers to its host and port:
+
+        with ForwardReceiver() as receiver:
+            handler = AsyncFluentHandler(tag="test", host=receiver.host, port=receiver.port)
+            ...
+            receiver.wait_for(100)
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        port: int = 0,
+        keep_records: bool = True,
+        ack: bool = True,
+        latency: float = 0.0,
+        disconnect_every: int = 0,
+        read_size: int = 1 << 16,
+    ) -> None:
+        """
+
+        Args:
+            path: path of a unix domain socket to listen on instead of a TCP port on 127.0.0.1
+            port: TCP port to listen on (0 picks a free one)
+            keep_records: keep the decoded records in records, otherwise they are only counted
+            ack: acknowledge the chunks of clients which ask for it
+            latency: seconds to wait before each read from a connection, simulating a slow fluentd
+            disconnect_every: drop a connection after this number of received entries (0 never drops)
+            read_size: maximal number of bytes per read
+        """
+        self.path: Optional[str] = path
+        self.keep_records: bool = keep_records
+        self.ack: bool = ack
+        self.latency: float = latency
+        self.disconnect_every: int = disconnect_every
+        self.read_size: int = read_size
+
+        self.server: socket.socket
+        if path:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(path)
+            self.host: str = f"unix://{path}"
+            self.port: int = port
+        else:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.bind(("127.0.0.1", port))
+            self.host = "127.0.0.1"
+            self.port = self.server.getsockname()[1]
+        self.server.listen()
+
+        self.records: List[Tuple[str, Any, Any]] = []
+        # received entries per mode of the forward protocol
+        self.modes: "Counter[str]" = Counter()
+        self.record_count: int = 0
+        self.bytes_received: int = 0
+        self.reads: int = 0
+        self.connections: int = 0
+        self.disconnects: int = 0
+        self.acks: int = 0
+        self._sockets: List[socket.socket] = []
+        self._lock: threading.Lock = threading.Lock()
+        self._received: threading.Condition = threading.Condition(self._lock)
+        self._reading: threading.Event = threading.Event()
+        self._reading.set()
+        self._closed: bool = False
+        self._thread: threading.Thread = threading.Thread(
+            target=self._serve, name="ondewo-logging-forward-receiver", daemon=True,
+        )
+        self._thread.start()
+
+    def __enter__(self) -> "ForwardReceiver":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self.close()
+
+    def _serve(self) -> None:
+        """Accept connections until the receiver is closed."""
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+                self._sockets.append(connection)
+            threading.Thread(
+                target=self._receive, args=(connection,), name="ondewo-logging-forward-connection", daemon=True,
+            ).start()
+
+    def _receive(self, connection: socket.socket) -> None:
+        """Decode the entries of a connection until it is closed."""
+        import msgpack
+
+        unpacker: Any = msgpack.Unpacker(raw=False, ext_hook=_ext_hook)
+        entries: int = 0
+        with connection:
+            while True:
+                self._reading.wait()
+                if self.latency:
+                    time.sleep(self.latency)
+                try:
+                    data: bytes = connection.recv(self.read_size)
+                except OSError:
+                    break
+                if not data:
+                    break
+                with self._lock:
+                    self.reads += 1
+                    self.bytes_received += len(data)
+                unpacker.feed(data)
+                for entry in unpacker:
+                    chunk: Optional[str] = self._handle(entry)
+                    if chunk is not None and self.ack:
+                        with self._lock:
+                            self.acks += 1
+                        try:
+                            connection.sendall(msgpack.packb({"ack": chunk}))
+                        except OSError:
+                            break
+                    entries += 1
+                    if self.disconnect_every and entries % self.disconnect_every == 0:
+                        # the rest of the read data is lost, the next read ends the connection
+                        with self._lock:
+                            self.disconnects += 1
+                        self._drop(connection)
+                        break
+        with self._lock:
+            if connection in self._sockets:
+                self._sockets.remove(connection)
+
+    def _handle(self, entry: Any) -> Optional[str]:
+        """Decode and count an entry, return the chunk id to acknowledge if any."""
+        tag: str = entry[0]
+        mode: str
+        events: List[Tuple[Any, Any]]
+        option: Any = None
+        if isinstance(entry[1], list):
+            mode = FORWARD
+            events = [(event[0], event[1]) for event in entry[1]]
+            option = entry[2] if len(entry) > 2 else None
+        elif isinstance(entry[1], (bytes, bytearray)):
+            option = entry[2] if len(entry) > 2 else None
+            data: bytes = entry[1]
+            mode = PACKED_FORWARD
+            if isinstance(option, dict) and option.get("compressed") == "gzip":
+                mode = COMPRESSED_PACKED_FORWARD
+                data = gzip.decompress(data)
+            events = [(event[0], event[1]) for event in self._unpack_stream(data)]
+        else:
+            mode = MESSAGE
+            events = [(entry[1], entry[2])]
+            option = entry[3] if len(entry) > 3 else None
+
+        with self._received:
+            self.modes[mode] += 1
+            self.record_count += len(events)
+            if self.keep_records:
+                self.records.extend((tag, timestamp, record) for timestamp, record in events)
+            self._received.notify_all()
+
+        if isinstance(option, dict) and "chunk" in option:
+            return option["chunk"]  # type: ignore
+        return None
+
+    @staticmethod
+    def _unpack_stream(data: bytes) -> List[Any]:
+        import msgpack
+
+        unpacker: Any = msgpack.Unpacker(raw=False, ext_hook=_ext_hook)
+        unpacker.feed(data)
+        return list(unpacker)
+
+    @staticmethod
+    def _drop(connection: socket.socket) -> None:
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def pause(self) -> None:
+        """Stop reading from the connections, so the socket buffers fill up and the senders feel back-pressure."""
+        self._reading.clear()
+
+    def resume(self) -> None:
+        """Continue reading from the connections."""
+        self._reading.set()
+
+    def disconnect(self) -> None:
+        """Drop all connections, as a restart of fluentd would."""
+        with self._lock:
+            sockets: List[socket.socket] = list(self._sockets)
+            self.disconnects += len(sockets)
+        for connection in sockets:
+            self._drop(connection)
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> bool:
+        """Wait until at least count records were received.
+
+        Args:
+            count: number of records
+            timeout: maximal number of seconds to wait
+
+        Returns:
+            whether the records were received in time
+        """
+        with self._received:
+            return self._received.wait_for(lambda: self.record_count >= count, timeout)
+
+    def messages(self, tag: Optional[str] = None) -> List[Any]:
+        """The "message" fields of the kept records, optionally only of one tag."""
+        return [
+            record.get("message") if isinstance(record, dict) else record
+            for record_tag, _, record in self.records
+            if tag is None or record_tag == tag
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the received data."""
+        with self._lock:
+            return {
+                "records": self.record_count,
+                "bytes": self.bytes_received,
+                "reads": self.reads,
+                "connections": self.connections,
+                "disconnects": self.disconnects,
+                "acks": self.acks,
+                "modes": dict(self.modes),
+            }
+
+    def close(self) -> None:
+        """Stop listening and drop all connections."""
+        if self._closed:
+            return
+        self._closed = True
+        self.resume()
+        self.server.close()
+        with self._lock:
+            sockets: List[socket.socket] = list(self._sockets)
+        for connection in sockets:
+            self._drop(connection)
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
@@ -60,6 +60,6 @@ def log_store() -> Iterator[MockLoggingHandler]:
 @pytest.fixture(scope="function")
 def logger() -> Iterator[logging.Logger]:
     logger = logger_console
-    while len(logger.handlers) > 1:
-        logger.handlers.pop()
+    # keep the handlers of the config, which are named, and drop the ones added by earlier tests
+    logger.handlers[:] = [handler for handler in logger.handlers if handler.name]
     yield logger
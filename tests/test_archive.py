@@ -0,0 +1,168 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+import pytest
+
+from ondewo.logging.archive import (
+    ArchiveHandler,
+    Query,
+    Segment,
+    index_path,
+    main,
+    parse_time,
+    query,
+)
+
+
+def record(i: int, **fields: Any) -> logging.LogRecord:
+    level: int = logging.WARNING if i % 10 == 0 else logging.INFO
+    return logging.makeLogRecord({
+        "msg": {"message": f"record {i}", "tags": ["timing"] if i % 3 == 0 else [], "request_id": i % 7, **fields},
+        "created": 1000.0 + i,
+        "levelno": level,
+        "levelname": logging.getLevelName(level),
+        "name": "test",
+    })
+
+
+def messages(records: Any) -> List[str]:
+    return [data["message"] for data in records]
+
+
+@pytest.fixture
+def archive(tmp_path: Path) -> Path:
+    handler: ArchiveHandler = ArchiveHandler(str(tmp_path / "service.olog"), index_keys=["request_id"], max_bytes=2000)
+    for i in range(200):
+        handler.handle(record(i))
+    handler.close()
+    return tmp_path
+
+
+class TestArchive:
+    @staticmethod
+    def test_segments_are_indexed(archive: Path) -> None:
+        segments: List[Path] = sorted(archive.glob("service.*-*.olog"))
+
+        assert len(segments) > 5
+        assert all(Path(index_path(str(segment))).exists() for segment in segments)
+        assert messages(query([str(archive)])) == [f"record {i}" for i in range(200)]
+
+    @staticmethod
+    @pytest.mark.parametrize("use_mmap", [False, True])
+    @pytest.mark.parametrize(
+        "criteria, expected",
+        [
+            (Query(tags=["timing"], context={"request_id": 3}), [i for i in range(200) if i % 21 == 3]),
+            (Query(start=1050.0, end=1060.0), list(range(50, 60))),
+            (Query(level="WARNING", start=1100.0), list(range(100, 200, 10))),
+            (Query(context={"message": "record 42"}), [42]),
+            (Query(tags=["other"]), []),
+        ],
+    )
+    def test_query(archive: Path, use_mmap: bool, criteria: Query, expected: List[int]) -> None:
+        assert messages(query([str(archive)], criteria, use_mmap)) == [f"record {i}" for i in expected]
+
+    @staticmethod
+    def test_index_selects_records(archive: Path) -> None:
+        segment: Segment = Segment(str(sorted(archive.glob("service.*-*.olog"))[0]))
+
+        assert segment.index is not None
+        selected: List[int] = segment.index.select(Query(tags=["timing"], context={"request_id": 0}))
+        assert [segment.index.times[number] for number in selected] == [
+            1000.0 + i for i in range(len(segment.index)) if i % 21 == 0
+        ]
+        assert segment.index.select(Query(start=5000.0)) == []
+
+    @staticmethod
+    def test_scans_files_without_index(tmp_path: Path) -> None:
+        (tmp_path / "service.20240115T103000-000.olog").write_bytes(b"")
+        handler: ArchiveHandler = ArchiveHandler(str(tmp_path / "service.olog"), index_keys=["request_id"])
+        for i in range(5):
+            handler.handle(record(i))
+
+        # the active file is scanned, a truncated record at its end is skipped
+        with open(handler.filename, "ab") as file:
+            file.write(b"\x10\x00\x00\x00truncated")
+        assert messages(query([str(tmp_path)], Query(context={"request_id": 3}))) == ["record 3"]
+        assert messages(query([str(tmp_path)], Query(context={"request_id": 4}), use_mmap=True)) == ["record 4"]
+
+        # the files of an earlier process are rotated and indexed when the next handler is created
+        handler._fd = None
+        handler.close()
+        handler = ArchiveHandler(str(tmp_path / "service.olog"), index_keys=["request_id"])
+        handler.close()
+        assert all(Path(index_path(str(segment))).exists() for segment in tmp_path.glob("service.*-*.olog"))
+        assert messages(query([str(tmp_path)], Query(context={"request_id": 3}))) == ["record 3"]
+
+    @staticmethod
+    def test_retention_deletes_indexes(tmp_path: Path) -> None:
+        handler: ArchiveHandler = ArchiveHandler(str(tmp_path / "service.olog"), max_bytes=2000, max_total_bytes=5000)
+        for i in range(200):
+            handler.handle(record(i))
+        handler.close()
+
+        segments: List[Path] = sorted(tmp_path.glob("service.*-*.olog"))
+        assert sorted(tmp_path.glob("*.idx")) == [Path(index_path(str(segment))) for segment in segments]
+        assert messages(query([str(tmp_path)]))[-1] == "record 199"
+        assert sum(segment.stat().st_size for segment in segments) <= 5000
+
+
+class TestArchiveCommand:
+    @staticmethod
+    def test_export_json_lines(archive: Path, tmp_path: Path) -> None:
+        output: Path = tmp_path / "export.jsonl"
+
+        assert main([str(archive), "--tag", "timing", "--context", "request_id=3", "--mmap", "-o", str(output)]) == 0
+
+        lines: List[Dict[str, Any]] = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [line["message"] for line in lines] == [f"record {i}" for i in range(200) if i % 21 == 3]
+        assert lines[0]["time"] == "1970-01-01T00:16:43.000000+00:00"
+        assert (lines[0]["level"], lines[0]["logger"], lines[0]["request_id"]) == ("INFO", "test", 3)
+
+    @staticmethod
+    def test_export_archive(archive: Path, tmp_path: Path, capsys: Any) -> None:
+        output: Path = tmp_path / "export" / "slice.olog"
+        output.parent.mkdir()
+
+        main([str(archive), "--start", "1970-01-01T00:18:20", "--level", "warning", "--format", "archive",
+              "-o", str(output)])
+        main([str(output.parent), "--count"])
+
+        assert capsys.readouterr().out == "10\n"
+        assert messages(query([str(output)], Query(end=1110.0))) == ["record 100"]
+
+    @staticmethod
+    def test_invalid_arguments(archive: Path) -> None:
+        with pytest.raises(SystemExit):
+            main([str(archive), "--context", "request_id"])
+        with pytest.raises(SystemExit):
+            main([str(archive), "--level", "LOUD"])
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "text, expected",
+        [("1700000000.5", 1700000000.5), ("2023-11-14T22:13:20Z", 1700000000.0), ("2023-11-14T23:13:20+01:00", 1700000000.0),
+         ("2023-11-14T22:13:20", 1700000000.0)],
+    )
+    def test_parse_time(text: str, expected: float) -> None:
+        assert parse_time(text) == expected
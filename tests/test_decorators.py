@@ -12,7 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import gc
+import logging
 import re
+import time
+import tracemalloc
 from logging import Logger
 from multiprocessing.pool import ThreadPool
 from threading import (
@@ -24,6 +29,7 @@ from typing import (
     Any,
     Callable,
     Dict,
+    Iterator,
     List,
     Set,
     Union,
@@ -33,8 +39,10 @@ import pytest
 
 from ondewo.logging.constants import CONTEXT
 from ondewo.logging.decorators import (
+    MemoryProfiler,
     ThreadContextLogger,
     Timer,
+    _percentile,
     exception_handling,
     exception_silencing,
     timing,
@@ -43,6 +51,7 @@ from ondewo.logging.logger import (
     logger,
     logger_console,
 )
+from ondewo.logging.sampling import stack_sampler
 from tests.conftest import MockLoggingHandler
 
 
@@ -686,3 +695,427 @@ def test_logging(logger, log_store) -> None:
     logger.info('Info message')
     assert log_store.messages['debug'] == ['Debug message']
     assert log_store.messages['info'] == ['Info message']
+
+
+def test_exception_fingerprint() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append, suppress_exceptions=True, log_arguments=False)
+    def error_function(key: str) -> None:
+        {}[key]
+
+    for key in ["first_key", "second_key"]:
+        error_function(key)
+
+    exception_logs: List[Dict[str, Any]] = [
+        log for log in logs if isinstance(log, dict) and "exception fingerprint" in log
+    ]
+    assert len(exception_logs) == 2
+    assert exception_logs[0]["exception fingerprint"] == exception_logs[1]["exception fingerprint"]
+    assert exception_logs[1]["exception count"] == exception_logs[0]["exception count"] + 1
+    assert exception_logs[1]["traceback"] is None
+
+
+def timing_logs(logs: List[Any]) -> List[Dict[str, Any]]:
+    return [log for log in logs if isinstance(log, dict) and "duration" in log]
+
+
+def test_generator() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append)
+    def generator(n: int) -> Any:
+        sleep(0.01)
+        for i in range(n):
+            yield i
+        return "done"
+
+    items: Any = generator(3)
+    assert timing_logs(logs) == []
+    sleep(0.02)
+    assert list(items) == [0, 1, 2]
+
+    [log] = timing_logs(logs)
+    assert log["items"] == 3
+    assert log["duration"] == pytest.approx(0.01, abs=0.005)
+    assert log["time to first item"] >= 0.03
+    assert log["wall time"] >= log["time to first item"] >= log["duration"]
+    assert "3 items, returned done" in logs[-2]["result"]
+
+
+def test_generator_send_and_close() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append, log_arguments=False)
+    def accumulate() -> Any:
+        total: int = 0
+        while True:
+            total += yield total
+
+    generator: Any = accumulate()
+    next(generator)
+    assert generator.send(2) == 2
+    assert generator.send(3) == 5
+    generator.close()
+
+    [log] = timing_logs(logs)
+    assert log["items"] == 3
+
+
+def test_generator_exception() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append, log_arguments=False)
+    def failing() -> Any:
+        yield 1
+        raise ValueError("broken stream")
+
+    with pytest.raises(ValueError):
+        list(failing())
+
+    assert any(isinstance(log, dict) and log.get("exception value") == "broken stream" for log in logs)
+    [log] = timing_logs(logs)
+    assert log["items"] == 1
+
+
+def test_async_generator() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append, log_arguments=False)
+    async def stream(n: int) -> Any:
+        for i in range(n):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def consume() -> List[int]:
+        items: List[int] = [item async for item in stream(3)]
+        generator: Any = stream(5)
+        await generator.__anext__()
+        await generator.aclose()
+        return items
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+
+    exhausted, closed = timing_logs(logs)
+    assert exhausted["items"] == 3
+    assert exhausted["duration"] >= 0.03
+    assert exhausted["time to first item"] >= 0.01
+    assert closed["items"] == 1
+
+
+def test_resource_fields() -> None:
+    logs: List[Any] = []
+    kept: List[Any] = []
+
+    @Timer(logger=logs.append, log_arguments=False, cpu_time=True, gc_time=True, allocations=True)
+    def busy() -> None:
+        start: float = time.perf_counter()
+        while time.perf_counter() - start < 0.02:
+            pass
+        kept.extend(object() for _ in range(1000))
+
+    @Timer(logger=logs.append, log_arguments=False, gc_time=True)
+    def collecting() -> None:
+        gc.collect()
+
+    @Timer(logger=logs.append, log_arguments=False, cpu_time=True)
+    def waiting() -> None:
+        sleep(0.02)
+
+    busy()
+    collecting()
+    waiting()
+
+    busy_log, collecting_log, waiting_log = timing_logs(logs)
+    assert busy_log["cpu time"] > busy_log["duration"] / 4
+    assert collecting_log["gc collections"] >= 1
+    assert 0 < collecting_log["gc time"] <= collecting_log["duration"]
+    assert busy_log["allocated blocks"] >= 900
+    assert waiting_log["cpu time"] < waiting_log["duration"] / 4
+    assert "gc time" not in waiting_log
+    assert "allocated blocks" not in waiting_log
+
+
+def test_resource_fields_context_manager_and_generator() -> None:
+    logs: List[Any] = []
+
+    with Timer(logger=logs.append, cpu_time=True):
+        sleep(0.01)
+
+    @Timer(logger=logs.append, log_arguments=False, cpu_time=True)
+    def generator() -> Any:
+        yield 1
+        sleep(0.01)
+        yield 2
+
+    assert list(generator()) == [1, 2]
+
+    context_log, generator_log = timing_logs(logs)
+    assert context_log["cpu time"] < context_log["duration"]
+    assert generator_log["cpu time"] < generator_log["duration"]
+
+
+class TestMemoryProfiler:
+    @staticmethod
+    def test_peak_and_growth() -> None:
+        logs: List[Any] = []
+        kept: List[bytes] = []
+
+        @MemoryProfiler(logger=logs.append)
+        def allocate() -> None:
+            temporary: bytes = bytes(4 * 2 ** 20)
+            kept.append(bytes(2 * 2 ** 20))
+            del temporary
+
+        allocate()
+
+        [log] = logs
+        assert log["tags"] == ["memory"]
+        assert log["memory growth"] == pytest.approx(2 * 2 ** 20, rel=0.05)
+        assert log["memory peak"] == pytest.approx(6 * 2 ** 20, rel=0.05)
+        assert "'allocate'" in log["message"]
+        assert "top allocations" not in log
+        assert not tracemalloc.is_tracing()
+
+    @staticmethod
+    def test_top_lines() -> None:
+        logs: List[Any] = []
+        kept: List[Any] = []
+
+        with MemoryProfiler(logger=logs.append, top_lines_threshold=2 ** 20, top_lines=3):
+            kept.extend(bytes(1000) for _ in range(2000))
+        with MemoryProfiler(logger=logs.append, top_lines_threshold=2 ** 30):
+            kept.extend(bytes(1000) for _ in range(2000))
+
+        assert len(logs[0]["top allocations"]) <= 3
+        assert "test_decorators.py" in logs[0]["top allocations"][0]
+        assert "top allocations" not in logs[1]
+
+    @staticmethod
+    def test_keeps_running_tracemalloc() -> None:
+        logs: List[Any] = []
+        tracemalloc.start()
+        try:
+            with MemoryProfiler(logger=logs.append):
+                with MemoryProfiler(logger=logs.append, name="inner"):
+                    pass
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
+        assert "'inner'" in logs[0]["message"]
+        assert CONTEXT in logs[1]["message"]
+
+    @staticmethod
+    def test_nested_peaks() -> None:
+        logs: List[Any] = []
+        kept: List[bytes] = []
+
+        with MemoryProfiler(logger=logs.append, name="outer"):
+            temporary: bytes = bytes(8 * 2 ** 20)
+            del temporary
+            with MemoryProfiler(logger=logs.append, name="small"):
+                kept.append(bytes(2 ** 20))
+            with MemoryProfiler(logger=logs.append, name="large"):
+                temporary = bytes(16 * 2 ** 20)
+                del temporary
+
+        small, large, outer = logs
+        # the peak of the outer call is not reset by the nested calls
+        assert outer["memory peak"] == pytest.approx(17 * 2 ** 20, rel=0.05)
+        assert "memory peak exact" not in outer
+        assert large["memory peak"] == pytest.approx(16 * 2 ** 20, rel=0.05)
+        assert "memory peak exact" not in large
+        # the 8 MiB peak before the small call is older than the call
+        assert small["memory growth"] == pytest.approx(2 ** 20, rel=0.05)
+        assert small["memory peak exact"] is False
+        assert small["memory peak"] >= small["memory growth"]
+
+    @staticmethod
+    def test_rss() -> None:
+        logs: List[Any] = []
+        kept: List[bytearray] = []
+
+        with MemoryProfiler(logger=logs.append, use_rss=True):
+            # touch the pages so that they are resident
+            kept.append(bytearray(b"x" * (32 * 2 ** 20)))
+
+        assert logs[0]["memory growth"] >= 16 * 2 ** 20
+        assert logs[0]["memory peak"] >= logs[0]["memory growth"]
+
+
+def test_stack_sampling() -> None:
+    logs: List[Any] = []
+
+    def spin(seconds: float) -> None:
+        start: float = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            pass
+
+    @Timer(logger=logs.append, log_arguments=False, sample_after=0.01)
+    def slow_or_fast(seconds: float) -> None:
+        spin(seconds)
+
+    slow_or_fast(0.05)
+    slow_or_fast(0.0)
+    with Timer(logger=logs.append, sample_after=0.01):
+        spin(0.05)
+
+    slow_log, fast_log, context_log = timing_logs(logs)
+    assert slow_log["stack samples"] >= 3
+    # the stacks start at the decorated function
+    assert slow_log["collapsed stacks"][0].startswith("tests.test_decorators:")
+    assert "slow_or_fast;tests.test_decorators:" in slow_log["collapsed stacks"][0]
+    assert "spin" in slow_log["collapsed stacks"][0]
+    assert "stack samples" not in fast_log
+    assert context_log["collapsed stacks"][0].startswith("tests.test_decorators:test_stack_sampling;")
+
+
+def test_stack_sampling_stops_on_base_exception() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append, log_arguments=False, sample_after=0.01)
+    def interrupted() -> None:
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        interrupted()
+
+    assert not stack_sampler._watches
+    assert len(timing_logs(logs)) == 1
+
+
+class TestBufferingScope:
+    @staticmethod
+    @pytest.fixture
+    def quiet_logger(log_store: MockLoggingHandler, logger: Logger) -> Iterator[Logger]:
+        logger.addHandler(log_store)
+        level: int = logger.level
+        logger.setLevel(logging.WARNING)
+        yield logger
+        logger.setLevel(level)
+        logger.removeHandler(log_store)
+
+    @staticmethod
+    def test_discarded_on_success(log_store: MockLoggingHandler, quiet_logger: Logger) -> None:
+        with ThreadContextLogger(context_dict={"request": "ok"}, logger=quiet_logger, buffer_size=10):
+            quiet_logger.debug({"message": "debug"})
+            quiet_logger.info({"message": "info"})
+            quiet_logger.warning({"message": "warning"})
+
+        assert log_store.messages["debug"] == []
+        assert log_store.messages["info"] == []
+        assert len(log_store.messages["warning"]) == 1
+        assert quiet_logger.thread_buffer_levels == {}  # type: ignore
+        # outside of the scope the level of the logger applies again, without checking for buffering scopes
+        assert not quiet_logger.isEnabledFor(logging.DEBUG)
+        assert "isEnabledFor" not in vars(quiet_logger)
+
+    @staticmethod
+    def test_enabled_records_are_logged(log_store: MockLoggingHandler, quiet_logger: Logger) -> None:
+        quiet_logger.setLevel(logging.INFO)
+        with ThreadContextLogger(logger=quiet_logger, buffer_size=10):
+            quiet_logger.debug("debug")
+            quiet_logger.info("info")
+
+        assert log_store.messages["debug"] == []
+        assert log_store.messages["info"] == ["info"]
+
+    @staticmethod
+    def test_flushed_on_error(log_store: MockLoggingHandler, quiet_logger: Logger) -> None:
+        with ThreadContextLogger(context_dict={"request": "failed"}, logger=quiet_logger, buffer_size=10):
+            quiet_logger.debug({"message": "debug"})
+            quiet_logger.info({"message": "info"})
+            quiet_logger.error({"message": "error"})
+
+        assert ["'request': 'failed'" in message for message in log_store.messages["debug"]] == [True]
+        assert len(log_store.messages["info"]) == 1
+        assert len(log_store.messages["error"]) == 1
+
+    @staticmethod
+    def test_flushed_on_exception(log_store: MockLoggingHandler, quiet_logger: Logger) -> None:
+        with pytest.raises(ValueError):
+            with ThreadContextLogger(logger=quiet_logger, buffer_size=10):
+                quiet_logger.debug("debug before the exception")
+                raise ValueError()
+
+        assert log_store.messages["debug"] == ["debug before the exception"]
+
+    @staticmethod
+    def test_other_threads_are_not_buffered(log_store: MockLoggingHandler, quiet_logger: Logger) -> None:
+        def log_debug() -> None:
+            quiet_logger.debug("other thread")
+            quiet_logger.warning("other thread")
+
+        with ThreadContextLogger(logger=quiet_logger, buffer_size=10):
+            thread: Thread = Thread(target=log_debug)
+            thread.start()
+            thread.join()
+
+        assert log_store.messages["debug"] == []
+        assert log_store.messages["warning"] == ["other thread"]
+
+
+def test_argument_summaries(log_store: MockLoggingHandler, logger: Logger) -> None:
+    logger.addHandler(log_store)
+
+    @Timer(logger=logger.info)
+    def checksum(*payloads: Any) -> int:
+        return len(payloads)
+
+    # the positional arguments are logged in order and with duplicates, long binary values are summarized
+    checksum("b", "a", "b", b"x" * 1000)
+    log: Any = [message for message in log_store.messages["info"] if "Function arguments log" in message][0]
+    assert "'args': \"['b', 'a', 'b', 'bytes(length=1000, sha256=" in log
+    log_store.reset()
+
+
+def test_benchmark() -> None:
+    logs: List[Any] = []
+    calls: List[int] = []
+    timer: Timer = Timer(logger=logs.append)
+
+    def work(n: int, pause: float = 0.0) -> int:
+        calls.append(n)
+        assert not gc.isenabled() or len(calls) <= 2
+        sleep(pause)
+        return n * 2
+
+    fields: Dict[str, Any] = timer.benchmark(work, 3, pause=0.001, repeat=20, warmup=2, disable_gc=True)
+
+    assert len(calls) == 22
+    assert gc.isenabled()
+    assert fields["runs"] == 20
+    assert fields["warmup runs"] == 2
+    assert 0.001 <= fields["duration min"] <= fields["duration median"] <= fields["duration p95"]
+    assert fields["duration p95"] <= fields["duration p99"] <= fields["duration max"]
+    assert fields["duration stddev"] >= 0
+    assert fields["duration total"] == pytest.approx(20 * fields["duration mean"])
+    assert fields["gc disabled"]
+
+    # a single timing record with the median as its duration
+    log, = timing_logs(logs)
+    assert log["duration"] == fields["duration median"]
+    assert log["tags"] == ["timing", "benchmark"]
+    assert log["message"].startswith("Benchmark of ") and "over 20 runs" in log["message"]
+
+    with pytest.raises(ValueError):
+        timer.benchmark(work, 1, repeat=0)
+
+
+@pytest.mark.parametrize("percent, expected", [(0, 1.0), (50, 3.0), (95, 4.8), (100, 5.0)])
+def test_percentile(percent: float, expected: float) -> None:
+    assert _percentile([1, 2, 3, 4, 5], percent) == pytest.approx(expected)
+
+
+def test_benchmark_decorator() -> None:
+    logs: List[Any] = []
+
+    @Timer(logger=logs.append).benchmarked(repeat=5, warmup=0)
+    def square(n: int) -> int:
+        return n * n
+
+    assert square(4) == 16
+    assert square.__name__ == "square"
+    log, = timing_logs(logs)
+    assert log["runs"] == 5
+    assert not log["gc disabled"]
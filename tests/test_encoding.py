@@ -0,0 +1,116 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+from typing import (
+    Any,
+    List,
+)
+
+import msgpack
+
+from ondewo.logging.encoding import RecordPacker
+from ondewo.logging.events import TimerFinished
+from ondewo.logging.senders import PooledSender
+
+
+def unpack_all(data: Any) -> List[Any]:
+    unpacker: msgpack.Unpacker = msgpack.Unpacker()
+    unpacker.feed(data)
+    return list(unpacker)
+
+
+class TestRecordPacker:
+    @staticmethod
+    def test_batch() -> None:
+        packer: RecordPacker = RecordPacker()
+        written: List[Any] = []
+
+        def write(data: Any) -> bool:
+            written.append(bytes(data))
+            return isinstance(data, memoryview)
+
+        for i in range(3):
+            packer.add(tag="app.test", created=100.0 + i, data={"message": f"record {i}"})
+        packer.add(tag="app.test", created=103.0, data=TimerFinished(0.5, "f", "MainThread"))
+        assert len(packer) == 4
+
+        # all records are written at once from the buffer of the packer
+        assert packer.write(write)
+        assert len(written) == 1
+        records: List[Any] = unpack_all(written[0])
+        assert records[:3] == [["app.test", 100 + i, {"message": f"record {i}"}] for i in range(3)]
+        assert records[3][2] == TimerFinished(0.5, "f", "MainThread").to_dict()
+
+        # the buffer is reused
+        assert not packer
+        assert packer.write(write)
+        assert len(written) == 1
+        assert unpack_all(packer.pack(tag="app.test", created=104.0, data={"a": 1})) == [["app.test", 104, {"a": 1}]]
+
+    @staticmethod
+    def test_error() -> None:
+        errors: List[Exception] = []
+        packer: RecordPacker = RecordPacker(on_error=errors.append)
+        written: List[bytes] = []
+
+        packer.add(tag="app.test", created=100.0, data={"message": "before"})
+        packer.add(tag="app.test", created=101.0, data={"message": "broken", "value": object()})
+        packer.add(tag="app.test", created=102.0, data={"message": "after"})
+        packer.write(lambda data: written.append(bytes(data)) is None)
+
+        # the partially packed record is replaced by an error record
+        records: List[Any] = unpack_all(written[0])
+        assert [record[2]["message"] for record in records] == ["before", "Can't output to log", "after"]
+        assert records[1][2]["level"] == "CRITICAL"
+        assert len(errors) == 1
+
+    @staticmethod
+    def test_release() -> None:
+        packer: RecordPacker = RecordPacker(initial_size=100, max_retained_size=1000)
+        packer.add(tag="app.test", created=100.0, data={"message": "x" * 500})
+        buffer: bytearray = packer._buffer
+
+        # the buffer only grows when necessary
+        packer.write(lambda data: True)
+        assert packer._buffer is buffer
+        packer.add(tag="app.test", created=100.0, data={"message": "x" * 2000})
+        packer.write(lambda data: True)
+        assert packer._buffer is not buffer
+        assert len(packer._buffer) == 100
+
+    @staticmethod
+    def test_nanosecond_precision() -> None:
+        packer: RecordPacker = RecordPacker(nanosecond_precision=True)
+        packet: bytes = packer.pack(tag="app.test", created=100.5, data={})
+
+        timestamp: Any = unpack_all(packet)[0][1]
+        assert isinstance(timestamp, msgpack.ExtType)
+        assert timestamp.code == 0
+
+
+def test_pending_buffer_is_copied() -> None:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+
+    sender: PooledSender = PooledSender(host="127.0.0.1", port=port, timeout=0.5)
+    try:
+        assert not sender.send(tag="app.test", created=100.0, data={"message": "pending"})
+        # the record stays pending as bytes, the buffer of the packer is reused for the next records
+        assert isinstance(sender.sender.pendings, bytes)
+        assert not sender.send(tag="app.test", created=101.0, data={"message": "also pending"})
+        assert [record[2]["message"] for record in unpack_all(sender.sender.pendings)] == ["pending", "also pending"]
+    finally:
+        sender.close()
@@ -0,0 +1,179 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+from logging import (
+    Logger,
+    LogRecord,
+    makeLogRecord,
+)
+from threading import get_ident
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+import msgpack
+import pytest
+
+from ondewo.logging.events import (
+    Event,
+    ExceptionRaised,
+    GrpcRequest,
+    TimerFinished,
+    event_types,
+)
+from ondewo.logging.filters import (
+    DeduplicationFilter,
+    ThreadContextFilter,
+)
+from ondewo.logging.handlers import FluentRecordFormatter
+from ondewo.logging.lazy import Lazy
+from tests.conftest import MockLoggingHandler
+
+
+class CacheMiss(Event):
+    __slots__ = ("cache", "key")
+    template_id = "test.cache.miss"
+    template = "Cache {} missed {!r}."
+    tags = ("cache",)
+
+
+class TestEvents:
+    @staticmethod
+    def test_fields() -> None:
+        event: CacheMiss = CacheMiss("models", key="bert")
+
+        assert CacheMiss.fields == ("cache", "key")
+        assert event_types["test.cache.miss"] is CacheMiss
+        assert event.message == "Cache models missed 'bert'."
+        assert event.to_dict() == {
+            "message": "Cache models missed 'bert'.",
+            "cache": "models",
+            "key": "bert",
+            "template_id": "test.cache.miss",
+            "tags": ["cache"],
+        }
+        assert len(event) == len(event.to_dict())
+        assert not hasattr(event, "__dict__")
+        assert CacheMiss("models").key is None
+
+        with pytest.raises(TypeError):
+            CacheMiss("models", "bert", "too many")
+        with pytest.raises(TypeError):
+            CacheMiss(unknown=1)
+        with pytest.raises(TypeError):
+            CacheMiss("models", cache="models")
+
+    @staticmethod
+    def test_missing_fields() -> None:
+        # the template doesn't fit fields which are None, the message falls back to the fields
+        event: TimerFinished = TimerFinished()
+
+        assert event.message == "timer.finished: TimerFinished(duration=None, function=None, thread=None)"
+        assert event.to_dict()["message"] == event.message
+        assert json.loads(event.to_json())["duration"] is None
+
+    @staticmethod
+    def test_declaration_errors() -> None:
+        with pytest.raises(ValueError, match="no template id"):
+            type("NoTemplate", (Event,), {"__slots__": ()})
+        with pytest.raises(ValueError, match="already used"):
+            type("Duplicate", (Event,), {"__slots__": (), "template_id": "timer.finished"})
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "event",
+        [
+            CacheMiss("models", "bert"),
+            CacheMiss("models", "bert", context={"request_id": 7, "tags": ["overridden"]}),
+            TimerFinished(duration=0.25, function="predict", thread="MainThread"),
+            ExceptionRaised("ValueError", "bad input", "predict", "Traceback ...", "a1b2", 3),
+            GrpcRequest("/ondewo.nlu.Sessions/DetectIntent", "OK", 0.012, "DetectIntentRequest"),
+        ],
+    )
+    def test_encoding(event: Event) -> None:
+        # encoded directly, the result is the same as encoding the dict of the event
+        assert msgpack.unpackb(event.pack()) == event.to_dict()
+        assert msgpack.unpackb(event.pack(msgpack.Packer())) == event.to_dict()
+        assert json.loads(event.to_json()) == event.to_dict()
+
+    @staticmethod
+    def test_exception_keys() -> None:
+        event: ExceptionRaised = ExceptionRaised(exception_type="ValueError", exception_value="bad", function="f")
+
+        assert event.message.startswith("An exception 'ValueError' occurred, with message 'bad'.")
+        assert event.to_dict()["exception type"] == "ValueError"
+        assert event.to_dict()["tags"] == ["timing", "exception"]
+
+    @staticmethod
+    def test_json_not_serializable() -> None:
+        assert json.loads(CacheMiss("models", key=object).to_json())["key"] == str(object)
+
+
+class TestEventRecords:
+    @staticmethod
+    def test_console(log_store: MockLoggingHandler, logger: Logger) -> None:
+        logger.addHandler(log_store)
+        logger.warning(TimerFinished(1.5, "predict", "MainThread"))
+
+        assert eval(log_store.messages["warning"][0])["duration"] == 1.5
+        log_store.reset()
+
+    @staticmethod
+    def test_thread_context_filter(log_store: MockLoggingHandler, logger: Logger) -> None:
+        logger.addHandler(log_store)
+        event: CacheMiss = CacheMiss("models", "bert")
+        thread_context_filter: ThreadContextFilter = ThreadContextFilter(context_dict={"request_id": 7})
+
+        logger.addFilter(thread_context_filter)
+        logger.info(event)
+        logger.info(Lazy(CacheMiss, "models", "gpt"))
+        logger.removeFilter(thread_context_filter)
+
+        messages: List[Dict[str, Any]] = [eval(message) for message in log_store.messages["info"]]
+        assert [message["request_id"] for message in messages] == [7, 7]
+        assert messages[1]["key"] == "gpt"
+        # the logged event is not modified
+        assert event.context is None
+        log_store.reset()
+
+    @staticmethod
+    def test_fluent_formatter() -> None:
+        record: LogRecord = makeLogRecord({
+            "msg": GrpcRequest("/Sessions/DetectIntent", "OK", 0.5, context={"session": "s"}),
+            "levelno": logging.INFO,
+            "levelname": "INFO",
+        })
+        formatter: FluentRecordFormatter = FluentRecordFormatter(fmt={"level": "%(levelname)s"})
+
+        data: Dict[str, Any] = formatter.format(record)
+        assert data["level"] == "INFO"
+        assert data["message"] == "gRPC call '/Sessions/DetectIntent' finished with status OK in 0.5000 seconds."
+        assert data["template_id"] == "grpc.request"
+        assert data["code"] == "OK"
+        assert data["session"] == "s"
+
+    @staticmethod
+    def test_deduplication_by_template_id() -> None:
+        summaries: List[LogRecord] = []
+        deduplication_filter: DeduplicationFilter = DeduplicationFilter(window=60.0, burst=1, emit=summaries.append)
+
+        passed: List[bool] = [
+            deduplication_filter.filter(makeLogRecord({"msg": CacheMiss("models", key), "thread": get_ident()}))
+            for key in ["a", "b", "c"]
+        ]
+        assert passed == [True, False, False]
@@ -0,0 +1,130 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import logging
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+import pytest
+
+from ondewo.logging.events import GrpcRequest
+from ondewo.logging.files import (
+    JsonLinesFileHandler,
+    _zstd_available,
+)
+
+
+def read_lines(handler: JsonLinesFileHandler) -> List[Dict[str, Any]]:
+    """The records of the segments and the active file of a handler, from the oldest to the newest."""
+    lines: List[Dict[str, Any]] = []
+    for path in handler.segments() + [handler.filename]:
+        data: bytes = gzip.decompress(Path(path).read_bytes()) if path.endswith(".gz") else Path(path).read_bytes()
+        lines.extend(json.loads(line) for line in data.splitlines())
+    return lines
+
+
+class TestJsonLinesFileHandler:
+    @staticmethod
+    def test_json_lines(tmp_path: Path) -> None:
+        handler: JsonLinesFileHandler = JsonLinesFileHandler(str(tmp_path / "logs" / "service.jsonl"))
+
+        handler.handle(logging.makeLogRecord({
+            "msg": "hello %s", "args": ("world",), "created": 0.5, "name": "test", "levelname": "INFO",
+        }))
+        handler.handle(logging.makeLogRecord({"msg": {"message": "dict", "tags": ["test"], 1: "skipped"}}))
+        handler.handle(logging.makeLogRecord({"msg": GrpcRequest("/Echo", "OK", 0.25)}))
+        handler.close()
+
+        lines: List[Dict[str, Any]] = read_lines(handler)
+        assert lines[0] == {
+            "time": "1970-01-01T00:00:00.500000+00:00", "level": "INFO", "logger": "test", "message": "hello world",
+        }
+        assert lines[1]["tags"] == ["test"]
+        assert "1" not in lines[1]
+        assert (lines[2]["method"], lines[2]["duration"], lines[2]["tags"]) == ("/Echo", 0.25, ["grpc"])
+        # events are encoded directly, with the same result as their dict
+        assert lines[2] == {**lines[2], **GrpcRequest("/Echo", "OK", 0.25).to_dict()}
+        assert set(lines[2]) == {"time", "level", "logger", *GrpcRequest("/Echo", "OK", 0.25).to_dict()}
+        assert not handler.segments()
+
+    @staticmethod
+    def test_rotates_and_compresses(tmp_path: Path) -> None:
+        handler: JsonLinesFileHandler = JsonLinesFileHandler(str(tmp_path / "service.jsonl"), max_bytes=1000)
+
+        for i in range(100):
+            handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+        handler.close()
+
+        segments: List[str] = handler.segments()
+        assert len(segments) > 5
+        assert all(segment.endswith(".jsonl.gz") for segment in segments)
+        assert [line["message"] for line in read_lines(handler)] == [f"record {i}" for i in range(100)]
+        assert Path(handler.filename).stat().st_size <= 1000
+
+    @staticmethod
+    def test_rotates_by_time(tmp_path: Path) -> None:
+        handler: JsonLinesFileHandler = JsonLinesFileHandler(
+            str(tmp_path / "service.jsonl"), rotate_interval=3600, compression=None,
+        )
+        now: float = time.time()
+
+        handler.handle(logging.makeLogRecord({"msg": "first", "created": now}))
+        handler.handle(logging.makeLogRecord({"msg": "second", "created": now + 3600}))
+        handler.close()
+
+        assert len(handler.segments()) == 1
+        assert [line["message"] for line in read_lines(handler)] == ["first", "second"]
+
+    @staticmethod
+    def test_retention(tmp_path: Path) -> None:
+        handler: JsonLinesFileHandler = JsonLinesFileHandler(
+            str(tmp_path / "service.jsonl"), max_bytes=1000, compression=None, max_total_bytes=3000,
+        )
+
+        for i in range(100):
+            handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+        handler.close()
+
+        # the oldest segments were deleted, the newest records are kept
+        messages: List[str] = [line["message"] for line in read_lines(handler)]
+        assert messages[-1] == "record 99"
+        assert "record 0" not in messages
+        assert sum(Path(path).stat().st_size for path in handler.segments() + [handler.filename]) <= 3000
+
+    @staticmethod
+    def test_compresses_segments_of_earlier_processes(tmp_path: Path) -> None:
+        (tmp_path / "service.20240115T103000-000.jsonl").write_text('{"message": "left"}\n')
+        (tmp_path / "service.20240115T103000-001.jsonl.gz.tmp").write_text("incomplete")
+
+        handler: JsonLinesFileHandler = JsonLinesFileHandler(str(tmp_path / "service.jsonl"))
+        handler.close()
+
+        assert [Path(segment).name for segment in handler.segments()] == ["service.20240115T103000-000.jsonl.gz"]
+        assert [line["message"] for line in read_lines(handler)] == ["left"]
+        assert not (tmp_path / "service.20240115T103000-001.jsonl.gz.tmp").exists()
+
+    @staticmethod
+    def test_compression_options(tmp_path: Path) -> None:
+        with pytest.raises(ValueError):
+            JsonLinesFileHandler(str(tmp_path / "service.jsonl"), compression="bz2")
+        if not _zstd_available():
+            with pytest.raises(ValueError, match="zstandard"):
+                JsonLinesFileHandler(str(tmp_path / "service.jsonl"), compression="zstd")
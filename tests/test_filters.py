@@ -12,15 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from logging import Logger
+import logging
+import time
+from logging import (
+    Logger,
+    LogRecord,
+    makeLogRecord,
+)
+from threading import get_ident
 from typing import (
     Any,
+    Dict,
     List,
 )
 
 import pytest
 
-from ondewo.logging.filters import ThreadContextFilter
+from ondewo.logging.filters import (
+    BufferingContextFilter,
+    DeduplicationFilter,
+    RedactionFilter,
+    ThreadContextFilter,
+)
+from ondewo.logging.events import GrpcRequest
+from ondewo.logging.lazy import Lazy
 from tests.conftest import MockLoggingHandler
 
 
@@ -88,3 +103,236 @@ class TestFilters:
                 assert logged_message == message
 
         log_store.reset()
+
+    @staticmethod
+    def test_thread_context_filter_lazy_message(log_store: MockLoggingHandler, logger: Logger) -> None:
+        logger.addHandler(log_store)
+        thread_context_filter: ThreadContextFilter = ThreadContextFilter(context_dict={"ctx": 123})
+
+        logger.addFilter(thread_context_filter)
+        logger.info(Lazy(dict, message="hello"))
+        logger.info(Lazy(lambda: "hello"))
+        logger.removeFilter(thread_context_filter)
+
+        # the context is added when the lazy message is evaluated
+        assert eval(log_store.messages["info"][0]) == {"message": "hello", "ctx": 123}
+        assert log_store.messages["info"][1] == "hello"
+
+        log_store.reset()
+
+    @staticmethod
+    def test_deduplication_filter(log_store: MockLoggingHandler, logger: Logger) -> None:
+        logger.addHandler(log_store)
+        deduplication_filter: DeduplicationFilter = DeduplicationFilter(window=60.0, burst=3)
+        logger.addFilter(deduplication_filter)
+
+        for _ in range(10):
+            logger.error({"message": "downstream failed", "tags": ["exception"]})
+        logger.error("another message")
+
+        logger.removeFilter(deduplication_filter)
+        assert log_store.count_levels("error") == 4
+
+        deduplication_filter.flush()
+        assert log_store.count_levels("error") == 5
+        summary: Any = eval(log_store.messages["error"][-1])
+        assert summary["suppressed_count"] == 7
+        assert summary["tags"] == ["deduplication"]
+
+        log_store.reset()
+
+    @staticmethod
+    @pytest.mark.parametrize("key", ["message", "call_site"])
+    def test_deduplication_filter_window(key: str) -> None:
+        summaries: List[LogRecord] = []
+        deduplication_filter: DeduplicationFilter = DeduplicationFilter(
+            window=60.0, burst=2, key=key, emit=summaries.append,
+        )
+        start: float = time.time()
+
+        passed: List[bool] = [
+            deduplication_filter.filter(makeLogRecord({"msg": "storm", "created": start + i * 0.1}))
+            for i in range(5)
+        ]
+        assert passed == [True, True, False, False, False]
+        assert not summaries
+
+        # the first record after the window expired flushes the summary and passes
+        assert deduplication_filter.filter(makeLogRecord({"msg": "storm", "created": start + 61.5}))
+        assert len(summaries) == 1
+        assert summaries[0].msg["suppressed_count"] == 3
+        assert deduplication_filter.filter(summaries[0])
+        deduplication_filter.flush()
+
+    @staticmethod
+    def test_deduplication_filter_timer() -> None:
+        summaries: List[LogRecord] = []
+        deduplication_filter: DeduplicationFilter = DeduplicationFilter(
+            window=0.05, burst=1, emit=summaries.append,
+        )
+
+        for _ in range(3):
+            deduplication_filter.filter(makeLogRecord({"msg": "storm", "created": time.time()}))
+        assert not summaries
+
+        # the storm stopped, the summary is emitted when the window expired
+        deadline: float = time.monotonic() + 5
+        while not summaries and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [summary.msg["suppressed_count"] for summary in summaries] == [2]
+        time.sleep(0.1)
+        assert len(summaries) == 1
+        assert deduplication_filter._timer is None
+
+    @staticmethod
+    def test_deduplication_filter_max_keys() -> None:
+        summaries: List[LogRecord] = []
+        deduplication_filter: DeduplicationFilter = DeduplicationFilter(
+            window=60.0, burst=1, max_keys=2, emit=summaries.append,
+        )
+
+        for msg in ["a", "a", "b", "c"]:
+            deduplication_filter.filter(makeLogRecord({"msg": msg, "created": time.time()}))
+
+        # "a" was evicted together with its suppressed record
+        assert len(deduplication_filter._windows) == 2
+        assert [summary.msg["suppressed_count"] for summary in summaries] == [1]
+        deduplication_filter.flush()
+
+    @staticmethod
+    def test_buffering_context_filter() -> None:
+        flushed: List[LogRecord] = []
+        buffering_filter: BufferingContextFilter = BufferingContextFilter(
+            context_dict={"request": 1}, capacity=3, emit=flushed.append,
+        )
+
+        logging.getLogger("test.buffering").setLevel(logging.WARNING)
+
+        def record(level: int, msg: Any, name: str = "test.buffering") -> LogRecord:
+            return makeLogRecord(
+                {"msg": msg, "levelno": level, "name": name, "thread": get_ident(), "threadName": "main"},
+            )
+
+        assert not buffering_filter.filter(record(logging.DEBUG, {"message": "first"}))
+        assert buffering_filter.filter(record(logging.WARNING, {"message": "warning"}))
+        for i in range(4):
+            assert not buffering_filter.filter(record(logging.INFO, Lazy(lambda i=i: {"message": f"info {i}"})))
+        assert buffering_filter.filter(record(logging.ERROR, {"message": "error"}))
+
+        # the first buffered records were dropped, the rest are flushed with their context and resolved messages
+        assert [flushed_record.msg["message"] for flushed_record in flushed] == [
+            "Dropped the 2 oldest of the buffered records of this scope.", "info 1", "info 2", "info 3",
+        ]
+        assert all(flushed_record.msg["request"] == 1 for flushed_record in flushed[1:])
+        assert not buffering_filter.buffer
+
+        # records of other threads are not buffered
+        assert buffering_filter.filter(makeLogRecord({"msg": "other", "levelno": logging.DEBUG, "thread": 0}))
+
+        buffering_filter.filter(record(logging.DEBUG, {"message": "discarded"}))
+        buffering_filter.discard()
+        buffering_filter.flush()
+        assert len(flushed) == 4
+
+        # records which pass the level of their logger are not held back
+        logging.getLogger("test.buffering.info").setLevel(logging.INFO)
+        assert buffering_filter.filter(record(logging.INFO, {"message": "info"}, name="test.buffering.info"))
+        assert not buffering_filter.filter(record(logging.DEBUG, {"message": "debug"}, name="test.buffering.info"))
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "text, expected",
+        [
+            ("mail max.mustermann+tag@ondewo.com now", "mail <redacted email> now"),
+            ("call +43 664 1234567 or 0664 1234567", "call <redacted phone> or <redacted phone>"),
+            ("fax 0043-664-1234567, office 01/234 56 78", "fax <redacted phone>, office <redacted phone>"),
+            ("Authorization: Bearer abc.DEF-123_x==", "Authorization: <redacted token>"),
+            ("jwt eyJhbGciOi.eyJzdWIiOiIx.SflKxwRJ", "jwt <redacted token>"),
+            ("IBAN DE89 3704 0044 0532 0130 00, AT611904300234573201", "IBAN <redacted iban>, <redacted iban>"),
+            # no false positives on timestamps, durations, versions, ids and addresses
+            ("2024-01-15 10:30:00 took 0.0123 seconds", None),
+            ("version 1.2.3 of 127.0.0.1:8080 in thread 140259392375680", None),
+            # dates, durations, versions and short numbers are no phone numbers
+            ("expires 03/2024 ok, renewed 03/2024 12:00", None),
+            ("elapsed 01 2345, took 00:01:23.456 for 012 345 items", None),
+            ("release 0.9 2024 of build 01 234 56 and +1 2 3", None),
+        ],
+    )
+    def test_redaction_patterns(text: str, expected: Any) -> None:
+        redacted: str = RedactionFilter().redact(text)
+
+        if expected is None:
+            assert redacted is text
+        else:
+            assert redacted == expected
+
+    @staticmethod
+    def test_redaction_filter() -> None:
+        redaction_filter: RedactionFilter = RedactionFilter()
+        msg: Dict[str, Any] = {
+            "message": "Login of a@b.io",
+            "request": {"user": {"email": "a@b.io", "phones": ["+43 664 1234567"]}, "session": "s-1"},
+            "tags": ["login"],
+        }
+        record: LogRecord = makeLogRecord({"msg": msg, "args": ("c@d.io",)})
+
+        assert redaction_filter.filter(record)
+        assert record.msg == {
+            "message": "Login of <redacted email>",
+            "request": {"user": {"email": "<redacted email>", "phones": ["<redacted phone>"]}, "session": "s-1"},
+            "tags": ["login"],
+        }
+        assert record.args == ("<redacted email>",)
+        # the logged message is not modified, unchanged parts are not copied
+        assert msg["request"]["user"]["email"] == "a@b.io"
+        assert record.msg["tags"] is msg["tags"]
+
+        # a record is redacted once
+        record.msg = {"message": "a@b.io"}
+        assert redaction_filter.filter(record)
+        assert record.msg == {"message": "a@b.io"}
+
+        # events are copied with their redacted fields
+        event: GrpcRequest = GrpcRequest("/Users/Get", "OK", 0.1, context={"user": "a@b.io"})
+        assert redaction_filter.redact(event).context == {"user": "<redacted email>"}
+        unchanged: GrpcRequest = GrpcRequest("/Users/Get", "OK")
+        assert redaction_filter.redact(unchanged) is unchanged
+
+    @staticmethod
+    def test_redaction_filter_grpc(log_store: MockLoggingHandler, logger: Logger) -> None:
+        logger.addHandler(log_store)
+        redaction_filter: RedactionFilter = RedactionFilter(replacement="***")
+        logger.addFilter(redaction_filter)
+
+        logger.grpc(  # type: ignore
+            {"message": 'Got request (type <class \'User\'>): {"user": {"email": "a@b.io", "iban": "AT611904300234573201"}}'}
+        )
+        logger.removeFilter(redaction_filter)
+
+        # the lazy gRPC message is redacted after it was parsed and flattened
+        logged: Dict[str, Any] = eval(log_store.messages["grpc"][0])
+        assert logged["user|email"] == "***"
+        assert logged["user|iban"] == "***"
+        assert "a@b.io" not in logged["original"]
+        log_store.reset()
+
+    @staticmethod
+    def test_redaction_filter_custom_patterns() -> None:
+        patterns: Dict[str, str] = {"customer": r"C-\d{6}", "secret": r"secret=\w+"}
+
+        # by default matches start at the beginning of a word
+        assert RedactionFilter(patterns=patterns).redact("id:C-123456 xC-123456") == "id:<redacted customer> xC-123456"
+        assert RedactionFilter(patterns=patterns, boundary="").redact("xC-123456&secret=abc") == (
+            "x<redacted customer>&<redacted secret>"
+        )
+
+    @staticmethod
+    def test_redaction_filter_cache() -> None:
+        redaction_filter: RedactionFilter = RedactionFilter(cache_size=2, max_cached_length=20)
+
+        for text in ["a@b.io", "a@b.io", "c@d.io", "x" * 30]:
+            redaction_filter.redact(text)
+        assert redaction_filter._cache == {"a@b.io": "<redacted email>", "c@d.io": "<redacted email>"}
+
+        redaction_filter.redact("e@f.io")
+        assert redaction_filter._cache == {"e@f.io": "<redacted email>"}
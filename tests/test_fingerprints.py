@@ -0,0 +1,74 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import (
+    Any,
+    List,
+    Optional,
+    Tuple,
+)
+
+from ondewo.logging.fingerprints import ExceptionFingerprinter
+
+
+def raise_key_error(key: str) -> None:
+    {}[key]
+
+
+def raise_value_error(key: str) -> None:
+    raise ValueError(key)
+
+
+def catch(function: Any, *args: Any) -> BaseException:
+    try:
+        function(*args)
+    except Exception as exc:
+        return exc
+    raise AssertionError("no exception raised")
+
+
+class TestExceptionFingerprinter:
+    @staticmethod
+    def test_fingerprint() -> None:
+        first: BaseException = catch(raise_key_error, "a")
+        second: BaseException = catch(raise_key_error, "b")
+        other: BaseException = catch(raise_value_error, "a")
+
+        # the message does not matter, the type and the code locations do
+        assert ExceptionFingerprinter.fingerprint(type(first), first.__traceback__) == \
+            ExceptionFingerprinter.fingerprint(type(second), second.__traceback__)
+        assert ExceptionFingerprinter.fingerprint(type(first), first.__traceback__) != \
+            ExceptionFingerprinter.fingerprint(type(other), other.__traceback__)
+
+    @staticmethod
+    def test_observe() -> None:
+        fingerprinter: ExceptionFingerprinter = ExceptionFingerprinter(window=60.0)
+        results: List[Tuple[str, int, Optional[str]]] = []
+        for key in ["a", "b", "c"]:
+            exc: BaseException = catch(raise_key_error, key)
+            results.append(fingerprinter.observe(type(exc), exc, exc.__traceback__))
+
+        assert len({fingerprint for fingerprint, _, _ in results}) == 1
+        assert [count for _, count, _ in results] == [1, 2, 3]
+        assert results[0][2] is not None and "raise_key_error" in results[0][2]
+        assert results[1][2] is None and results[2][2] is None
+
+    @staticmethod
+    def test_observe_without_window() -> None:
+        fingerprinter: ExceptionFingerprinter = ExceptionFingerprinter(window=0.0)
+        for key in ["a", "b"]:
+            exc: BaseException = catch(raise_key_error, key)
+            _, count, trace = fingerprinter.observe(type(exc), exc, exc.__traceback__)
+            assert count == 1
+            assert trace is not None
@@ -0,0 +1,445 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import io
+import logging
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+)
+
+import pytest
+from fluent.handler import FluentRecordFormatter as _FluentRecordFormatter
+from fluent.sender import FluentSender
+
+from ondewo.logging.handlers import (
+    AsyncFluentHandler,
+    AsyncioFluentHandler,
+    BufferedFileHandler,
+    BufferedStreamHandler,
+    FluentHandler,
+    FluentRecordFormatter,
+)
+from ondewo.logging.senders import (
+    THREAD_BUFFER_SIZE,
+    LoopSender,
+    sender_pool,
+)
+from ondewo.logging.testing import ForwardReceiver
+
+
+@pytest.fixture(params=["tcp", "unix"])
+def fluentd(request: Any, tmp_path: Path) -> Iterator[ForwardReceiver]:
+    with ForwardReceiver(path=str(tmp_path / "fluent.sock") if request.param == "unix" else None) as receiver:
+        yield receiver
+
+
+class TestFluentRecordFormatter:
+    @staticmethod
+    @pytest.mark.parametrize(
+        "msg",
+        [
+            {"message": "hello", "tags": ["test"], 1: "not a string key"},
+            "hello",
+            '{"message": "json hello", "value": 1}',
+            "[1, 2]",
+            "{not json",
+            123,
+        ],
+    )
+    @pytest.mark.parametrize(
+        "fmt",
+        [
+            None,
+            {
+                "level": "%(levelname)s",
+                "where": "%(module)s.%(funcName)s",
+                "message": "%(message)s",
+                "time": "%(asctime)s.%(msecs)03d",
+            },
+        ],
+    )
+    def test_compatible_with_fluent(msg: Any, fmt: Any) -> None:
+        record: logging.LogRecord = logging.makeLogRecord({"msg": msg, "levelno": logging.INFO, "levelname": "INFO"})
+
+        data: Dict[str, Any] = FluentRecordFormatter(fmt=fmt, datefmt="%H:%M:%S").format(record)
+        expected: Dict[str, Any] = _FluentRecordFormatter(fmt=fmt, datefmt="%H:%M:%S").format(record)
+        assert data == expected
+
+    @staticmethod
+    def test_delegates_other_styles() -> None:
+        record: logging.LogRecord = logging.makeLogRecord({"msg": "hello"})
+        formatter: FluentRecordFormatter = FluentRecordFormatter(fmt={"name": "{name}"}, style="{")
+
+        assert formatter.format(record)["message"] == "hello"
+        assert isinstance(formatter, _FluentRecordFormatter)
+
+
+class TestFluentHandler:
+    @staticmethod
+    def test_handlers_share_connection(fluentd: ForwardReceiver) -> None:
+        handlers: List[FluentHandler] = [
+            AsyncFluentHandler(tag="test.async", host=fluentd.host, port=fluentd.port, queue_maxsize=1000),
+            AsyncFluentHandler(tag="test.other", host=fluentd.host, port=fluentd.port),
+            FluentHandler(tag="test.sync", host=fluentd.host, port=fluentd.port),
+        ]
+        for handler in handlers:
+            handler.setFormatter(FluentRecordFormatter())
+        assert len({id(handler.sender) for handler in handlers}) == 1
+
+        for i in range(100):
+            for handler in handlers:
+                handler.handle(logging.makeLogRecord({"msg": {"message": f"hello {i}"}, "created": 100.5}))
+        for handler in handlers:
+            handler.close()
+
+        assert fluentd.wait_for(300)
+        assert fluentd.connections == 1
+        assert (fluentd.host, fluentd.port) not in sender_pool
+        for tag in ["test.async", "test.other", "test.sync"]:
+            assert fluentd.messages(tag) == [f"hello {i}" for i in range(100)]
+        assert all(timestamp == 100 for _, timestamp, _ in fluentd.records)
+
+    @staticmethod
+    def test_settings_are_not_shared(fluentd: ForwardReceiver) -> None:
+        handlers: List[FluentHandler] = [
+            AsyncFluentHandler(tag="test.blocking", host=fluentd.host, port=fluentd.port),
+            AsyncFluentHandler(tag="test.circular", host=fluentd.host, port=fluentd.port, queue_circular=True),
+            FluentHandler(tag="test.precise", host=fluentd.host, port=fluentd.port, nanosecond_precision=True),
+            FluentHandler(tag="test.timeout", host=fluentd.host, port=fluentd.port, timeout=1),
+            FluentHandler(tag="test.same", host=fluentd.host, port=fluentd.port, timeout=1.0),
+        ]
+        try:
+            assert len({id(handler.sender) for handler in handlers}) == 4
+            assert handlers[3].sender is handlers[4].sender
+            assert handlers[1].sender.queue_circular and not handlers[0].sender.queue_circular
+            assert handlers[2].sender.nanosecond_precision
+        finally:
+            for handler in handlers:
+                handler.close()
+        assert (fluentd.host, fluentd.port) not in sender_pool
+
+    @staticmethod
+    def test_batched_writes(fluentd: ForwardReceiver) -> None:
+        handler: AsyncFluentHandler = AsyncFluentHandler(
+            tag="test", host=fluentd.host, port=fluentd.port, queue_maxsize=1000,
+        )
+        handler.setFormatter(FluentRecordFormatter())
+        # queue the records before the background thread is started
+        handler.sender._thread = threading.current_thread()
+        for i in range(500):
+            handler.handle(logging.makeLogRecord({"msg": {"message": f"hello {i}"}}))
+        handler.sender._thread = None
+        handler.sender._start()
+        handler.close()
+
+        assert fluentd.wait_for(500)
+        assert fluentd.reads < 10
+
+    @staticmethod
+    def test_release_keeps_shared_connection(fluentd: ForwardReceiver) -> None:
+        first: FluentHandler = FluentHandler(tag="first", host=fluentd.host, port=fluentd.port)
+        second: FluentHandler = FluentHandler(tag="second", host=fluentd.host, port=fluentd.port)
+        first.handle(logging.makeLogRecord({"msg": "first"}))
+        first.close()
+        first.close()
+        second.handle(logging.makeLogRecord({"msg": "second"}))
+        second.close()
+
+        assert fluentd.wait_for(2)
+        assert fluentd.connections == 1
+        assert (fluentd.host, fluentd.port) not in sender_pool
+
+    @staticmethod
+    def test_fluent_sender_internals() -> None:
+        # PooledSender.write relies on these internals of the pinned fluent-logger versions
+        sender: FluentSender = FluentSender(None)
+        assert callable(sender._send_internal)
+        assert (hasattr(sender, "lock"), sender._closed, sender.pendings) == (True, False, None)
+        sender.close()
+
+    @staticmethod
+    def test_thread_buffer_is_released(fluentd: ForwardReceiver) -> None:
+        handler: FluentHandler = FluentHandler(tag="test", host=fluentd.host, port=fluentd.port)
+        handler.handle(logging.makeLogRecord({"msg": {"message": "small"}}))
+        assert len(handler.sender._record_packer()._buffer) < 1000
+        handler.handle(logging.makeLogRecord({"msg": {"message": "x" * 2 * THREAD_BUFFER_SIZE}}))
+        assert len(handler.sender._record_packer()._buffer) == 0
+        handler.close()
+
+        assert fluentd.wait_for(2)
+
+    @staticmethod
+    def test_reconnect(fluentd: ForwardReceiver) -> None:
+        handler: FluentHandler = FluentHandler(tag="test", host=fluentd.host, port=fluentd.port)
+        handler.setFormatter(FluentRecordFormatter())
+        handler.handle(logging.makeLogRecord({"msg": "before"}))
+        assert fluentd.wait_for(1)
+        fluentd.disconnect()
+
+        # the sender notices the dropped connection, buffers the record and reconnects with the next one
+        handler.handle(logging.makeLogRecord({"msg": "dropped"}))
+        handler.handle(logging.makeLogRecord({"msg": "after"}))
+        handler.close()
+
+        assert fluentd.wait_for(3)
+        assert fluentd.messages() == ["before", "dropped", "after"]
+        assert fluentd.connections == 2
+
+    @staticmethod
+    def test_unix_endpoint_ignores_port(tmp_path: Path) -> None:
+        host: str = f"unix://{tmp_path / 'fluent.sock'}"
+        first: FluentHandler = FluentHandler(tag="first", host=host, port=24224)
+        second: FluentHandler = FluentHandler(tag="second", host=host, port=24225)
+        try:
+            assert first.sender is second.sender
+            assert first.sender.address == host
+        finally:
+            first.close()
+            second.close()
+        assert (host, 24224) not in sender_pool
+
+
+class TestAsyncioFluentHandler:
+    @staticmethod
+    def test_batches_records_of_the_loop(fluentd: ForwardReceiver) -> None:
+        handler: AsyncioFluentHandler = AsyncioFluentHandler(tag="test", host=fluentd.host, port=fluentd.port)
+        handler.setFormatter(FluentRecordFormatter())
+
+        async def log(first: int) -> None:
+            for i in range(first, first + 100):
+                handler.handle(logging.makeLogRecord({"msg": f"hello {i}"}))
+            await asyncio.sleep(0)
+            await asyncio.sleep(0.1)
+
+        async def main() -> None:
+            await asyncio.gather(log(0), log(100))
+            # records written before the connection was open are sent when it is, then each iteration is one write
+            await log(200)
+
+        asyncio.run(main())
+        assert fluentd.wait_for(300)
+        assert fluentd.reads <= 3
+        assert handler.sender._thread is None
+
+        # without a running loop the records take the threaded path
+        handler.handle(logging.makeLogRecord({"msg": "threaded"}))
+        handler.close()
+
+        assert fluentd.wait_for(301)
+        assert sorted(fluentd.messages()) == sorted([f"hello {i}" for i in range(300)] + ["threaded"])
+        assert fluentd.connections == 2
+
+    @staticmethod
+    def test_loop_path_takes_no_handler_lock(fluentd: ForwardReceiver) -> None:
+        handler: AsyncioFluentHandler = AsyncioFluentHandler(tag="test", host=fluentd.host, port=fluentd.port)
+        handler.setFormatter(FluentRecordFormatter())
+        locked: threading.Event = threading.Event()
+        unlock: threading.Event = threading.Event()
+
+        def hold_lock() -> None:
+            with handler.lock:  # type: ignore
+                locked.set()
+                unlock.wait(5)
+
+        async def log() -> None:
+            handler.handle(logging.makeLogRecord({"msg": "in the loop"}))
+            await asyncio.sleep(0.1)
+
+        holder: threading.Thread = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait(5)
+        try:
+            # a record of the loop is not held up by another thread holding the lock of the handler
+            logging_thread: threading.Thread = threading.Thread(target=asyncio.run, args=(log(),))
+            logging_thread.start()
+            logging_thread.join(5)
+            assert not logging_thread.is_alive()
+            assert fluentd.wait_for(1)
+        finally:
+            unlock.set()
+            holder.join()
+        handler.close()
+        assert fluentd.messages() == ["in the loop"]
+
+    @staticmethod
+    def test_buffers_until_connected() -> None:
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port: int = unused.getsockname()[1]
+        overflows: List[bytes] = []
+        handler: AsyncioFluentHandler = AsyncioFluentHandler(
+            tag="test", host="127.0.0.1", port=port, bufmax=1000, buffer_overflow_handler=overflows.append,
+        )
+        handler.setFormatter(FluentRecordFormatter())
+
+        async def main() -> None:
+            for i in range(50):
+                handler.handle(logging.makeLogRecord({"msg": f"hello {i}"}))
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.1)
+
+        asyncio.run(main())
+        loop_senders: List[Any] = list(handler.sender._loop_senders.values())
+        assert isinstance(loop_senders[0].last_error, OSError)
+        # the buffer of records is limited to bufmax bytes, the rest was handed to the overflow handler
+        assert overflows
+        assert all(len(overflow) > 1000 for overflow in overflows)
+        assert len(loop_senders[0]._pending) <= 1000
+        handler.close()
+
+    @staticmethod
+    def test_reconnects_without_new_records(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(LoopSender, "RECONNECT_DELAY", 0.05)
+        path: str = str(tmp_path / "fluent.sock")
+        handler: AsyncioFluentHandler = AsyncioFluentHandler(tag="test", host=f"unix://{path}")
+        handler.setFormatter(FluentRecordFormatter())
+
+        async def main() -> None:
+            handler.handle(logging.makeLogRecord({"msg": "before fluentd"}))
+            await asyncio.sleep(0.1)
+            with ForwardReceiver(path=path) as receiver:
+                # the next attempt connects and writes the buffered record, no further record is needed
+                for _ in range(100):
+                    if receiver.messages():
+                        break
+                    await asyncio.sleep(0.01)
+                assert receiver.messages() == ["before fluentd"]
+                handler.close()
+
+        asyncio.run(main())
+
+    @staticmethod
+    def test_hands_over_when_the_loop_stops(fluentd: ForwardReceiver) -> None:
+        handler: AsyncioFluentHandler = AsyncioFluentHandler(tag="test", host=fluentd.host, port=fluentd.port)
+        handler.setFormatter(FluentRecordFormatter())
+
+        async def main() -> None:
+            # the loop stops before the connection is open
+            handler.handle(logging.makeLogRecord({"msg": "last words"}))
+
+        asyncio.run(main())
+
+        assert fluentd.wait_for(1)
+        assert fluentd.messages() == ["last words"]
+        handler.close()
+
+
+class CountingStream(io.StringIO):
+    """StringIO counting its writes and flushes."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.writes: int = 0
+        self.flushes: int = 0
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        return super().write(text)
+
+    def flush(self) -> None:
+        self.flushes += 1
+        super().flush()
+
+
+class TestBufferedHandlers:
+    @staticmethod
+    def test_flush_thresholds() -> None:
+        stream: CountingStream = CountingStream()
+        handler: BufferedStreamHandler = BufferedStreamHandler(stream, capacity=100, flush_interval=60.0)
+
+        for i in range(3):
+            handler.handle(logging.makeLogRecord({"msg": f"info {i}", "levelno": logging.INFO}))
+        assert stream.getvalue() == ""
+
+        # a warning is written right away, together with the buffered lines
+        handler.handle(logging.makeLogRecord({"msg": "warning", "levelno": logging.WARNING}))
+        assert stream.getvalue() == "info 0\ninfo 1\ninfo 2\nwarning\n"
+        assert (stream.writes, stream.flushes) == (1, 1)
+
+        # the buffer is written when it reaches its capacity
+        for i in range(20):
+            handler.handle(logging.makeLogRecord({"msg": f"line {i:02}", "levelno": logging.DEBUG}))
+        assert stream.writes == 2
+        assert stream.getvalue().endswith("line 12\n")
+
+        handler.close()
+        assert stream.getvalue().endswith("line 19\n")
+        assert stream.writes == 3
+
+    @staticmethod
+    def test_flush_interval() -> None:
+        stream: CountingStream = CountingStream()
+        handler: BufferedStreamHandler = BufferedStreamHandler(stream, flush_interval=0.05)
+
+        handler.handle(logging.makeLogRecord({"msg": "first", "levelno": logging.INFO}))
+        handler.handle(logging.makeLogRecord({"msg": "second", "levelno": logging.INFO}))
+        deadline: float = time.monotonic() + 5
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert stream.getvalue() == "first\nsecond\n"
+        assert stream.writes == 1
+
+        # the same flusher thread writes the lines of the next interval
+        flusher: threading.Thread = handler._flusher
+        handler.handle(logging.makeLogRecord({"msg": "third", "levelno": logging.INFO}))
+        deadline = time.monotonic() + 5
+        while stream.writes < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.getvalue().endswith("third\n")
+        assert handler._flusher is flusher
+
+        handler.close()
+        flusher.join(5)
+        assert not flusher.is_alive()
+
+    @staticmethod
+    def test_flush_interval_error() -> None:
+        class FailingStream(io.StringIO):
+            def write(self, text: str) -> int:
+                raise OSError("disk full")
+
+        handler: BufferedStreamHandler = BufferedStreamHandler(FailingStream(), flush_interval=0.01)
+        errors: List[logging.LogRecord] = []
+        handler.handleError = errors.append  # type: ignore[method-assign]
+
+        handler.handle(logging.makeLogRecord({"msg": "lost", "levelno": logging.INFO}))
+        deadline: float = time.monotonic() + 5
+        while not errors and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # the error of the timed flush is reported and the flusher thread keeps running
+        assert len(errors) == 1
+        assert handler._flusher is not None and handler._flusher.is_alive()
+        handler.close()
+
+    @staticmethod
+    def test_file_handler(tmp_path: Path) -> None:
+        path: Path = tmp_path / "service.log"
+        handler: BufferedFileHandler = BufferedFileHandler(path, delay=True, flush_interval=60.0)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+        handler.handle(logging.makeLogRecord({"msg": "buffered", "levelno": logging.INFO, "levelname": "INFO"}))
+        assert not path.exists()
+        handler.close()
+
+        assert path.read_text() == "INFO buffered\n"
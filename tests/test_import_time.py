@@ -0,0 +1,75 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import (
+    Dict,
+    List,
+)
+
+import pytest
+import yaml
+
+# own import time of ondewo.logging.logger in microseconds, which is mostly reading and applying the default config:
+# 15-19 ms with the pure python yaml loader, 4-6 ms with the one of libyaml (measured on a development machine)
+CONFIG_TIME_BUDGET_US: int = int(os.getenv("ONDEWO_LOGGING_IMPORT_TIME_BUDGET_US", "10000"))
+
+# modules which are only needed once the corresponding feature is used, wrapt and uuid took 60-70 ms of the import of
+# ondewo.logging.decorators; fluent and msgpack are imported by the fluent handlers of the default config, so only the
+# import of the handlers module without a config defers them
+DEFERRED_MODULES: Dict[str, List[str]] = {
+    "ondewo.logging.logger": ["wrapt", "uuid", "dotenv"],
+    "ondewo.logging.decorators": ["wrapt", "uuid", "dotenv"],
+    "ondewo.logging.handlers": ["fluent", "msgpack"],
+}
+
+
+def import_times(module: str, cwd: Path, own: bool = False) -> Dict[str, int]:
+    """Import the module in a fresh interpreter and return the cumulative (or own) import times in microseconds."""
+    env: Dict[str, str] = {
+        **os.environ,
+        "MODULE_NAME": "test",
+        "GIT_REPO_NAME": "ondewo-logging-python",
+        "DOCKER_IMAGE_NAME": "test",
+        "PYTHONPATH": str(Path(__file__).parent.parent),
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)", line)
+        if match:
+            times[match.group(3)] = int(match.group(1 if own else 2))
+    return times
+
+
+@pytest.mark.parametrize("module", list(DEFERRED_MODULES))
+def test_deferred_imports(module: str, tmp_path: Path) -> None:
+    times: Dict[str, int] = import_times(module=module, cwd=tmp_path)
+
+    assert module in times
+    assert not [name for name in times if name.split(".")[0] in DEFERRED_MODULES[module]]
+
+
+@pytest.mark.skipif(not hasattr(yaml, "CSafeLoader"), reason="pyyaml was built without libyaml")
+def test_config_time(tmp_path: Path) -> None:
+    own_times: Dict[str, int] = import_times(module="ondewo.logging.logger", cwd=tmp_path, own=True)
+
+    assert own_times["ondewo.logging.logger"] < CONFIG_TIME_BUDGET_US
@@ -0,0 +1,283 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+import pytest
+
+from ondewo.logging.events import GrpcRequest
+from ondewo.logging.lazy import Lazy
+from ondewo.logging.logger import CustomLogger
+
+grpc = pytest.importorskip("grpc")
+wrappers_pb2 = pytest.importorskip("google.protobuf.wrappers_pb2")
+
+from ondewo.logging.interceptors import (  # noqa: E402
+    AsyncLoggingServerInterceptor,
+    LoggingClientInterceptor,
+    LoggingServerInterceptor,
+    async_logging_client_interceptors,
+)
+
+SERVICE: str = "test.Echo"
+StringValue: Any = wrappers_pb2.StringValue
+CODECS: Dict[str, Any] = {
+    "request_deserializer": StringValue.FromString,
+    "response_serializer": StringValue.SerializeToString,
+}
+STUB_CODECS: Dict[str, Any] = {
+    "request_serializer": StringValue.SerializeToString,
+    "response_deserializer": StringValue.FromString,
+}
+
+
+def echo(request: Any, context: Any) -> Any:
+    if request.value == "fail":
+        context.abort(grpc.StatusCode.INVALID_ARGUMENT, "fail")
+    return StringValue(value=request.value.upper())
+
+
+def repeat(request: Any, context: Any) -> Iterator[Any]:
+    for _ in range(3):
+        yield StringValue(value=request.value)
+
+
+def join(request_iterator: Iterator[Any], context: Any) -> Any:
+    return StringValue(value="".join(request.value for request in request_iterator))
+
+
+async def async_echo(request: Any, context: Any) -> Any:
+    if request.value == "fail":
+        await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "fail")
+    return StringValue(value=request.value.upper())
+
+
+async def async_repeat(request: Any, context: Any) -> AsyncIterator[Any]:
+    for _ in range(3):
+        yield StringValue(value=request.value)
+
+
+async def async_repeat_writes(request: Any, context: Any) -> None:
+    for _ in range(3):
+        await context.write(StringValue(value=request.value))
+
+
+async def async_join(request_iterator: AsyncIterator[Any], context: Any) -> Any:
+    return StringValue(value="".join([request.value async for request in request_iterator]))
+
+
+def handler(unary_unary: Callable, unary_stream: Callable, stream_unary: Callable) -> Any:
+    return grpc.method_handlers_generic_handler(
+        SERVICE,
+        {
+            "Echo": grpc.unary_unary_rpc_method_handler(unary_unary, **CODECS),
+            "Fail": grpc.unary_unary_rpc_method_handler(unary_unary, **CODECS),
+            "Repeat": grpc.unary_stream_rpc_method_handler(unary_stream, **CODECS),
+            "Join": grpc.stream_unary_rpc_method_handler(stream_unary, **CODECS),
+        },
+    )
+
+
+class EventStore(logging.Handler):
+    """Keeps the logged events by side and method."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.levels: List[int] = []
+        self.events: Dict[str, Dict[str, GrpcRequest]] = {"server": {}, "client": {}}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        event: GrpcRequest = record.msg  # type: ignore
+        self.levels.append(record.levelno)
+        self.events[event.side][event.method] = event
+
+    def count(self) -> int:
+        return len(self.events["server"]) + len(self.events["client"])
+
+
+@pytest.fixture
+def event_store(logger: Logger) -> Iterator[EventStore]:
+    store: EventStore = EventStore()
+    logger.addHandler(store)
+    yield store
+    logger.removeHandler(store)
+
+
+def resolved(payload: Any) -> Any:
+    """The rendered payload, which the console handler of the logger may already have resolved."""
+    return payload() if isinstance(payload, Lazy) else payload
+
+
+def assert_events(logged: Dict[str, GrpcRequest], streamed_responses: Optional[int]) -> None:
+    echoed: GrpcRequest = logged[f"/{SERVICE}/Echo"]
+    assert echoed.code == "OK"
+    assert echoed.request_type == echoed.response_type == "google.protobuf.StringValue"
+    assert echoed.request_size == echoed.response_size == 7
+    assert echoed.request_count is None
+    assert 0 < echoed.duration < 10
+    assert resolved(echoed.context["request"]) == "hello"
+    assert resolved(echoed.context["response"]) == "HELLO"
+
+    repeated: GrpcRequest = logged[f"/{SERVICE}/Repeat"]
+    assert repeated.code == "OK"
+    assert repeated.response_count == streamed_responses
+    assert "response" not in repeated.context
+
+    joined: GrpcRequest = logged[f"/{SERVICE}/Join"]
+    assert joined.request_count == 3
+    assert joined.request_size == 9
+    assert resolved(joined.context["response"]) == "abc"
+
+    failed: GrpcRequest = logged[f"/{SERVICE}/Fail"]
+    assert failed.code == "INVALID_ARGUMENT"
+    assert failed.response_type is None
+
+
+def wait_for(condition: Callable[[], bool]) -> None:
+    deadline: float = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestInterceptors:
+    @staticmethod
+    def test_interceptors(event_store: EventStore, logger: Logger) -> None:
+        server: Any = grpc.server(
+            ThreadPoolExecutor(max_workers=4),
+            interceptors=[LoggingServerInterceptor(logger=logger, payload_sample_rate=1.0)],
+        )
+        server.add_generic_rpc_handlers((handler(echo, repeat, join),))
+        port: int = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        try:
+            with grpc.intercept_channel(
+                grpc.insecure_channel(f"127.0.0.1:{port}"),
+                LoggingClientInterceptor(logger=logger, payload_sample_rate=1.0),
+            ) as channel:
+                echo_call: Any = channel.unary_unary(f"/{SERVICE}/Echo", **STUB_CODECS)
+                assert echo_call(StringValue(value="hello")).value == "HELLO"
+                repeat_call: Any = channel.unary_stream(f"/{SERVICE}/Repeat", **STUB_CODECS)
+                assert len(list(repeat_call(StringValue(value="x")))) == 3
+                join_call: Any = channel.stream_unary(f"/{SERVICE}/Join", **STUB_CODECS)
+                assert join_call(StringValue(value=value) for value in "abc").value == "abc"
+                with pytest.raises(grpc.RpcError):
+                    channel.unary_unary(f"/{SERVICE}/Fail", **STUB_CODECS)(StringValue(value="fail"))
+                wait_for(lambda: event_store.count() == 8)
+        finally:
+            server.stop(None)
+
+        assert_events(event_store.events["server"], streamed_responses=3)
+        assert_events(event_store.events["client"], streamed_responses=None)
+        assert set(event_store.levels) == {CustomLogger.GRPC_LEVEL_NUM}
+
+    @staticmethod
+    def test_async_interceptors(event_store: EventStore, logger: Logger) -> None:
+        async def run() -> None:
+            server: Any = grpc.aio.server(
+                interceptors=[AsyncLoggingServerInterceptor(logger=logger, payload_sample_rate=1.0)],
+            )
+            server.add_generic_rpc_handlers((handler(async_echo, async_repeat, async_join),))
+            port: int = server.add_insecure_port("127.0.0.1:0")
+            await server.start()
+            client_interceptors: List[Any] = async_logging_client_interceptors(logger=logger, payload_sample_rate=1.0)
+            try:
+                async with grpc.aio.insecure_channel(
+                    f"127.0.0.1:{port}", interceptors=client_interceptors,
+                ) as channel:
+                    echo_call: Any = channel.unary_unary(f"/{SERVICE}/Echo", **STUB_CODECS)
+                    assert (await echo_call(StringValue(value="hello"))).value == "HELLO"
+                    repeat_call: Any = channel.unary_stream(f"/{SERVICE}/Repeat", **STUB_CODECS)
+                    assert len([response async for response in repeat_call(StringValue(value="x"))]) == 3
+                    join_call: Any = channel.stream_unary(f"/{SERVICE}/Join", **STUB_CODECS)
+                    assert (await join_call(StringValue(value=value) for value in "abc")).value == "abc"
+                    with pytest.raises(grpc.aio.AioRpcError):
+                        await channel.unary_unary(f"/{SERVICE}/Fail", **STUB_CODECS)(StringValue(value="fail"))
+                    for _ in range(500):
+                        if event_store.count() == 8 and not any(interceptor._tasks for interceptor in client_interceptors):
+                            break
+                        await asyncio.sleep(0.01)
+            finally:
+                await server.stop(None)
+
+        asyncio.run(run())
+
+        assert_events(event_store.events["server"], streamed_responses=3)
+        assert_events(event_store.events["client"], streamed_responses=None)
+
+    @staticmethod
+    def test_async_stream_writes(event_store: EventStore, logger: Logger) -> None:
+        async def run() -> None:
+            server: Any = grpc.aio.server(interceptors=[AsyncLoggingServerInterceptor(logger=logger)])
+            server.add_generic_rpc_handlers((handler(async_echo, async_repeat_writes, async_join),))
+            port: int = server.add_insecure_port("127.0.0.1:0")
+            await server.start()
+            try:
+                async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                    repeat_call: Any = channel.unary_stream(f"/{SERVICE}/Repeat", **STUB_CODECS)
+                    assert len([response async for response in repeat_call(StringValue(value="xy"))]) == 3
+                    for _ in range(500):
+                        if event_store.count() == 1:
+                            break
+                        await asyncio.sleep(0.01)
+            finally:
+                await server.stop(None)
+
+        asyncio.run(run())
+
+        repeated: GrpcRequest = event_store.events["server"][f"/{SERVICE}/Repeat"]
+        assert repeated.code == "OK"
+        assert repeated.response_count == 3
+        assert repeated.response_size == 12
+        assert repeated.response_type == "google.protobuf.StringValue"
+
+    @staticmethod
+    def test_sampling_and_disabled_level(event_store: EventStore, logger: Logger) -> None:
+        interceptor: LoggingServerInterceptor = LoggingServerInterceptor(logger=logger)
+        method_handler: Any = grpc.unary_unary_rpc_method_handler(echo, **CODECS)
+        details: Any = type("Details", (), {"method": f"/{SERVICE}/Echo"})()
+        context: Any = type("Context", (), {"code": lambda self: None})()
+
+        # no payloads without sampling
+        wrapped: Any = interceptor.intercept_service(lambda _: method_handler, details)
+        assert wrapped.request_deserializer is method_handler.request_deserializer
+        assert wrapped.unary_unary(StringValue(value="hi"), context).value == "HI"
+        event: GrpcRequest = event_store.events["server"][f"/{SERVICE}/Echo"]
+        assert event.code == "OK"
+        assert event.context is None
+
+        # exceptions of the servicer are logged as UNKNOWN
+        with pytest.raises(AttributeError):
+            wrapped.unary_unary(None, context)
+        assert event_store.events["server"][f"/{SERVICE}/Echo"].code == "UNKNOWN"
+
+        # nothing is wrapped if the level is disabled
+        level: int = logger.level
+        logger.setLevel(CustomLogger.GRPC_LEVEL_NUM + 1)
+        try:
+            assert interceptor.intercept_service(lambda _: method_handler, details) is method_handler
+        finally:
+            logger.setLevel(level)
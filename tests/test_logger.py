@@ -14,15 +14,20 @@
 
 import json
 import logging
+import sys
+from pathlib import Path
 from typing import (
     Any,
     Dict,
+    List,
 )
 
 import pytest
 
+from ondewo.logging.lazy import Lazy
 from ondewo.logging.logger import (
     CustomLogger,
+    find_dotenv,
     flatten_json,
     logger,
     logger_console,
@@ -316,3 +321,60 @@ class TestLogger:
             _Resources.test_grpc_request["message"], {}
         )
         assert result == expected
+
+    @staticmethod
+    def test_grpc_disabled_is_not_evaluated(logger: logging.Logger, log_store: MockLoggingHandler) -> None:
+        logger.addHandler(log_store)
+        evaluated: List[bool] = []
+
+        def build_message() -> Dict[str, Any]:
+            evaluated.append(True)
+            return _Resources.test_grpc_request
+
+        logger.setLevel(logging.WARNING)
+        logger.grpc(Lazy(build_message))  # type: ignore
+        assert not evaluated
+        assert not log_store.count_levels("grpc")
+
+        logger.setLevel(logging.DEBUG)
+        logger.grpc(Lazy(build_message), max_level=3)  # type: ignore
+        assert evaluated
+        assert "'tags': ['test', 'grpc']}" in log_store.messages["grpc"][0]
+        log_store.reset()
+
+    @staticmethod
+    def test_lazy_message(logger: logging.Logger, log_store: MockLoggingHandler) -> None:
+        logger.addHandler(log_store)
+        evaluated: List[str] = []
+
+        def payload(name: str) -> str:
+            evaluated.append(name)
+            return name.upper()
+
+        logger.setLevel(logging.INFO)
+        logger.debug({"message": "lazy", "payload": Lazy(payload, "debug")})
+        logger.info({"message": "lazy", "payload": Lazy(payload, "info"), "type": KeyError})
+        logger.info(Lazy(lambda: "lazy string"))
+        # other callables are values, exceptions of the evaluation are not raised
+        logger.info({"message": "callables", "callback": payload, "function": len})
+        logger.info({"message": "failed", "payload": Lazy(len)})
+        logger.setLevel(logging.DEBUG)
+
+        assert evaluated == ["info"]
+        assert log_store.messages["info"][:2] == [
+            "{'message': 'lazy', 'payload': 'INFO', 'type': <class 'KeyError'>}",
+            "lazy string",
+        ]
+        assert "<built-in function len>" in log_store.messages["info"][2]
+        assert "could not evaluate len: TypeError(" in log_store.messages["info"][3]
+        log_store.reset()
+
+    @staticmethod
+    def test_find_dotenv_interactive(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        # interactive sessions search from the working directory upwards, like python-dotenv
+        monkeypatch.setattr(sys, "ps1", ">>> ", raising=False)
+        (tmp_path / ".env").write_text("TEST_DOTENV=1\n")
+        (tmp_path / "nested").mkdir()
+        monkeypatch.chdir(tmp_path / "nested")
+
+        assert find_dotenv() == str(tmp_path / ".env")
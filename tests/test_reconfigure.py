@@ -0,0 +1,167 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import logging.config
+import signal
+import time
+from copy import deepcopy
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+)
+
+import pytest
+
+from ondewo.logging.reconfigure import (
+    LevelController,
+    configurator,
+    get_handler,
+)
+
+
+@pytest.fixture(scope="function")
+def live_config() -> Iterator[Dict[str, Any]]:
+    assert configurator.config
+    original: Dict[str, Any] = deepcopy(configurator.config)
+    config: Dict[str, Any] = deepcopy(original)
+    config["handlers"]["reconfigure-test"] = {
+        "class": "logging.StreamHandler",
+        "level": "DEBUG",
+        "formatter": "brief",
+        "stream": "ext://sys.stdout",
+    }
+    config["loggers"]["reconfigure_test"] = {
+        "handlers": ["reconfigure-test"],
+        "level": "DEBUG",
+        "propagate": False,
+    }
+    configurator.configure(config)
+    yield config
+    configurator.configure(original)
+
+
+class TestIncrementalConfigurator:
+    @staticmethod
+    def test_unchanged_handlers_are_kept(live_config: Dict[str, Any]) -> None:
+        fluent_handler = get_handler("fluent-async-console")
+        test_handler = get_handler("reconfigure-test")
+        assert test_handler in logging.getLogger("reconfigure_test").handlers
+
+        live_config["handlers"]["reconfigure-test"]["level"] = "ERROR"
+        live_config["handlers"]["reconfigure-test"]["formatter"] = "default"
+        live_config["loggers"]["reconfigure_test"]["level"] = "INFO"
+        configurator.configure(live_config)
+
+        assert get_handler("fluent-async-console") is fluent_handler
+        assert get_handler("reconfigure-test") is test_handler
+        assert test_handler.level == logging.ERROR
+        assert "%(asctime)s" in test_handler.formatter._fmt  # type: ignore
+        assert logging.getLogger("reconfigure_test").level == logging.INFO
+
+    @staticmethod
+    def test_changed_handlers_are_replaced(live_config: Dict[str, Any]) -> None:
+        test_handler = get_handler("reconfigure-test")
+
+        live_config["handlers"]["reconfigure-test"]["stream"] = "ext://sys.stderr"
+        configurator.configure(live_config)
+
+        new_handler = get_handler("reconfigure-test")
+        assert new_handler is not test_handler
+        # pytest may attach its own capturing handler to the logger
+        handlers = logging.getLogger("reconfigure_test").handlers
+        assert new_handler in handlers and test_handler not in handlers
+
+        del live_config["loggers"]["reconfigure_test"]
+        del live_config["handlers"]["reconfigure-test"]
+        configurator.configure(live_config)
+
+        assert not [handler for handler in logging.getLogger("reconfigure_test").handlers if handler.name]
+
+    @staticmethod
+    def test_only_changed_formatters_are_created(live_config: Dict[str, Any]) -> None:
+        test_handler = get_handler("reconfigure-test")
+        assert test_handler is not None
+        formatter = test_handler.formatter
+
+        configurator.configure(live_config)
+        assert test_handler.formatter is formatter
+
+        live_config["formatters"]["brief"] = dict(live_config["formatters"]["brief"], datefmt="%H:%M")
+        configurator.configure(live_config)
+        assert get_handler("reconfigure-test") is test_handler
+        assert test_handler.formatter is not formatter
+        assert test_handler.formatter.datefmt == "%H:%M"  # type: ignore
+
+    @staticmethod
+    def test_external_dict_config_is_detected(live_config: Dict[str, Any]) -> None:
+        assert not configurator.is_stale()
+
+        # a direct dictConfig closes and replaces the handlers the configurator knows
+        logging.config.dictConfig(deepcopy(live_config))
+        assert configurator.is_stale()
+
+        configurator.configure(live_config)
+        assert not configurator.is_stale()
+        assert get_handler("reconfigure-test") in logging.getLogger("reconfigure_test").handlers
+
+
+class TestLevelController:
+    @staticmethod
+    def test_set_level_for_duration() -> None:
+        level_controller: LevelController = LevelController()
+        logger: logging.Logger = logging.getLogger("level_controller_test")
+        logger.setLevel(logging.WARNING)
+
+        level_controller.set_level("level_controller_test", "DEBUG", duration=0.05)
+        assert logger.level == logging.DEBUG
+        time.sleep(0.2)
+        assert logger.level == logging.WARNING
+
+    @staticmethod
+    def test_level_file(tmp_path: Path) -> None:
+        level_controller: LevelController = LevelController()
+        logger: logging.Logger = logging.getLogger("level_controller_test")
+        logger.setLevel(logging.WARNING)
+        level_file: Path = tmp_path / "levels.yaml"
+
+        level_file.write_text("level_controller_test: grpc\n")
+        level_controller.load_file(str(level_file))
+        assert logger.level == 25
+
+        level_file.write_text("{}\n")
+        level_controller.load_file(str(level_file))
+        assert logger.level == logging.WARNING
+
+        with pytest.raises(ValueError):
+            level_controller.set_level("level_controller_test", "LOUD")
+
+    @staticmethod
+    def test_signal_handler(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        level_controller: LevelController = LevelController()
+        installed: Dict[int, Any] = {}
+        monkeypatch.setattr(signal, "signal", lambda signum, handler: installed.update({signum: handler}))
+
+        if hasattr(signal, "SIGUSR1"):
+            level_controller.install_signal_handler(str(tmp_path / "levels.yaml"))
+            assert list(installed) == [signal.SIGUSR1]
+
+        # without SIGUSR1 (e.g. on Windows) no other signal such as SIGTERM is taken over silently
+        monkeypatch.delattr(signal, "SIGUSR1", raising=False)
+        installed.clear()
+        with pytest.raises(ValueError, match="SIGUSR1"):
+            level_controller.install_signal_handler(str(tmp_path / "levels.yaml"))
+        assert not installed
@@ -0,0 +1,127 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import threading
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+)
+
+import pytest
+from fluent.handler import FluentRecordFormatter
+
+from ondewo.logging.filters import ThreadContextFilter
+from ondewo.logging.records import (
+    CompactLogRecord,
+    RecordView,
+    install_record_factory,
+    uninstall_record_factory,
+)
+from tests.conftest import MockLoggingHandler
+
+
+@pytest.fixture(scope="function")
+def compact_records() -> Iterator[None]:
+    install_record_factory()
+    yield
+    uninstall_record_factory()
+
+
+def make_records(msg: Any) -> Dict[str, Any]:
+    record_args: Dict[str, Any] = {
+        "name": "console", "level": logging.INFO, "pathname": "/app/ondewo/module.py", "lineno": 42,
+        "msg": msg, "args": (), "exc_info": None, "func": "function",
+    }
+    compact: CompactLogRecord = CompactLogRecord(**record_args)
+    default: logging.LogRecord = logging.LogRecord(**record_args)
+    default.created, default.msecs = compact.created, compact.msecs
+    return {"compact": compact, "default": default}
+
+
+class TestCompactLogRecord:
+    @staticmethod
+    def test_lazy_attributes() -> None:
+        record: CompactLogRecord = make_records("hello")["compact"]
+
+        assert not hasattr(CompactLogRecord, "__weakref__")
+        assert isinstance(record.__dict__, RecordView)
+        assert record._filename is None and record._module is None
+
+        assert record.module == "module"
+        assert record.filename == "module.py"
+        assert record.threadName == "MainThread"
+        assert record.processName == "MainProcess"
+        assert record.relativeCreated > 0
+
+    @staticmethod
+    def test_names_are_taken_on_creation() -> None:
+        records: List[CompactLogRecord] = []
+
+        async def log() -> None:
+            records.append(make_records("in a task")["compact"])
+
+        thread: threading.Thread = threading.Thread(target=asyncio.run, args=(log(),), name="worker")
+        thread.start()
+        thread.join()
+
+        # the record is formatted in another thread, after its thread and task ended
+        assert records[0].threadName == "worker"
+        assert records[0].taskName is not None and records[0].taskName.startswith("Task-")
+        assert records[0].thread != threading.get_ident()
+        assert make_records("outside of a task")["compact"].taskName is None
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "formatter",
+        [
+            logging.Formatter("%(asctime)s.%(msecs)03d %(pathname)s:%(funcName)s():%(lineno)d "
+                              "- [%(processName)s|%(threadName)s] - %(levelname)s - %(message)s"),
+            logging.Formatter("{asctime} {module} {message}", style="{"),
+        ],
+    )
+    def test_formatters(formatter: logging.Formatter) -> None:
+        records: Dict[str, Any] = make_records("hello")
+        assert formatter.format(records["compact"]) == formatter.format(records["default"])
+
+    @staticmethod
+    def test_fluent_formatter() -> None:
+        records: Dict[str, Any] = make_records({"message": "hello", "tags": ["test"]})
+        formatter: FluentRecordFormatter = FluentRecordFormatter(
+            fmt={
+                "level": "%(levelname)s",
+                "where": "%(module)s.%(funcName)s",
+                "thread": "%(threadName)s:%(thread)d",
+                "message": "%(message)s",
+            }
+        )
+        assert formatter.format(records["compact"]) == formatter.format(records["default"])
+
+    @staticmethod
+    def test_logger(compact_records: None, logger: logging.Logger, log_store: MockLoggingHandler) -> None:
+        logger.addHandler(log_store)
+        records: List[Any] = []
+        logger.addFilter(ThreadContextFilter(context_dict={"ctx": 123}))
+        logger.addFilter(lambda record: records.append(record) or True)
+
+        logger.info({"message": "hello"}, extra={"request_id": "abc"})
+
+        logger.filters.clear()
+        assert isinstance(records[0], CompactLogRecord)
+        assert records[0].request_id == "abc"
+        assert eval(log_store.messages["info"][0]) == {"message": "hello", "ctx": 123}
+        log_store.reset()
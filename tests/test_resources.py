@@ -0,0 +1,67 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+from ondewo.logging.resources import (
+    ResourceUsage,
+    gc_monitor,
+)
+
+
+class TestGCMonitor:
+    @staticmethod
+    def test_measures_collections() -> None:
+        gc_monitor.enable()
+        collections: int = gc_monitor.collections
+        total: float = gc_monitor.total
+        gc.collect()
+
+        assert gc_monitor.collections == collections + 1
+        assert gc_monitor.total > total
+
+    @staticmethod
+    def test_enable_once() -> None:
+        gc_monitor.enable()
+        gc_monitor.enable()
+        assert gc.callbacks.count(gc_monitor._callback) == 1
+
+
+class TestResourceUsage:
+    @staticmethod
+    def test_accumulates_sections() -> None:
+        usage: ResourceUsage = ResourceUsage(cpu_time=True, gc_time=True, allocations=True)
+        kept: List[Any] = []
+        for _ in range(2):
+            snapshot: Any = usage.start()
+            gc.collect()
+            kept.extend(object() for _ in range(500))
+            usage.stop(snapshot)
+
+        fields: Dict[str, Any] = usage.fields()
+        assert fields["gc collections"] == 2
+        assert fields["allocated blocks"] >= 900
+        assert fields["cpu time"] > 0
+        assert fields["gc time"] > 0
+
+    @staticmethod
+    def test_opt_in() -> None:
+        usage: ResourceUsage = ResourceUsage()
+        usage.stop(usage.start())
+        assert usage.fields() == {}
@@ -0,0 +1,176 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import logging
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+)
+
+import pytest
+
+from ondewo.logging.events import TimerFinished
+from ondewo.logging.reconfigure import (
+    configurator,
+    get_handler,
+)
+from ondewo.logging.routing import (
+    Route,
+    RoutingHandler,
+)
+
+
+class Sink(logging.Handler):
+    """Named handler keeping the messages it handled."""
+
+    def __init__(self, name: str, level: int = logging.NOTSET) -> None:
+        super().__init__(level)
+        self.name = name
+        self.messages: List[Any] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.msg)
+
+
+@pytest.fixture
+def sinks() -> Iterator[Dict[str, Sink]]:
+    handlers: Dict[str, Sink] = {name: Sink(f"test-routing-{name}") for name in ("stdout", "index", "debug")}
+    handlers["index"].setLevel(logging.INFO)
+    yield handlers
+    for handler in handlers.values():
+        handler.close()
+
+
+def router(**kwargs: Any) -> RoutingHandler:
+    return RoutingHandler(
+        routes=[
+            {"level": "WARNING", "targets": ["test-routing-index"]},
+            {"tags": ["timing", "exception"], "targets": ["test-routing-index"]},
+            {"loggers": ["service"], "targets": ["test-routing-stdout", "test-routing-index"], "final": True},
+            Route(targets=["test-routing-debug"]),
+        ],
+        **kwargs,
+    )
+
+
+def record(name: str, level: int, msg: Any) -> logging.LogRecord:
+    return logging.makeLogRecord({"name": name, "levelno": level, "msg": msg})
+
+
+class TestRoutingHandler:
+    @staticmethod
+    def test_routes(sinks: Dict[str, Sink]) -> None:
+        routing_handler: RoutingHandler = router()
+
+        records: List[Tuple[str, int, Any]] = [
+            ("service", logging.DEBUG, "plain"),
+            ("service.grpc", logging.ERROR, "error"),
+            ("service", logging.INFO, {"message": "timed", "tags": ["timing"]}),
+            ("services", logging.INFO, "other logger"),
+            ("library", logging.WARNING, "library warning"),
+            ("library", logging.DEBUG, TimerFinished(0.1, "f", "main")),
+        ]
+        for name, level, msg in records:
+            routing_handler.handle(record(name, level, msg))
+
+        # each record reaches each selected handler once, also if several routes select the handler
+        assert sinks["stdout"].messages == ["plain", "error", {"message": "timed", "tags": ["timing"]}]
+        # the level of a target applies, the debug timer event is dropped by it
+        assert sinks["index"].messages == ["error", {"message": "timed", "tags": ["timing"]}, "library warning"]
+        # the final route of the service logger ends the evaluation
+        assert sinks["debug"].messages[:2] == ["other logger", "library warning"]
+        assert isinstance(sinks["debug"].messages[2], TimerFinished)
+
+    @staticmethod
+    def test_lookup_table(sinks: Dict[str, Sink]) -> None:
+        routing_handler: RoutingHandler = router(max_routes=2)
+
+        # only the routed tags are part of the key
+        for tags in (["timing", "other"], ["timing"]):
+            routing_handler.handle(record("service", logging.INFO, {"message": "timed", "tags": tags}))
+        assert list(routing_handler._table) == [("service", logging.INFO, ("timing",))]
+        assert routing_handler.routed_tags == {"timing", "exception"}
+
+        # the table is emptied when it is full
+        routing_handler.handle(record("library", logging.INFO, "first"))
+        routing_handler.handle(record("library", logging.ERROR, "second"))
+        assert list(routing_handler._table) == [("library", logging.ERROR, ())]
+
+        # and when the config was changed, since the targets may have been replaced
+        replaced: Sink = Sink("test-routing-index")
+        configurator.generation += 1
+        try:
+            routing_handler.handle(record("library", logging.ERROR, "third"))
+        finally:
+            replaced.close()
+        assert replaced.messages == ["third"]
+        assert sinks["index"].messages[-1] == "second"
+
+    @staticmethod
+    def test_targets_are_kept_alive() -> None:
+        # a target which is attached to no logger is only referenced by the router
+        sink: Sink = Sink("test-routing-unattached")
+        messages: List[Any] = sink.messages
+        routing_handler: RoutingHandler = RoutingHandler(routes=[{"targets": ["test-routing-unattached"]}])
+        del sink
+        gc.collect()
+
+        routing_handler.handle(record("library", logging.INFO, "kept"))
+        assert messages == ["kept"]
+        routing_handler._handlers["test-routing-unattached"].close()
+
+    @staticmethod
+    def test_unknown_target() -> None:
+        with pytest.raises(ValueError, match="test-routing-missing"):
+            RoutingHandler(routes=[{"targets": ["test-routing-missing"]}])
+
+    @staticmethod
+    def test_errors(sinks: Dict[str, Sink]) -> None:
+        routing_handler: RoutingHandler = router()
+        errors: List[logging.LogRecord] = []
+        routing_handler.handleError = errors.append  # type: ignore
+
+        # tags which are no strings are not routed on
+        routing_handler.handle(record("service", logging.INFO, {"message": "odd tags", "tags": [["timing"], 1]}))
+        assert sinks["stdout"].messages == [{"message": "odd tags", "tags": [["timing"], 1]}]
+        assert not errors
+
+        # a failing target is reported with handleError, the other targets still get the record
+        def fail(failed: logging.LogRecord) -> None:
+            raise ValueError("sink is down")
+
+        sinks["index"].emit = fail  # type: ignore
+        routing_handler.handle(record("service", logging.ERROR, "failed"))
+        assert [error.msg for error in errors] == ["failed"]
+        assert sinks["stdout"].messages[-1] == "failed"
+
+
+def test_default_config_routes() -> None:
+    routing_handler: Any = get_handler("router")
+    assert isinstance(routing_handler, RoutingHandler)
+    assert routing_handler in logging.getLogger().handlers
+
+    def targets(name: str, level: int, msg: Any) -> List[str]:
+        return [handler.name for handler in routing_handler.targets(record(name, level, msg))]  # type: ignore
+
+    # every record reaches the same handlers as with handlers on the loggers, but each of them once
+    fluent: List[str] = ["fluent-async-console", "fluent-async-debug", "fluent-async-elastic"]
+    assert targets("console", logging.INFO, "hello") == ["console"] + fluent
+    assert targets("debug", logging.DEBUG, {"message": "timed", "tags": ["timing"]}) == ["debug"] + fluent
+    assert targets("root", logging.INFO, "hello") == fluent
+    assert targets("library", logging.ERROR, "failed") == fluent
@@ -0,0 +1,65 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+from collections import Counter
+from typing import Optional
+
+from ondewo.logging.sampling import (
+    StackSampler,
+    StackWatch,
+)
+
+
+def busy(seconds: float) -> None:
+    start: float = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        pass
+
+
+def outer(seconds: float) -> None:
+    busy(seconds)
+
+
+class TestStackSampler:
+    @staticmethod
+    def test_samples_slow_call() -> None:
+        sampler: StackSampler = StackSampler(interval=0.001)
+        watch: StackWatch = sampler.watch(0.01, root=sys._getframe())
+        outer(0.05)
+        stacks: Optional["Counter[str]"] = sampler.unwatch(watch)
+
+        assert stacks is not None
+        assert stacks.most_common(1)[0][0] == "tests.test_sampling:outer;tests.test_sampling:busy"
+        assert sum(stacks.values()) >= 5
+
+    @staticmethod
+    def test_fast_call_is_not_sampled() -> None:
+        sampler: StackSampler = StackSampler(interval=0.001)
+        for _ in range(100):
+            watch: StackWatch = sampler.watch(0.05)
+            outer(0.0)
+            assert sampler.unwatch(watch) is None
+        assert sampler._watches == {}
+
+    @staticmethod
+    def test_max_depth() -> None:
+        sampler: StackSampler = StackSampler(interval=0.001, max_depth=1)
+        watch: StackWatch = sampler.watch(0.0)
+        busy(0.02)
+        stacks: Optional["Counter[str]"] = sampler.unwatch(watch)
+
+        assert stacks is not None
+        assert all(";" not in stack for stack in stacks)
@@ -0,0 +1,90 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+from typing import Any
+
+import pytest
+
+from ondewo.logging.summarizers import (
+    SummarizerRegistry,
+    summarizers,
+)
+
+
+class Payload:
+    def __init__(self, size: int) -> None:
+        self.size: int = size
+
+    def __str__(self) -> str:
+        raise AssertionError("str() of a summarized value")
+
+
+class LargePayload(Payload):
+    pass
+
+
+class TestSummarizers:
+    @staticmethod
+    def test_bytes() -> None:
+        payload: bytes = b"x" * 1000
+
+        assert summarizers.summarize(b"short") == "b'short'"
+        assert summarizers.summarize(payload) == f"bytes(length=1000, sha256={hashlib.sha256(payload).hexdigest()[:12]})"
+        assert summarizers.summarize(bytearray(payload)).startswith("bytearray(length=1000, sha256=")
+
+    @staticmethod
+    def test_register() -> None:
+        registry: SummarizerRegistry = SummarizerRegistry()
+        assert registry.summarize(12345, max_length=3) == "123<TRUNCATED!>"
+
+        # subclasses use the summarizer of their closest registered base class
+        registry.register(Payload, lambda value: f"Payload(size={value.size})")
+        assert registry.summarize(LargePayload(5)) == "Payload(size=5)"
+        registry.register(f"{__name__}.LargePayload", lambda value: "large")
+        assert registry.summarize(LargePayload(5)) == "large"
+
+        registry.unregister(f"{__name__}.LargePayload")
+        assert registry.summarize(LargePayload(5)) == "Payload(size=5)"
+
+    @staticmethod
+    def test_failing_summarizer() -> None:
+        registry: SummarizerRegistry = SummarizerRegistry()
+        registry.register(Payload, lambda value: value.missing)
+
+        assert registry.summarize(Payload(1)).startswith("Payload(<summary failed: AttributeError(")
+
+    @staticmethod
+    def test_numpy() -> None:
+        numpy: Any = pytest.importorskip("numpy")
+
+        array: Any = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)
+        assert summarizers.summarize(array) == "ndarray(shape=(3, 4), dtype=float32, min=0, max=11, mean=5.5)"
+        assert summarizers.summarize(array.astype(str)).endswith("dtype=<U32)")
+
+    @staticmethod
+    def test_pandas() -> None:
+        pandas: Any = pytest.importorskip("pandas")
+
+        frame: Any = pandas.DataFrame({"a": [1, 2], "b": [3, 4]})
+        assert summarizers.summarize(frame) == "DataFrame(shape=(2, 2), columns=[a, b])"
+        assert summarizers.summarize(frame["a"]) == "Series(name='a', length=2, dtype=int64)"
+
+    @staticmethod
+    def test_protobuf() -> None:
+        struct_pb2: Any = pytest.importorskip("google.protobuf.struct_pb2")
+
+        message: Any = struct_pb2.Struct()
+        message.update({"key": "value"})
+        assert summarizers.summarize(message) == f"google.protobuf.Struct(size={message.ByteSize()})"
@@ -0,0 +1,145 @@
+# Copyright 2021-2024 ONDEWO GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import logging
+import socket
+import time
+from typing import (
+    Any,
+    Iterator,
+    List,
+)
+
+import msgpack
+import pytest
+from fluent.sender import EventTime
+
+from ondewo.logging.handlers import (
+    AsyncFluentHandler,
+    FluentHandler,
+    FluentRecordFormatter,
+)
+from ondewo.logging.testing import (
+    COMPRESSED_PACKED_FORWARD,
+    FORWARD,
+    MESSAGE,
+    PACKED_FORWARD,
+    ForwardReceiver,
+)
+
+
+@pytest.fixture
+def receiver() -> Iterator[ForwardReceiver]:
+    with ForwardReceiver() as forward_receiver:
+        yield forward_receiver
+
+
+def connect(receiver: ForwardReceiver) -> socket.socket:
+    client: socket.socket = socket.create_connection((receiver.host, receiver.port), timeout=5)
+    return client
+
+
+class TestForwardReceiver:
+    @staticmethod
+    def test_modes(receiver: ForwardReceiver) -> None:
+        events: List[Any] = [[100, {"message": "packed 1"}], [EventTime(100.5), {"message": "packed 2"}]]
+        stream: bytes = b"".join(msgpack.packb(event) for event in events)
+        with connect(receiver) as client:
+            client.sendall(msgpack.packb(["tag.message", 100, {"message": "message"}]))
+            client.sendall(msgpack.packb(["tag.forward", [[100, {"message": "forward 1"}], [101, {"message": "forward 2"}]]]))
+            client.sendall(msgpack.packb(["tag.packed", stream]))
+            client.sendall(msgpack.packb(["tag.compressed", gzip.compress(stream), {"compressed": "gzip"}]))
+            assert receiver.wait_for(7)
+
+        assert receiver.modes == {MESSAGE: 1, FORWARD: 1, PACKED_FORWARD: 1, COMPRESSED_PACKED_FORWARD: 1}
+        assert receiver.messages() == [
+            "message", "forward 1", "forward 2", "packed 1", "packed 2", "packed 1", "packed 2",
+        ]
+        assert receiver.messages("tag.forward") == ["forward 1", "forward 2"]
+        assert receiver.records[4][1] == 100.5
+
+    @staticmethod
+    def test_ack(receiver: ForwardReceiver) -> None:
+        with connect(receiver) as client:
+            client.sendall(msgpack.packb(["tag", [[100, {"message": "hello"}]], {"chunk": "abc", "size": 1}]))
+            response: Any = msgpack.unpackb(client.recv(1024))
+
+        assert response == {"ack": "abc"}
+        assert receiver.stats()["acks"] == 1
+
+    @staticmethod
+    def test_disconnect_every() -> None:
+        with ForwardReceiver(disconnect_every=10) as receiver:
+            handler: FluentHandler = FluentHandler(tag="test", host=receiver.host, port=receiver.port)
+            handler.setFormatter(FluentRecordFormatter())
+            for i in range(25):
+                handler.handle(logging.makeLogRecord({"msg": f"hello {i}"}))
+                # give the receiver the time to drop the connection, so the sender notices it
+                time.sleep(0.005)
+            handler.close()
+
+            assert receiver.wait_for(20)
+            assert receiver.disconnects >= 2
+            assert receiver.connections == receiver.disconnects + 1
+
+    @staticmethod
+    def test_back_pressure(receiver: ForwardReceiver) -> None:
+        handler: AsyncFluentHandler = AsyncFluentHandler(
+            tag="test", host=receiver.host, port=receiver.port, queue_maxsize=10, queue_circular=True,
+        )
+        handler.setFormatter(FluentRecordFormatter())
+        receiver.pause()
+        payload: str = "x" * 10000
+        for _ in range(2000):
+            handler.handle(logging.makeLogRecord({"msg": payload}))
+        # the records queued while the connection was blocked were partly discarded
+        assert receiver.record_count == 0
+        receiver.resume()
+        handler.close()
+
+        assert receiver.wait_for(1)
+        assert receiver.record_count < 2000
+
+    @staticmethod
+    def test_latency() -> None:
+        with ForwardReceiver(latency=0.05) as receiver:
+            start: float = time.perf_counter()
+            with connect(receiver) as client:
+                client.sendall(msgpack.packb(["tag", 100, {"message": "slow"}]))
+                assert receiver.wait_for(1)
+            assert time.perf_counter() - start >= 0.05
+
+    @staticmethod
+    def test_unix_socket(tmp_path: Any) -> None:
+        path: str = str(tmp_path / "fluent.sock")
+        with ForwardReceiver(path=path) as receiver:
+            assert receiver.host == f"unix://{path}"
+            handler: AsyncFluentHandler = AsyncFluentHandler(tag="test", host=receiver.host)
+            handler.setFormatter(FluentRecordFormatter())
+            handler.handle(logging.makeLogRecord({"msg": "hello"}))
+            handler.close()
+
+            assert receiver.wait_for(1)
+            assert receiver.messages() == ["hello"]
+        assert not (tmp_path / "fluent.sock").exists()
+
+    @staticmethod
+    def test_keep_records() -> None:
+        with ForwardReceiver(keep_records=False) as receiver:
+            with connect(receiver) as client:
+                client.sendall(msgpack.packb(["tag", 100, {"message": "counted"}]))
+                assert receiver.wait_for(1)
+            assert receiver.records == []
+            assert receiver.record_count == 1